@@ -1,149 +1,234 @@
-from flask import Flask, request, jsonify, send_file, g
-from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
+from flask import request, jsonify, send_file, g, Response, stream_with_context
 from datetime import datetime, timedelta
-import os, pandas as pd, tempfile, secrets, ast
-from urllib.parse import quote_plus
-from sqlalchemy import inspect, text
-from werkzeug.security import generate_password_hash, check_password_hash
-
-# ---------------- CONFIG ----------------
-DB_USER = os.environ.get("DB_USER", "root")
-DB_PASS = os.environ.get("DB_PASS", "Rash@2004")
-DB_HOST = os.environ.get("DB_HOST", "localhost")
-DB_NAME = os.environ.get("DB_NAME", "manufacturing_db")
-# Optional dialect override for easier local dev/testing
-# set DB_DIALECT=sqlite to use a local file-based DB instead of MySQL
-DB_DIALECT = os.environ.get("DB_DIALECT", "mysql").lower()
-if DB_DIALECT == "sqlite":
-    SQLITE_PATH = os.environ.get("SQLITE_PATH", DB_NAME + ".db")
-    DB_URI = f"sqlite:///{SQLITE_PATH}"
-else:
-    # URL-encode username/password to avoid breaking the URI when they contain
-    # special characters such as '@' or ':'
-    DB_USER_Q = quote_plus(DB_USER)
-    DB_PASS_Q = quote_plus(DB_PASS)
-    DB_URI = f"mysql+pymysql://{DB_USER_Q}:{DB_PASS_Q}@{DB_HOST}/{DB_NAME}"
-
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = DB_URI
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-db = SQLAlchemy(app)
-# Ensure CORS headers are present for API endpoints (helpful during local dev)
-app.config['CORS_HEADERS'] = 'Content-Type'
-# Allow all origins for /api/* during development; tighten this in production
-CORS(app, resources={r"/api/*": {"origins": "*"}})
-
-
-@app.after_request
-def add_cors_headers(response):
-    # Ensure browsers always receive an Access-Control-Allow-Origin header during local dev
-    try:
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization'
-        response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
-    except Exception:
-        pass
-    return response
-
-
-# Global error handler to ensure JSON responses and CORS headers on exceptions
-@app.errorhandler(Exception)
-def handle_exception(e):
-    # Import traceback lazily to avoid top-level cost
-    import traceback
-    tb = traceback.format_exc()
-    # Log to stdout so user's terminal shows the error
-    print("--- Exception caught by global handler ---")
-    print(tb)
-    # Build JSON response
-    body = {'error': 'internal_server_error', 'details': str(e)}
-    resp = jsonify(body)
-    resp.status_code = 500
-    # Ensure CORS headers are present on error responses too
-    try:
-        resp.headers['Access-Control-Allow-Origin'] = '*'
-        resp.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization'
-        resp.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
-    except Exception:
-        pass
-    return resp
-
-# ---------------- MODELS ----------------
-class Product(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100))
-    type = db.Column(db.String(20)) # raw or finished
-    stock_qty = db.Column(db.Integer, default=0)
-    # owner reference: which user created this product
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class BOM(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey("product.id"))
-    # store structured JSON for easy validation and querying
-    components = db.Column(db.JSON)  # list of {product_id, qty}
-    operations = db.Column(db.JSON)  # list of {name, work_center, time}
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class ManufacturingOrder(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey("product.id"))
-    quantity = db.Column(db.Integer)
-    status = db.Column(db.String(20), default="planned")
-    start_date = db.Column(db.String(50))
-    deadline = db.Column(db.String(50))
-    assignee = db.Column(db.String(100))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class WorkOrder(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    mo_id = db.Column(db.Integer, db.ForeignKey("manufacturing_order.id"))
-    manufactured_id = db.Column(db.Integer, db.ForeignKey("product.id"))
-    operation = db.Column(db.String(100))
-    work_center = db.Column(db.String(100))
-    planned_time_mins = db.Column(db.Integer)
-    status = db.Column(db.String(20), default="planned")
-    operator_id = db.Column(db.String(50))
-    start_time = db.Column(db.DateTime)
-    end_time = db.Column(db.DateTime)
-    comments = db.Column(db.Text)
-
-class StockLedger(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey("product.id"))
-    movement_type = db.Column(db.String(10)) # in / out
-    quantity = db.Column(db.Integer)
-    reference = db.Column(db.String(50))
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-
-
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(200), unique=True, nullable=False)
-    password_hash = db.Column(db.String(200), nullable=False)
-    role = db.Column(db.String(50), default="Operator")
+import os, tempfile, json, threading, time, csv, io, re, sys
+from collections import defaultdict
+from sqlalchemy import inspect, text, select, and_, or_, func, event, case, table, column
+from sqlalchemy.exc import IntegrityError
+
+# The subsystems live in their own modules; importing them registers their routes, request
+# hooks and session listeners, in this order (core first, metrics before auth).
+from core import app, db, DB_DIALECT, DB_HOST, DB_NAME, DB_PASS, DB_URI, DB_USER, pool_stats
+import metrics  # noqa: F401 (registers request timing, SQL counts and /metrics)
+from models import BOM, Job, ManufacturingOrder, parse_datetime, Product, StockLedger, StockSnapshot, User, WorkOrder
+from versions import resource_versions, seed_resource_versions, touch_resources
+from auth import require_auth
+from rollups import apply_rollup_deltas, rebuild_rollups, ReportRollup, rollup_contrib
+from atp import (ATP_OPEN_STATUSES, MoReservation, outstanding, ProductAvailability, rebuild_availability,
+                 sync_reservations)
+from serialization import get_serializer, RowSerializer, to_dict
+from listing import list_response
+from http_cache import conditional_get
+from changes import record_change, record_changes
+from consumption import (apply_stock_deltas, bom_components_for, bulk_insert_rows, consume_components,
+                         consume_stock_for_mo, consume_stock_for_wo, first_bom_values, post_ledger_entries)
+from jobs import (add_job, enqueue_job, INTERNAL_JOB_KINDS, JOB_HANDLERS, job_response, JOB_RESULT_DIR, job_runner,
+                  MO_CONFIRM_ASYNC, wants_async)
+from scheduling import request_reschedule, SCHEDULE_ON_STATUS_CHANGE
+from wo_batch import queue_wo_status, wo_batcher
+
+
+# ---------------- SEARCH INDEX ----------------
+# Full-text indexes behind GET /api/search, maintained by the database itself so every
+# write path (ORM, Core bulk inserts, other workers) stays in sync:
+#   SQLite: FTS5 external-content tables <table>_fts with prefix indexes, kept current by
+#           insert/update/delete triggers on the base table
+#   MySQL:  FULLTEXT indexes ft_<table> (InnoDB maintains them)
+# Fresh databases get them from create_all (after_create hooks), older ones from migration 5.
+# resource -> (model, indexed text columns, columns usable as exact filters). Statuses are
+# filters rather than indexed text: a handful of values over millions of rows only bloats
+# the doclists.
+SEARCH_SPECS = {
+    'products': (Product, ('name', 'type'), ('type', 'created_by')),
+    'orders': (ManufacturingOrder, ('assignee',), ('status', 'product_id', 'assignee')),
+    'work_orders': (WorkOrder, ('operation', 'work_center', 'comments'), ('status', 'work_center', 'mo_id')),
+}
+
+
+def _sqlite_search_ddl(table_name, cols):
+    fts = f'{table_name}_fts'
+    names = ', '.join(cols)
+    new = ', '.join(f'new.{c}' for c in cols)
+    old = ', '.join(f'old.{c}' for c in cols)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table_name}', content_rowid='id', "
+        f"tokenize='unicode61', prefix='2 3 4')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        # index the rows that already exist
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def create_search_index(conn, table_name):
+    """Create the full-text index of one SEARCH_SPECS table on conn (idempotent)."""
+    cols = next(c for m, c, _ in SEARCH_SPECS.values() if m.__tablename__ == table_name)
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        try:
+            for stmt in _sqlite_search_ddl(table_name, cols):
+                conn.execute(text(stmt))
+        except Exception as e:
+            # SQLite built without FTS5: search falls back to LIKE prefix matching
+            print(f"Full-text index for {table_name} not created:", e)
+    elif dialect == 'mysql':
+        names = {ix['name'] for ix in inspect(conn).get_indexes(table_name)}
+        if f'ft_{table_name}' not in names:
+            conn.execute(text(f"ALTER TABLE {table_name} ADD FULLTEXT INDEX ft_{table_name} ({', '.join(cols)})"))
+
+
+for _model, _, _ in SEARCH_SPECS.values():
+    event.listen(_model.__table__, 'after_create', lambda target, connection, **kw: create_search_index(connection, target.name))
+
+
+# ---------------- MIGRATIONS ----------------
+# Versioned schema changes for databases created by older releases. Each migration runs
+# once and is recorded in schema_migrations; a database created from scratch by
+# create_all() already has the current schema, so all migrations are just marked applied.
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
     name = db.Column(db.String(200))
-    token = db.Column(db.String(200), index=True)
-    otp_code = db.Column(db.String(20))
-    otp_expiry = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+@migration(1, "add product.created_by")
+def _migrate_product_created_by():
+    inspector = inspect(db.engine)
+    cols = [c['name'] for c in inspector.get_columns('product')]
+    if 'created_by' not in cols:
+        # Add a nullable integer column. Avoid FK constraint for simplicity.
+        if DB_DIALECT == 'sqlite':
+            db.session.execute(text('ALTER TABLE product ADD COLUMN created_by INTEGER'))
+        else:
+            db.session.execute(text('ALTER TABLE product ADD COLUMN created_by INT NULL'))
+
+
+@migration(2, "manufacturing_order.start_date/deadline VARCHAR -> DATETIME")
+def _migrate_mo_dates():
+    # normalise the free-form strings first so the type change cannot fail on bad values
+    rows = db.session.execute(text('SELECT id, start_date, deadline FROM manufacturing_order')).all()
+    updates, dropped = [], 0
+    for mo_id, start, deadline in rows:
+        vals = []
+        for v in (start, deadline):
+            try:
+                dt = parse_datetime(v)
+            except ValueError:
+                dt, dropped = None, dropped + 1
+            vals.append(dt.strftime('%Y-%m-%d %H:%M:%S') if dt else None)
+        if vals != [start, deadline]:
+            updates.append({'i': mo_id, 's': vals[0], 'd': vals[1]})
+    if updates:
+        db.session.execute(text('UPDATE manufacturing_order SET start_date = :s, deadline = :d WHERE id = :i'), updates)
+    if dropped:
+        print(f"Cleared {dropped} unparseable start_date/deadline values")
+    # SQLite stores DATETIME as text already; other databases need the column type changed
+    if DB_DIALECT != 'sqlite':
+        db.session.execute(text('ALTER TABLE manufacturing_order MODIFY start_date DATETIME NULL, MODIFY deadline DATETIME NULL'))
+
+
+@migration(3, "indexes for hot filter/sort columns")
+def _migrate_hot_indexes():
+    _create_indexes('ix_product_created', 'ix_bom_product', 'ix_mo_status_created', 'ix_mo_status_deadline',
+                    'ix_mo_created', 'ix_mo_product', 'ix_wo_mo', 'ix_wo_status_center',
+                    'ix_ledger_product_ts', 'ix_ledger_ts')
+
+
+@migration(4, "work_order.scheduled_start/scheduled_end")
+def _migrate_wo_schedule_columns():
+    cols = [c['name'] for c in inspect(db.engine).get_columns('work_order')]
+    for name in ('scheduled_start', 'scheduled_end'):
+        if name not in cols:
+            db.session.execute(text(f'ALTER TABLE work_order ADD COLUMN {name} DATETIME NULL'))
+    _create_indexes('ix_wo_center_sched')
+
+
+@migration(5, "full-text search indexes")
+def _migrate_search_indexes():
+    conn = db.session.connection()
+    for model, _, _ in SEARCH_SPECS.values():
+        create_search_index(conn, model.__tablename__)
+
+
+@migration(6, "user.auth_changed_at")
+def _migrate_user_auth_changed():
+    cols = [c['name'] for c in inspect(db.engine).get_columns('user')]
+    if 'auth_changed_at' not in cols:
+        db.session.execute(text('ALTER TABLE user ADD COLUMN auth_changed_at DATETIME NULL'))
+    _create_indexes('ix_user_auth_changed')
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
 
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+@migration(7, "wo_status_event.attempts/error/failed_at")
+def _migrate_wo_status_event_failures():
+    cols = [c['name'] for c in inspect(db.engine).get_columns('wo_status_event')]
+    for name, ddl in (('attempts', 'INTEGER NOT NULL DEFAULT 0'), ('error', 'VARCHAR(500) NULL'),
+                      ('failed_at', 'DATETIME NULL')):
+        if name not in cols:
+            db.session.execute(text(f'ALTER TABLE wo_status_event ADD COLUMN {name} {ddl}'))
 
-    def generate_token(self):
-        self.token = secrets.token_hex(24)
-        return self.token
+
+def _create_indexes(*names):
+    # create model-declared indexes by name; named explicitly so a migration only
+    # touches indexes whose columns already exist at that schema version
+    conn = db.session.connection()
+    for model in (Product, BOM, ManufacturingOrder, WorkOrder, StockLedger, User):
+        for index in model.__table__.indexes:
+            if index.name in names:
+                index.create(bind=conn, checkfirst=True)
+
+
+def run_migrations(fresh=False):
+    """Apply pending migrations in version order; stops at the first failure."""
+    applied = set(db.session.execute(select(SchemaMigration.version)).scalars())
+    for version, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        try:
+            if not fresh:
+                fn()
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+            if not fresh:
+                print(f"Applied migration {version}: {name}")
+        except Exception as me:
+            db.session.rollback()
+            print(f"Migration {version} ({name}) failed:", me)
+            return False
+    return True
 
 
 # ---------------- INIT DB ----------------
-with app.app_context():
+# Schema creation, migrations and seeding run from an explicit command instead of on import,
+# so WSGI workers boot without touching the schema (run it once per deploy):
+#   flask --app app init-db        or        python app.py init-db
+# `python app.py` (the development server) runs it before serving; DB_AUTO_INIT=1 restores
+# initialization on import.
+DB_AUTO_INIT = os.environ.get("DB_AUTO_INIT", "0") == "1"
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def init_db():
+    """Create missing tables, apply pending migrations and seed derived tables (idempotent)."""
     try:
+        fresh_db = 'product' not in inspect(db.engine).get_table_names()
         db.create_all()
     except Exception as e:
         # Mask password when printing URI to avoid leaking secrets in logs
@@ -164,47 +249,57 @@ with app.app_context():
         print(" - To avoid MySQL during local development, set the environment variable DB_DIALECT=sqlite to use a local sqlite DB file.")
         raise
 
-    # Backfill / migration: ensure newer columns exist when running against older DBs
+    if not run_migrations(fresh=fresh_db):
+        raise MigrationError("schema migrations failed; see the log above")
+
+    # Seed the rollup table once for databases that already have history
     try:
-        inspector = inspect(db.engine)
-        if 'product' in inspector.get_table_names():
-            cols = [c['name'] for c in inspector.get_columns('product')]
-            if 'created_by' not in cols:
-                try:
-                    # Add a nullable integer column. Avoid FK constraint for simplicity.
-                    if DB_DIALECT == 'sqlite':
-                        db.session.execute(text('ALTER TABLE product ADD COLUMN created_by INTEGER'))
-                    else:
-                        db.session.execute(text('ALTER TABLE product ADD COLUMN created_by INT NULL'))
-                    db.session.commit()
-                    print("[32mAdded missing 'created_by' column to 'product' table[0m")
-                except Exception as me:
-                    print("Could not add created_by column:", me)
-    except Exception:
-        # non-fatal: if inspector isn't available or fails, continue
-        pass
+        if db.session.query(ReportRollup.id).first() is None and (
+                db.session.query(ManufacturingOrder.id).first() is not None
+                or db.session.query(StockLedger.id).first() is not None):
+            print("Building report rollups from existing history:", rebuild_rollups(), "keys")
+    except Exception as re_:
+        db.session.rollback()
+        print("Could not build report rollups:", re_)
 
-def to_dict(obj):
-    # Convert SQLAlchemy model to plain dict with JSON-serializable values
-    out = {}
-    for c in obj.__table__.columns:
-        val = getattr(obj, c.name)
-        # serialize datetimes to ISO strings
-        try:
-            if isinstance(val, datetime):
-                out[c.name] = val.isoformat()
-            else:
-                out[c.name] = val
-        except Exception:
-            out[c.name] = str(val)
-    return out
+    # Seed availability once for databases that already have open MOs
+    try:
+        if db.session.query(ProductAvailability.product_id).first() is None and db.session.query(
+                ManufacturingOrder.id).filter(ManufacturingOrder.status.in_(ATP_OPEN_STATUSES)).first() is not None:
+            print("Building availability from open MOs:", rebuild_availability(), "MOs")
+    except Exception as av_:
+        db.session.rollback()
+        print("Could not build availability:", av_)
+
+    try:
+        seed_resource_versions()
+    except Exception as rv_:
+        db.session.rollback()
+        print("Could not seed resource versions:", rv_)
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create tables, run pending migrations and seed derived tables."""
+    try:
+        init_db()
+    except MigrationError as e:
+        print("❌", e)
+        sys.exit(1)
+    print("Database initialized")
+
+
+if DB_AUTO_INIT:
+    with app.app_context():
+        init_db()
 
 # ---------------- ROUTES ----------------
 @app.route("/api/products", methods=["GET","POST","DELETE"])
+@conditional_get('product')
 def products():
     # GET is public
     if request.method == "GET":
-        return jsonify([to_dict(p) for p in Product.query.all()])
+        return list_response(Product)
 
     # modifications require authentication
     if not g.get('user'):
@@ -214,80 +309,49 @@ def products():
     if request.method == "POST":
         d = request.json or {}
         prod = Product(name=d.get("name"), type=d.get("type","raw"), stock_qty=int(d.get("stock_qty",0)), created_by=user.id)
-        db.session.add(prod); db.session.commit()
+        db.session.add(prod); db.session.flush()
+        # initial stock enters through the ledger too so both stay reconcilable
+        post_opening_balances([(prod.id, prod.stock_qty)])
+        db.session.commit()
         return jsonify(to_dict(prod)), 201
 
     if request.method == "DELETE":
         pid = int(request.args.get('id') or 0)
-        prod = Product.query.get(pid)
+        prod = db.session.get(Product, pid)
         if not prod: return jsonify({'error':'not found'}),404
         if prod.created_by != user.id:
             return jsonify({'error':'forbidden'}),403
-        db.session.delete(prod); db.session.commit()
+        # the ledger is append-only and MOs/WOs/BOMs point at the product (enforced FKs on
+        # MySQL), so a product with history cannot go away; report what still holds it
+        refs = product_references(pid)
+        if refs:
+            return jsonify({'error':'product is referenced and cannot be deleted','references':refs}),409
+        db.session.execute(ProductAvailability.__table__.delete().where(ProductAvailability.product_id == pid))
+        db.session.delete(prod)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # something started referencing it after the check
+            db.session.rollback()
+            return jsonify({'error':'product is referenced and cannot be deleted','references':product_references(pid)}),409
         return jsonify({'deleted': pid})
 
 
-# ---------------- AUTH ----------------
-@app.route('/api/auth/signup', methods=['POST'])
-def signup():
-    d = request.json
-    if not d.get('email') or not d.get('password'):
-        return jsonify({'error':'email and password required'}),400
-    if User.query.filter_by(email=d['email']).first():
-        return jsonify({'error':'user exists'}),400
-    u = User(email=d['email'], name=d.get('name'), role=d.get('role','Operator'))
-    u.set_password(d['password'])
-    u.generate_token()
-    db.session.add(u); db.session.commit()
-    return jsonify({'token':u.token,'id':u.id,'role':u.role}),201
-
-
-@app.route('/api/auth/login', methods=['POST'])
-def login():
-    d = request.json
-    u = User.query.filter_by(email=d.get('email')).first()
-    if not u or not u.check_password(d.get('password','')):
-        return jsonify({'error':'invalid creds'}),401
-    token = u.generate_token()
-    db.session.commit()
-    return jsonify({'token':token,'role':u.role,'id':u.id})
-
-
-@app.route('/api/auth/forgot', methods=['POST'])
-def forgot():
-    d = request.json
-    u = User.query.filter_by(email=d.get('email')).first()
-    if not u: return jsonify({'ok':True})
-    code = str(secrets.randbelow(1000000)).zfill(6)
-    u.otp_code = code
-    u.otp_expiry = datetime.utcnow() + timedelta(minutes=10)
-    db.session.commit()
-    # In production, send email. For now return code in response for local dev.
-    return jsonify({'otp':code})
-
-
-def require_token():
-    t = request.headers.get('Authorization')
-    if not t: return None
-    if t.startswith('Bearer '): t = t.split(' ',1)[1]
-    return User.query.filter_by(token=t).first()
-
+def product_references(pid):
+    """{table: rows} of the rows that still point at product pid (tables with none are left out)."""
+    counts = db.session.execute(select(
+        select(func.count()).select_from(StockLedger).where(StockLedger.product_id == pid).scalar_subquery(),
+        select(func.count()).select_from(BOM).where(BOM.product_id == pid).scalar_subquery(),
+        select(func.count()).select_from(ManufacturingOrder).where(ManufacturingOrder.product_id == pid).scalar_subquery(),
+        select(func.count()).select_from(WorkOrder).where(WorkOrder.manufactured_id == pid).scalar_subquery(),
+        select(func.count()).select_from(MoReservation).where(MoReservation.product_id == pid).scalar_subquery(),
+    )).one()
+    names = ('stock_ledger', 'bom', 'manufacturing_order', 'work_order', 'mo_reservation')
+    return {n: c for n, c in zip(names, counts) if c}
 
-@app.before_request
-def attach_user():
-    g.user = require_token()
-
-
-def require_auth(func):
-    from functools import wraps
-    @wraps(func)
-    def wrapper(*a, **kw):
-        if not g.get('user'):
-            return jsonify({'error':'authentication required'}),401
-        return func(*a, **kw)
-    return wrapper
 
 @app.route("/api/bom", methods=["POST","GET"])
+@conditional_get('bom')
 def bom():
     if request.method=="POST":
         d=request.json or {}
@@ -296,7 +360,7 @@ def bom():
             pid = int(d.get("product_id"))
         except Exception:
             return jsonify({"error":"product_id required and must be integer"}),400
-        if not Product.query.get(pid):
+        if not db.session.get(Product, pid):
             return jsonify({"error":"product not found"}),404
 
         comps = d.get("components", [])
@@ -316,69 +380,102 @@ def bom():
 
         bom = BOM(product_id=pid, components=comps, operations=ops)
         db.session.add(bom); db.session.commit()
+        bom_cache.invalidate()
         return jsonify(to_dict(bom)),201
-    return jsonify([to_dict(b) for b in BOM.query.all()])
+    return list_response(BOM)
 
 @app.route("/api/orders", methods=["GET","POST","PUT","DELETE"])
 @require_auth
 def orders():
     if request.method=="POST":
         d = request.json or {}
-        mo = ManufacturingOrder(
-            product_id=int(d["product_id"]),
-            quantity=int(d.get("quantity", 1)),
-            start_date=d.get("start_date"),
-            deadline=d.get("deadline"),
-            assignee=d.get("assignee"),
-            status=d.get("status", "planned"),
-        )
+        run_async = d.get('status') == 'confirmed' and wants_async(MO_CONFIRM_ASYNC)
+        key = request.headers.get("Idempotency-Key") if run_async else None
+        if key:
+            # a retried request returns the MO and job of the first attempt
+            job = Job.query.filter_by(idempotency_key=key).first()
+            if job is not None:
+                return _replay_confirm(job)
+        try:
+            mo = ManufacturingOrder(
+                product_id=int(d["product_id"]),
+                quantity=int(d.get("quantity", 1)),
+                start_date=d.get("start_date"),
+                deadline=d.get("deadline"),
+                assignee=d.get("assignee"),
+                # the job confirms it, so it is confirmed exactly once
+                status='planned' if run_async else d.get("status", "planned"),
+            )
+        except ValueError as e:
+            return jsonify({"error":str(e)}),400
         db.session.add(mo)
-        db.session.commit()
+        db.session.flush()
+        record_change('order', 'create', mo.id, to_dict(mo))
+        if run_async:
+            # WO generation and stock consumption run as a job queued in the MO's transaction;
+            # a concurrent request with the same key fails on the unique key and replays
+            job = add_job('confirm_mo', {'mo_id': mo.id, 'check_stock': d.get('check_stock')}, key, g.user.id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            job = Job.query.filter_by(idempotency_key=key).first() if key else None
+            if job is None:
+                raise
+            return _replay_confirm(job)
+        if run_async:
+            job_runner.ensure_started()
+            job_runner.wake()
+            return job_response(job, True, order=to_dict(mo))
         # If client created the MO as 'confirmed', generate WOs from BOM
         if d.get('status') == 'confirmed':
-            bom = BOM.query.filter_by(product_id=mo.product_id).first()
-            if bom:
-                ops = bom.operations or []
-                for op in ops:
-                    manufactured_id = mo.product_id
-                    wo = WorkOrder(
-                        mo_id=mo.id,
-                        manufactured_id=manufactured_id,
-                        operation=(op.get('name') if isinstance(op, dict) else str(op)),
-                        work_center=(op.get('work_center') if isinstance(op, dict) else None),
-                        planned_time_mins=(int(op.get('time', 0)) if isinstance(op, dict) else 0),
-                    )
-                    db.session.add(wo)
-                db.session.commit()
-                # consume stock immediately for the confirmed MO (one consumption per MO)
-                try:
-                    ok, err = consume_stock_for_mo(mo.id)
-                    if not ok:
-                        # If consumption failed, return an error to the client
-                        return jsonify({'error':'stock consumption failed','details':err}),500
-                except Exception as ex:
-                    return jsonify({'error':'stock consumption failed','details':str(ex)}),500
+            # one executemany INSERT for all operations of the BOM
+            generate_work_orders([(mo.id, mo.product_id)])
+            db.session.commit()
+            # consume stock immediately for the confirmed MO (one consumption per MO)
+            try:
+                ok, err = consume_stock_for_mo(mo.id, d.get('check_stock'))
+                if not ok:
+                    # If consumption failed, return an error to the client
+                    return jsonify({'error':'stock consumption failed','details':err}),500
+            except Exception as ex:
+                return jsonify({'error':'stock consumption failed','details':str(ex)}),500
         return jsonify(to_dict(mo)), 201
     if request.method=="GET":
         status=request.args.get("status")
-        q=ManufacturingOrder.query
-        if status: q=q.filter_by(status=status)
-        return jsonify([to_dict(m) for m in q.all()])
+        filters=[ManufacturingOrder.status==status] if status else []
+        return list_response(ManufacturingOrder, *filters)
     if request.method=="PUT":
         d=request.json
-        mo=ManufacturingOrder.query.get(int(d["id"]))
+        mo=db.session.get(ManufacturingOrder, int(d["id"]))
         if not mo: return jsonify({"error":"Not found"}),404
-        for k,v in d.items():
-            if hasattr(mo, k):
-                setattr(mo,k,v)
+        try:
+            # numbers arrive as JSON strings from some clients; the ATP sync does arithmetic on them
+            for k in ('product_id', 'quantity'):
+                if k in d: d[k] = _req_int(d, k)
+            for k,v in d.items():
+                if hasattr(mo, k):
+                    setattr(mo,k,v)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({"error":str(e)}),400
+        record_change('order', 'update', mo.id, to_dict(mo))
         db.session.commit(); return jsonify(to_dict(mo))
     if request.method=="DELETE":
-        mo=ManufacturingOrder.query.get(int(request.args.get("id")))
+        mo=db.session.get(ManufacturingOrder, int(request.args.get("id")))
         if not mo: return jsonify({"error":"Not found"}),404
-        db.session.delete(mo); db.session.commit()
+        db.session.delete(mo); record_change('order', 'delete', mo.id)
+        db.session.commit()
         return jsonify({"deleted":mo.id})
 
+def _replay_confirm(job):
+    if job.kind != 'confirm_mo':
+        return jsonify({"error":"idempotency key already used for a different kind of job"}),409
+    return job_response(job, False, order=to_dict(db.session.get(ManufacturingOrder, job.params['mo_id'])))
+
+
 @app.route("/api/work-orders", methods=["GET","POST"])
+@conditional_get('work_order')
 def work_orders():
     # GET is public (anyone can view). POST requires authentication.
     if request.method=="POST":
@@ -386,84 +483,520 @@ def work_orders():
             return jsonify({'error':'authentication required'}),401
         d=request.json
         wo=WorkOrder(mo_id=int(d["mo_id"]), manufactured_id=int(d.get("manufactured_id") or 0) or None, operation=d["operation"], work_center=d.get("work_center"), planned_time_mins=int(d.get("planned_time_mins",0)))
-        db.session.add(wo); db.session.commit()
+        db.session.add(wo); db.session.flush()
+        record_change('work_order', 'create', wo.id, to_dict(wo))
+        db.session.commit()
         return jsonify(to_dict(wo)),201
     status = request.args.get('status')
-    q = WorkOrder.query
-    if status: q = q.filter_by(status=status)
-    return jsonify([to_dict(w) for w in q.all()])
+    filters = [WorkOrder.status == status] if status else []
+    return list_response(WorkOrder, *filters)
 
 @app.route("/api/work-orders/<int:wo_id>/status", methods=["PUT"])
 def update_wo_status(wo_id):
     d=request.json
-    wo=WorkOrder.query.get(wo_id)
+    if wo_batcher.enabled:
+        return queue_wo_status(wo_id, d)
+    wo=db.session.get(WorkOrder, wo_id)
     if not wo: return jsonify({"error":"Not found"}),404
     wo.status=d["status"]
     if d["status"]=="started": wo.start_time=datetime.utcnow()
     if d["status"]=="completed": wo.end_time=datetime.utcnow()
+    record_change('work_order', 'status', wo.id, to_dict(wo))
     db.session.commit()
     # Auto-consume stock when a WO completes
     if d["status"]=="completed":
-        ok, err = consume_stock_for_wo(wo.id)
+        ok, err = consume_stock_for_wo(wo.id, d.get('check_stock'))
         if not ok:
             return jsonify({'error':'stock consumption failed','details':err}),500
+    # WOs that are part of a schedule shift the plan from this point on (in the background)
+    if SCHEDULE_ON_STATUS_CHANGE and wo.scheduled_start is not None:
+        request_reschedule()
     return jsonify(to_dict(wo))
 
 
-def consume_stock_for_wo(wo_id):
-    """Consume stock for the given work order. Returns (True, None) or (False, error_string)."""
+# ---------------- MRP ----------------
+# Multi-level BOM explosion. All BOMs are loaded with one query into an in-memory graph
+# (first BOM per product wins, same as consumption) and per-unit explosions are memoized;
+# both are dropped whenever the 'bom' resource version moves, so a BOM posted through any
+# worker is picked up within RESOURCE_VERSION_TTL (at once in the worker that took it).
+class BomCycleError(ValueError):
+    def __init__(self, cycle):
+        super().__init__('BOM cycle: ' + ' -> '.join(str(p) for p in cycle))
+        self.cycle = cycle
+
+
+class BomTreeCache:
+    """Cached BOM graph {product_id: {component_id: qty per unit}} with memoized explosions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._graph = None
+        self._trees = {}
+        self.version = 0
+        self.db_version = None  # 'bom' resource version the cached graph was loaded under
+        self.hits = self.misses = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._graph = None
+            self._trees = {}
+            self.version += 1
+
+    def _check(self):
+        db_version = resource_versions.get(('bom',))[0][0]
+        with self._lock:
+            if db_version == self.db_version:
+                return
+            self._graph = None
+            self._trees = {}
+            self.version += 1
+            self.db_version = db_version
+
+    def graph(self):
+        self._check()
+        with self._lock:
+            if self._graph is not None:
+                return self._graph
+            version = self.version
+        graph = {}
+        for pid, comps in db.session.execute(select(BOM.product_id, BOM.components).order_by(BOM.id)):
+            if pid is None or pid in graph:
+                continue
+            edges = graph[pid] = {}
+            for c in comps if isinstance(comps, list) else []:
+                cid = int(c.get('product_id'))
+                edges[cid] = edges.get(cid, 0) + float(c.get('qty', 1))
+        with self._lock:
+            # a BOM posted while we were loading makes this snapshot stale; use it once but do not keep it
+            if self.version == version:
+                self._graph = graph
+        return graph
+
+    def topo_order(self, roots):
+        """Products reachable from roots, every parent before its components. Raises BomCycleError."""
+        graph = self.graph()
+        state = {}  # pid -> 1 while on the DFS path, 2 when finished
+        order = []
+        for root in roots:
+            if root in state:
+                continue
+            stack = [(root, iter(graph.get(root, ())))]
+            state[root] = 1
+            while stack:
+                pid, children = stack[-1]
+                for cid in children:
+                    if state.get(cid) == 1:
+                        path = [p for p, _ in stack]
+                        raise BomCycleError(path[path.index(cid):] + [cid])
+                    if cid not in state:
+                        state[cid] = 1
+                        stack.append((cid, iter(graph.get(cid, ()))))
+                        break
+                else:
+                    state[pid] = 2
+                    order.append(pid)
+                    stack.pop()
+        order.reverse()
+        return order
+
+    def tree(self, pid):
+        """Per-unit explosion of pid: {'product_id', 'components': [{'product_id','qty','components'}]}, memoized."""
+        self._check()
+        with self._lock:
+            cached = self._trees.get(pid)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+        self.topo_order([pid])  # cycle check before recursing
+        graph = self.graph()
+        memo = {}
+
+        def build(p):
+            if p not in memo:
+                memo[p] = [{'product_id': c, 'qty': q, 'components': build(c)} for c, q in graph.get(p, {}).items()]
+            return memo[p]
+        tree = {'product_id': pid, 'components': build(pid)}
+        with self._lock:
+            self._trees[pid] = tree
+        return tree
+
+    def leaves(self, pid):
+        """Per-unit gross requirement of every purchased (BOM-less) component of pid."""
+        graph = self.graph()
+        need = defaultdict(float)
+        need[pid] = 1.0
+        out = defaultdict(float)
+        for p in self.topo_order([pid]):
+            if p in graph and graph[p]:
+                for c, q in graph[p].items():
+                    need[c] += need[p] * q
+            elif p != pid:
+                out[p] += need[p]
+        return dict(out)
+
+
+bom_cache = BomTreeCache()
+
+
+def plan_requirements(demand, net_top=False):
+    """Net multi-level requirements for demand {product_id: qty} against Product.stock_qty.
+
+    Products are processed in topological order so every parent's net quantity is known
+    before its components are exploded; stock is allocated once across the whole batch.
+    Top-level demand is treated as quantity to make unless net_top is set.
+    """
+    graph = bom_cache.graph()
+    order = bom_cache.topo_order(list(demand))
+    on_hand = dict(db.session.execute(select(Product.id, Product.stock_qty).where(Product.id.in_(order))).all()) if order else {}
+    dependent = defaultdict(float)
+    rows = []
+    for pid in order:
+        direct = float(demand.get(pid, 0))
+        stock = max(on_hand.get(pid) or 0, 0)
+        if net_top:
+            net = max(0.0, direct + dependent[pid] - stock)
+        else:
+            net = direct + max(0.0, dependent[pid] - stock)
+        has_bom = bool(graph.get(pid))
+        for cid, q in (graph.get(pid) or {}).items():
+            dependent[cid] += net * q
+        rows.append({'product_id': pid, 'gross': direct + dependent[pid], 'on_hand': on_hand.get(pid),
+                     'net': net, 'action': 'make' if has_bom else 'buy'})
+    return rows
+
+
+@app.route("/api/mrp", methods=["GET","POST"])
+def mrp():
+    # GET ?product_id=&quantity=   or   POST {"items":[{"product_id","quantity"}], "mo_ids":[...], "mo_status":"confirmed", "net_top":false}
+    d = request.json if request.method=="POST" else {"items":[{"product_id":request.args.get("product_id"),"quantity":request.args.get("quantity",1)}]}
+    d = d or {}
+    demand = defaultdict(float)
     try:
-        wo = WorkOrder.query.get(wo_id)
-        if not wo:
-            return False, f'WO {wo_id} not found'
-        mo = ManufacturingOrder.query.get(wo.mo_id)
-        if not mo:
-            return False, f'MO {wo.mo_id} not found'
-        bom = BOM.query.filter_by(product_id=mo.product_id).first()
-        if not bom or not isinstance(bom.components, list):
-            return True, None  # nothing to consume
-
-        with db.session.begin_nested():
-            for c in bom.components:
-                pid = int(c.get('product_id'))
-                qty = float(c.get('qty',1)) * (mo.quantity or 1)
-                entry = StockLedger(product_id=pid, movement_type='out', quantity=int(qty), reference=f'WO:{wo.id}')
-                db.session.add(entry)
-                prod = Product.query.get(pid)
-                if not prod:
-                    raise ValueError(f'Product {pid} not found')
-                prod.stock_qty = (prod.stock_qty or 0) - int(qty)
-        db.session.commit()
-        return True, None
-    except Exception as ex:
-        db.session.rollback()
-        return False, str(ex)
+        for it in d.get("items") or []:
+            demand[int(it["product_id"])] += float(it.get("quantity", 1))
+        mo_filters = []
+        if d.get("mo_ids"):
+            mo_filters.append(ManufacturingOrder.id.in_([int(i) for i in d["mo_ids"]]))
+        if d.get("mo_status"):
+            mo_filters.append(ManufacturingOrder.status==d["mo_status"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error":"items need integer product_id and numeric quantity; mo_ids must be integers"}),400
+    if mo_filters:
+        # the whole batch of MOs is loaded with one query
+        for pid, qty in db.session.execute(select(ManufacturingOrder.product_id, ManufacturingOrder.quantity).where(*mo_filters)):
+            if pid is not None:
+                demand[pid] += qty or 1
+    if not demand:
+        return jsonify({"error":"nothing to plan: pass items, mo_ids or mo_status"}),400
+    try:
+        rows = plan_requirements(demand, bool(d.get("net_top")))
+    except BomCycleError as e:
+        return jsonify({"error":"BOM cycle detected","cycle":e.cycle}),400
+    return jsonify({"demand":{str(k):v for k,v in demand.items()},"requirements":rows,
+                    "shortages":[r for r in rows if r["action"]=="buy" and r["net"]>0]})
+
 
-def consume_stock_for_mo(mo_id):
-    """Consume stock for the given manufacturing order. Returns (True, None) or (False, error_string)."""
+@app.route("/api/bom/<int:product_id>/explode", methods=["GET"])
+def bom_explode(product_id):
+    # cached per-unit multi-level tree plus leaf totals scaled by ?quantity=
     try:
-        mo = ManufacturingOrder.query.get(mo_id)
-        if not mo:
-            return False, f'MO {mo_id} not found'
-        bom = BOM.query.filter_by(product_id=mo.product_id).first()
-        if not bom or not isinstance(bom.components, list):
-            return True, None  # nothing to consume
-
-        with db.session.begin_nested():
-            for c in bom.components:
-                pid = int(c.get('product_id'))
-                qty = float(c.get('qty',1)) * (mo.quantity or 1)
-                entry = StockLedger(product_id=pid, movement_type='out', quantity=int(qty), reference=f'MO:{mo.id}')
-                db.session.add(entry)
-                prod = Product.query.get(pid)
-                if not prod:
-                    raise ValueError(f'Product {pid} not found')
-                prod.stock_qty = (prod.stock_qty or 0) - int(qty)
-        db.session.commit()
-        return True, None
-    except Exception as ex:
-        db.session.rollback()
-        return False, str(ex)
+        qty = float(request.args.get("quantity", 1))
+        tree = bom_cache.tree(product_id)
+        leaves = bom_cache.leaves(product_id)
+    except ValueError as e:
+        if isinstance(e, BomCycleError):
+            return jsonify({"error":"BOM cycle detected","cycle":e.cycle}),400
+        return jsonify({"error":"quantity must be numeric"}),400
+    return jsonify({"product_id":product_id,"quantity":qty,"tree":tree,
+                    "leaves":{str(k):v*qty for k,v in leaves.items()}})
+
+
+# ---------------- BULK WRITES ----------------
+# POST /api/<resource>/bulk accepts a JSON array, {"items": [...]} or NDJSON
+# (Content-Type: application/x-ndjson). Valid items are inserted with executemany in
+# batches of ?batch_size= (one transaction per batch). When a batch fails it is retried
+# item by item so only the offending items are reported as failed.
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", "500"))
+BULK_MAX_BATCH_SIZE = int(os.environ.get("BULK_MAX_BATCH_SIZE", "5000"))
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+
+def generate_work_orders(mos):
+    """Insert the WOs of each (mo_id, product_id) from its BOM operations in one executemany (no commit)."""
+    ops_by_product = first_bom_values([pid for _, pid in mos], BOM.operations)
+    rows = []
+    for mo_id, pid in mos:
+        for op in ops_by_product.get(pid) or []:
+            is_dict = isinstance(op, dict)
+            rows.append({'mo_id': mo_id, 'manufactured_id': pid,
+                         'operation': op.get('name') if is_dict else str(op),
+                         'work_center': op.get('work_center') if is_dict else None,
+                         'planned_time_mins': int(op.get('time', 0)) if is_dict else 0,
+                         'status': 'planned'})
+    bulk_insert_rows(WorkOrder, rows)
+    counts = defaultdict(int)
+    for r in rows:
+        counts[r['mo_id']] += 1
+    record_changes([('work_order', 'generated', None, {'mo_id': mo_id, 'count': n}) for mo_id, n in counts.items()])
+    return len(rows)
+
+
+def _req_int(d, key, default=None):
+    v = d.get(key, default)
+    if v is None or v == '':
+        raise ValueError(f'{key} required')
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be an integer')
+
+
+def _opt_str(d, key, default=None):
+    v = d.get(key, default)
+    return None if v is None else str(v)
+
+
+def _bulk_prepare_product(d, now):
+    return {'name': _opt_str(d, 'name'), 'type': _opt_str(d, 'type', 'raw'), 'stock_qty': _req_int(d, 'stock_qty', 0),
+            'created_by': g.user.id, 'created_at': now}
+
+
+def _bulk_prepare_order(d, now):
+    return {'product_id': _req_int(d, 'product_id'), 'quantity': _req_int(d, 'quantity', 1),
+            'start_date': parse_datetime(d.get('start_date')), 'deadline': parse_datetime(d.get('deadline')),
+            'assignee': _opt_str(d, 'assignee'), 'status': _opt_str(d, 'status', 'planned'), 'created_at': now}
+
+
+def _bulk_prepare_work_order(d, now):
+    if not d.get('operation'):
+        raise ValueError('operation required')
+    return {'mo_id': _req_int(d, 'mo_id'), 'manufactured_id': int(d.get('manufactured_id') or 0) or None,
+            'operation': str(d['operation']), 'work_center': _opt_str(d, 'work_center'),
+            'planned_time_mins': _req_int(d, 'planned_time_mins', 0), 'status': 'planned'}
+
+
+def _bulk_prepare_stock(d, now):
+    if d.get('movement_type') not in ('in', 'out'):
+        raise ValueError("movement_type must be 'in' or 'out'")
+    return {'product_id': _req_int(d, 'product_id'), 'movement_type': d['movement_type'],
+            'quantity': _req_int(d, 'quantity'), 'reference': _opt_str(d, 'reference'), 'timestamp': now}
+
+
+def _bulk_apply_simple(model):
+    return lambda rows, check_stock: bulk_insert_rows(model, rows)
+
+
+def _bulk_apply_products(rows, check_stock):
+    ids = bulk_insert_rows(Product, rows, need_ids=any(r['stock_qty'] for r in rows))
+    if ids:
+        post_opening_balances([(pid, r['stock_qty']) for pid, r in zip(ids, rows)])
+    return ids
+
+
+def _bulk_apply_orders(rows, check_stock):
+    confirmed = [i for i, r in enumerate(rows) if r['status'] == 'confirmed']
+    opened = [i for i, r in enumerate(rows) if r['status'] in ATP_OPEN_STATUSES]
+    ids = bulk_insert_rows(ManufacturingOrder, rows, need_ids=bool(confirmed or opened))
+    if opened:
+        # Core inserts bypass the ORM flush listener, so reserve components directly
+        sync_reservations(db.session.connection(),
+                          [(ids[i], None, (rows[i]['product_id'], rows[i]['quantity'], rows[i]['status'])) for i in opened])
+    if confirmed:
+        mos = [(ids[i], rows[i]['product_id']) for i in confirmed]
+        generate_work_orders(mos)
+        comps_by_product = first_bom_values([pid for _, pid in mos], BOM.components)
+        for i, (mo_id, pid) in zip(confirmed, mos):
+            comps = comps_by_product.get(pid)
+            if isinstance(comps, list):
+                consume_components(comps, rows[i]['quantity'] or 1, f'MO:{mo_id}', check_stock, mo_id)
+    return ids
+
+
+def _bulk_apply_stock(rows, check_stock):
+    deltas = defaultdict(int)
+    for r in rows:
+        deltas[r['product_id']] += r['quantity'] if r['movement_type'] == 'in' else -r['quantity']
+    apply_stock_deltas(deltas)
+    return bulk_insert_rows(StockLedger, rows)
+
+
+# resource -> (prepare item, (referenced column, referenced model) or None, apply batch)
+BULK_KINDS = {
+    'products': (_bulk_prepare_product, None, _bulk_apply_products),
+    'orders': (_bulk_prepare_order, ('product_id', Product), _bulk_apply_orders),
+    'work-orders': (_bulk_prepare_work_order, ('mo_id', ManufacturingOrder), _bulk_apply_simple(WorkOrder)),
+    'stock': (_bulk_prepare_stock, ('product_id', Product), _bulk_apply_stock),
+}
+# change feed kind per resource (stock changes are recorded by apply_stock_deltas)
+BULK_FEED_KINDS = {'orders': 'order', 'work-orders': 'work_order'}
+
+
+def _bulk_read_items():
+    """Yield (index, item) pairs; item is a ValueError for unparseable NDJSON lines."""
+    if request.mimetype in NDJSON_MIMETYPES:
+        i = 0
+        for raw in request.stream:
+            if not raw.strip():
+                continue
+            try:
+                yield i, json.loads(raw)
+            except ValueError as e:
+                yield i, ValueError(f'invalid JSON: {e}')
+            i += 1
+        return
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('items')
+    if not isinstance(body, list):
+        raise ValueError('expected a JSON array, {"items": [...]} or NDJSON')
+    yield from enumerate(body)
+
+
+@app.route("/api/<any('products','orders','work-orders','stock'):kind>/bulk", methods=["POST"])
+@require_auth
+def bulk_write(kind):
+    prepare, ref, apply = BULK_KINDS[kind]
+    try:
+        batch_size = max(1, min(int(request.args.get('batch_size', BULK_BATCH_SIZE)), BULK_MAX_BATCH_SIZE))
+    except ValueError:
+        return jsonify({'error':'batch_size must be an integer'}),400
+    # absent means None, so STOCK_CHECK_AVAILABILITY decides like on the single-row endpoints
+    check_stock = request.args.get('check_stock')
+    if check_stock is not None:
+        check_stock = check_stock.lower() in ('1', 'true')
+    now = datetime.utcnow()
+    results = []
+
+    def fail(index, err):
+        results.append({'index': index, 'ok': False, 'error': err})
+
+    def write(batch):
+        if ref:
+            key, model = ref
+            wanted = {r[key] for _, r in batch}
+            found = set(db.session.execute(select(model.id).where(model.id.in_(wanted))).scalars())
+            for i, r in batch:
+                if r[key] not in found:
+                    fail(i, f'{key} {r[key]} not found')
+            batch = [(i, r) for i, r in batch if r[key] in found]
+        if not batch:
+            return
+        try:
+            ids = apply([r for _, r in batch], check_stock)
+            if kind in BULK_FEED_KINDS:
+                record_change(BULK_FEED_KINDS[kind], 'bulk_create', None, {'count': len(batch), 'ids': ids})
+            db.session.commit()
+        except Exception as ex:
+            db.session.rollback()
+            if len(batch) == 1:
+                fail(batch[0][0], str(ex))
+            else:
+                for item in batch:
+                    write([item])
+            return
+        for n, (i, _) in enumerate(batch):
+            results.append({'index': i, 'ok': True, 'id': ids[n] if ids else None})
+
+    pending = []
+    try:
+        for i, item in _bulk_read_items():
+            if isinstance(item, ValueError):
+                fail(i, str(item)); continue
+            if not isinstance(item, dict):
+                fail(i, 'item must be an object'); continue
+            try:
+                pending.append((i, prepare(item, now)))
+            except ValueError as e:
+                fail(i, str(e)); continue
+            if len(pending) >= batch_size:
+                write(pending); pending = []
+        write(pending)
+    except ValueError as e:
+        return jsonify({'error':str(e)}),400
+    results.sort(key=lambda r: r['index'])
+    failed = sum(1 for r in results if not r['ok'])
+    return jsonify({'inserted':len(results)-failed,'failed':failed,'results':results}), (207 if failed else 201)
+
+
+# ---------------- STOCK LEDGER ----------------
+# The ledger is the append-only source of truth; Product.stock_qty is a maintained
+# counter. Periodic per-product snapshots make point-in-time on-hand queries cost
+# O(latest snapshot + ledger rows since it) instead of a scan of the whole history.
+# Run POST /api/stock/snapshots from cron (e.g. nightly); SNAPSHOT_LAG_SECONDS keeps the
+# snapshot point slightly in the past so in-flight writes are not cut off.
+SNAPSHOT_LAG_SECONDS = int(os.environ.get("SNAPSHOT_LAG_SECONDS", "60"))
+
+
+def _signed_ledger_qty():
+    return case((StockLedger.movement_type == 'in', StockLedger.quantity), else_=-StockLedger.quantity)
+
+
+def _snapshots_and_deltas(as_of=None, product_ids=None):
+    """({pid: (snapshot as_of, qty)}, {pid: ledger delta after that snapshot up to as_of})."""
+    S, L = StockSnapshot, StockLedger
+    latest = select(S.product_id, func.max(S.as_of).label('as_of')).group_by(S.product_id)
+    if as_of is not None:
+        latest = latest.where(S.as_of <= as_of)
+    if product_ids is not None:
+        latest = latest.where(S.product_id.in_(product_ids))
+    latest = latest.subquery()
+    snaps = select(S.product_id, S.as_of, S.qty).join(
+        latest, and_(S.product_id == latest.c.product_id, S.as_of == latest.c.as_of)).subquery()
+    base = {pid: (ts, qty) for pid, ts, qty in db.session.execute(select(snaps))}
+    delta = (select(L.product_id, func.sum(_signed_ledger_qty()))
+             .outerjoin(snaps, snaps.c.product_id == L.product_id)
+             .where(or_(snaps.c.as_of.is_(None), L.timestamp > snaps.c.as_of))
+             .group_by(L.product_id))
+    if as_of is not None:
+        delta = delta.where(L.timestamp <= as_of)
+    if product_ids is not None:
+        delta = delta.where(L.product_id.in_(product_ids))
+    deltas = {pid: int(q or 0) for pid, q in db.session.execute(delta)}
+    return base, deltas
+
+
+def ledger_balances(as_of=None, product_ids=None):
+    """{product_id: on-hand per the ledger} at as_of (default: now, including every row)."""
+    base, deltas = _snapshots_and_deltas(as_of, product_ids)
+    out = {pid: qty for pid, (_, qty) in base.items()}
+    for pid, d in deltas.items():
+        out[pid] = out.get(pid, 0) + d
+    return out
+
+
+def take_stock_snapshots(as_of=None):
+    """Snapshot every product whose ledger moved since its last snapshot; returns the count."""
+    as_of = as_of or (datetime.utcnow() - timedelta(seconds=SNAPSHOT_LAG_SECONDS))
+    base, deltas = _snapshots_and_deltas(as_of)
+    rows = [{'product_id': pid, 'as_of': as_of, 'qty': base.get(pid, (None, 0))[1] + d, 'created_at': datetime.utcnow()}
+            for pid, d in deltas.items()]
+    bulk_insert_rows(StockSnapshot, rows)
+    db.session.commit()
+    return len(rows)
+
+
+def post_opening_balances(products):
+    """Ledger entries for the initial stock_qty of newly created (product_id, qty) pairs (no commit)."""
+    post_ledger_entries([{'product_id': pid, 'movement_type': 'in' if qty > 0 else 'out',
+                          'quantity': abs(qty), 'reference': f'INIT:{pid}'} for pid, qty in products if qty])
+
+
+def stock_drift(product_ids=None):
+    """Products whose stock_qty differs from the ledger balance."""
+    balances = ledger_balances(None, product_ids)
+    stmt = select(Product.id, Product.stock_qty)
+    if product_ids is not None:
+        stmt = stmt.where(Product.id.in_(product_ids))
+    return [{'product_id': pid, 'stock_qty': qty or 0, 'ledger_qty': balances.get(pid, 0),
+             'drift': (qty or 0) - balances.get(pid, 0)}
+            for pid, qty in db.session.execute(stmt) if (qty or 0) != balances.get(pid, 0)]
+
+
+def _product_ids_arg():
+    raw = request.args.get('product_id')
+    return [int(x) for x in raw.split(',') if x.strip()] if raw else None
+
 
 @app.route("/api/stock", methods=["GET","POST"])
 def stock():
@@ -471,30 +1004,549 @@ def stock():
         d=request.json
         entry=StockLedger(product_id=int(d["product_id"]), movement_type=d["movement_type"], quantity=int(d["quantity"]), reference=d.get("reference"))
         db.session.add(entry)
-        prod=Product.query.get(int(d["product_id"]))
-        if prod:
-            if d["movement_type"]=="in": prod.stock_qty += int(d["quantity"])
-            else: prod.stock_qty -= int(d["quantity"])
+        # atomic stock_qty = stock_qty +/- q, no read-modify-write
+        apply_stock_deltas({entry.product_id: entry.quantity if entry.movement_type=="in" else -entry.quantity}, entry.reference)
         db.session.commit()
         return jsonify(to_dict(entry)),201
-    return jsonify([to_dict(s) for s in StockLedger.query.order_by(StockLedger.timestamp.desc()).limit(100).all()])
+    # newest first, 100 per page; ?product_id=, ?from=&to= (ISO), ?cursor= from X-Next-Cursor
+    filters=[]
+    try:
+        pids=_product_ids_arg()
+        if pids: filters.append(StockLedger.product_id.in_(pids))
+        if request.args.get("from"): filters.append(StockLedger.timestamp >= parse_datetime(request.args["from"]))
+        if request.args.get("to"): filters.append(StockLedger.timestamp <= parse_datetime(request.args["to"]))
+    except ValueError as e:
+        return jsonify({"error":str(e)}),400
+    return list_response(StockLedger, *filters, default_order='-timestamp', default_limit=100)
 
+
+@app.route("/api/stock/on-hand", methods=["GET"])
+def stock_on_hand():
+    # ?product_id=1,2 (default: all) &as_of=ISO datetime (default: now)
+    try:
+        pids=_product_ids_arg()
+        as_of=parse_datetime(request.args.get("as_of"))
+    except ValueError as e:
+        return jsonify({"error":str(e)}),400
+    balances=ledger_balances(as_of, pids)
+    if pids:
+        balances={pid:balances.get(pid,0) for pid in pids}
+    return jsonify({"as_of":as_of.isoformat() if as_of else None,"on_hand":{str(k):v for k,v in balances.items()}})
+
+
+@app.route("/api/stock/snapshots", methods=["POST"])
+@require_auth
+def stock_snapshots():
+    d=request.get_json(silent=True) or {}
+    try:
+        as_of=parse_datetime(d.get("as_of"))
+    except ValueError as e:
+        return jsonify({"error":str(e)}),400
+    return jsonify({"snapshots":take_stock_snapshots(as_of)}),201
+
+
+@app.route("/api/stock/reconcile", methods=["GET","POST"])
+def stock_reconcile():
+    # GET lists drift between Product.stock_qty and the ledger.
+    # POST {"apply": "set_stock"} resets stock_qty to the ledger balance;
+    # POST {"apply": "adjust_ledger"} posts ADJ entries so the ledger matches stock_qty (e.g. legacy data).
+    try:
+        pids=_product_ids_arg()
+    except ValueError:
+        return jsonify({"error":"product_id must be integers"}),400
+    drift=stock_drift(pids)
+    if request.method=="GET":
+        return jsonify({"drifted":len(drift),"products":drift})
+    if not g.get('user'):
+        return jsonify({'error':'authentication required'}),401
+    mode=(request.get_json(silent=True) or {}).get("apply")
+    if mode=="set_stock":
+        apply_stock_deltas({r["product_id"]:-r["drift"] for r in drift})
+    elif mode=="adjust_ledger":
+        post_ledger_entries([{"product_id":r["product_id"],"movement_type":"in" if r["drift"]>0 else "out",
+                              "quantity":abs(r["drift"]),"reference":"ADJ:reconcile"} for r in drift])
+    else:
+        return jsonify({"error":"apply must be 'set_stock' or 'adjust_ledger'"}),400
+    db.session.commit()
+    return jsonify({"fixed":len(drift),"products":drift})
+
+
+def availability(product_ids=None):
+    """{product_id: {on_hand, reserved, incoming, atp, projected}} from one indexed query."""
+    A = ProductAvailability
+    stmt = select(Product.id, Product.stock_qty, A.reserved, A.incoming).outerjoin(A, A.product_id == Product.id)
+    if product_ids is not None:
+        stmt = stmt.where(Product.id.in_(product_ids))
+    out = {}
+    for pid, on_hand, reserved, incoming in db.session.execute(stmt):
+        on_hand, reserved, incoming = on_hand or 0, reserved or 0, incoming or 0
+        out[pid] = {'on_hand': on_hand, 'reserved': reserved, 'incoming': incoming,
+                    'atp': on_hand - reserved, 'projected': on_hand - reserved + incoming}
+    return out
+
+
+@app.route("/api/atp", methods=["GET","POST"])
+@conditional_get('product', 'manufacturing_order')
+def atp():
+    # GET ?product_id=1,2 (default: all products)   or   POST {"product_ids": [...]} for long lists
+    try:
+        if request.method=="POST":
+            pids=[int(p) for p in (request.get_json(silent=True) or {}).get("product_ids") or []]
+        else:
+            pids=_product_ids_arg()
+    except (TypeError, ValueError):
+        return jsonify({"error":"product ids must be integers"}),400
+    rows=availability(pids)
+    out={"products":{str(k):v for k,v in rows.items()}}
+    if pids:
+        out["missing"]=[p for p in pids if p not in rows]
+    return jsonify(out)
+
+
+@app.route("/api/atp/<int:product_id>/reservations", methods=["GET"])
+def atp_reservations(product_id):
+    # open MOs holding the product, largest outstanding quantity first
+    R=MoReservation
+    rows=db.session.execute(select(R.mo_id, R.required, R.consumed, ManufacturingOrder.status, ManufacturingOrder.deadline)
+                            .join(ManufacturingOrder, ManufacturingOrder.id==R.mo_id).where(R.product_id==product_id)).all()
+    out=[{"mo_id":mo_id,"required":req,"consumed":cons,"outstanding":outstanding(req,cons),"status":status,
+          "deadline":deadline.isoformat() if deadline else None} for mo_id,req,cons,status,deadline in rows]
+    out.sort(key=lambda r:(-r["outstanding"],r["mo_id"]))
+    return jsonify({"product_id":product_id,"reserved":sum(r["outstanding"] for r in out),"reservations":out})
+
+
+@app.route("/api/atp/rebuild", methods=["POST"])
+@require_auth
+def atp_rebuild():
+    return jsonify({"open_mos":rebuild_availability()})
+
+# ---------------- REPORTS ----------------
 @app.route("/api/reports/orders", methods=["GET"])
+@conditional_get('manufacturing_order')
 def reports():
-    total=ManufacturingOrder.query.count()
-    completed=ManufacturingOrder.query.filter_by(status="done").count()
-    inprog=ManufacturingOrder.query.filter_by(status="in_progress").count()
-    planned=ManufacturingOrder.query.filter_by(status="planned").count()
-    return jsonify({"total":total,"completed":completed,"in_progress":inprog,"planned":planned})
+    # one GROUP BY instead of a COUNT per status
+    by_status={s or "":n for s,n in db.session.execute(select(ManufacturingOrder.status, func.count()).group_by(ManufacturingOrder.status))}
+    return jsonify({"total":sum(by_status.values()),"completed":by_status.get("done",0),
+                    "in_progress":by_status.get("in_progress",0),"planned":by_status.get("planned",0),
+                    "by_status":by_status})
+
+
+def _rollup_filters(args):
+    filters=[]
+    for arg, op in (("from", ReportRollup.day.__ge__), ("to", ReportRollup.day.__le__)):
+        if args.get(arg):
+            filters.append(op(datetime.strptime(args[arg], "%Y-%m-%d").date()))
+    if args.get("product_id"):
+        filters.append(ReportRollup.product_id==int(args["product_id"]))
+    if args.get("work_center") is not None:
+        filters.append(ReportRollup.work_center==args["work_center"])
+    return filters
+
+
+def _pack_metrics(out, metric, value):
+    if metric.startswith("mo:"):
+        # status buckets drop back to 0 when MOs move on; hide them
+        if value:
+            out.setdefault("mo_by_status", {})[metric[3:]] = int(value)
+    elif metric=="wo_completed":
+        out[metric]=int(value)
+    else:
+        out[metric]=value
+
+
+@app.route("/api/reports/daily", methods=["GET"])
+def reports_daily():
+    # rows of the rollup table pivoted per (day, product, work center); ?from=&to=YYYY-MM-DD, product_id, work_center
+    try:
+        filters=_rollup_filters(request.args)
+    except ValueError:
+        return jsonify({"error":"from/to must be YYYY-MM-DD and product_id an integer"}),400
+    t=ReportRollup
+    stmt=select(t.day, t.product_id, t.work_center, t.metric, t.value).where(*filters).order_by(t.day, t.product_id, t.work_center)
+    out=[]; cur=None
+    for day, pid, wc, metric, value in db.session.execute(stmt):
+        if cur is None or (cur["day"], cur["product_id"], cur["work_center"]) != (day.isoformat(), pid, wc):
+            cur={"day":day.isoformat(),"product_id":pid,"work_center":wc}
+            out.append(cur)
+        _pack_metrics(cur, metric, value)
+    return jsonify(out)
+
+
+@app.route("/api/reports/summary", methods=["GET"])
+def reports_summary():
+    # totals per metric over a date range, answered from the rollup table only
+    try:
+        filters=_rollup_filters(request.args)
+    except ValueError:
+        return jsonify({"error":"from/to must be YYYY-MM-DD and product_id an integer"}),400
+    out={"mo_by_status":{},"wo_completed":0,"wo_planned_mins":0,"wo_actual_mins":0,"stock_in":0,"stock_out":0}
+    stmt=select(ReportRollup.metric, func.sum(ReportRollup.value)).where(*filters).group_by(ReportRollup.metric)
+    for metric, value in db.session.execute(stmt):
+        _pack_metrics(out, metric, value or 0)
+    return jsonify(out)
+
+
+@app.route("/api/reports/rollups/rebuild", methods=["POST"])
+@require_auth
+def reports_rebuild_rollups():
+    return jsonify({"rebuilt_keys":rebuild_rollups()})
+
+# ---------------- EXPORT ----------------
+# Exports stream rows from a server-side cursor in EXPORT_CHUNK sized batches, so memory is
+# bounded by the chunk size rather than by the table size.
+EXPORT_CHUNK = int(os.environ.get("EXPORT_CHUNK", "2000"))
+
+# dataset -> (model, column used by from/to, columns filterable by exact match, download basename)
+EXPORT_DATASETS = {
+    "orders": (ManufacturingOrder, "created_at", ("status", "product_id", "assignee"), "mo_report"),
+    "work_orders": (WorkOrder, "start_time", ("status", "mo_id", "work_center"), "wo_report"),
+    "stock": (StockLedger, "timestamp", ("product_id", "movement_type"), "stock_ledger"),
+}
+EXPORT_MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _export_statement(dataset, args):
+    model, date_col, exact_cols, _ = EXPORT_DATASETS[dataset]
+    cols = model.__table__.columns
+    stmt = select(*cols).order_by(cols["id"])
+    for arg, op in (("from", "__ge__"), ("to", "__lt__")):
+        if args.get(arg):
+            day = datetime.strptime(args[arg], "%Y-%m-%d")
+            # "to" is inclusive of the whole day
+            stmt = stmt.where(getattr(cols[date_col], op)(day + timedelta(days=1) if arg == "to" else day))
+    for name in exact_cols:
+        if args.get(name):
+            stmt = stmt.where(cols[name] == args[name])
+    return list(cols), stmt.execution_options(yield_per=EXPORT_CHUNK)
+
+
+def _export_chunks(stmt):
+    for part in db.session.execute(stmt).partitions(EXPORT_CHUNK):
+        yield part
+
+
+def _stream_csv(columns, stmt):
+    ser = RowSerializer(columns)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(ser.keys)
+    for part in _export_chunks(stmt):
+        for row in part:
+            writer.writerow(ser.row(row).values())
+        yield buf.getvalue()
+        buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+
+def _write_xlsx(columns, stmt, fh, title):
+    from openpyxl import Workbook  # lazy: only needed for xlsx exports
+    wb = Workbook(write_only=True)  # rows are flushed to disk as they are appended
+    ws = wb.create_sheet(title)
+    ws.append([c.name for c in columns])
+    for part in _export_chunks(stmt):
+        for row in part:
+            ws.append(list(row))
+    wb.save(fh)
+
+
+def _write_parquet(columns, stmt, fh):
+    import pyarrow as pa, pyarrow.parquet as pq  # optional dependency
+    def arrow_type(col):
+        if isinstance(col.type, db.DateTime): return pa.timestamp("us")
+        if isinstance(col.type, db.Integer): return pa.int64()
+        if isinstance(col.type, db.Float): return pa.float64()
+        return pa.string()
+    schema = pa.schema([(c.name, arrow_type(c)) for c in columns])
+    with pq.ParquetWriter(fh, schema) as writer:
+        for part in _export_chunks(stmt):
+            # one row group per chunk
+            arrays = [pa.array(vals, type=f.type) for f, vals in zip(schema, zip(*part))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
 
 @app.route("/api/reports/export", methods=["GET"])
+@require_auth
 def export_report():
-    mos=ManufacturingOrder.query.all()
-    rows=[to_dict(m) for m in mos]
-    df=pd.DataFrame(rows)
-    tmp=tempfile.NamedTemporaryFile(delete=False,suffix=".xlsx")
-    df.to_excel(tmp.name,index=False)
-    return send_file(tmp.name,as_attachment=True,download_name="mo_report.xlsx")
+    # ?dataset=orders|work_orders|stock &format=xlsx|csv|parquet &from=&to=YYYY-MM-DD plus per-dataset exact filters
+    dataset=request.args.get("dataset","orders")
+    fmt=request.args.get("format","xlsx").lower()
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({"error":"dataset must be one of: "+", ".join(EXPORT_DATASETS)}),400
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({"error":"format must be one of: "+", ".join(EXPORT_MIMETYPES)}),400
+    try:
+        columns, stmt = _export_statement(dataset, request.args)
+    except ValueError:
+        return jsonify({"error":"from/to must be YYYY-MM-DD"}),400
+    if wants_async():
+        # built by a job worker; download from the job's result_url once it is done
+        args={k:v for k,v in request.args.items() if k!="async"}
+        try:
+            job, created = enqueue_job('export', {'args':args}, request.headers.get("Idempotency-Key"), g.user.id)
+        except ValueError as e:
+            return jsonify({"error":str(e)}),409
+        return job_response(job, created)
+    download_name=f"{EXPORT_DATASETS[dataset][3]}.{fmt}"
+    if fmt=="csv":
+        return Response(stream_with_context(_stream_csv(columns, stmt)), mimetype=EXPORT_MIMETYPES[fmt],
+                        headers={"Content-Disposition":f"attachment; filename={download_name}"})
+    # xlsx and parquet are zip/columnar containers that must be finalized before sending;
+    # they are written incrementally to an anonymous temp file that is removed when closed
+    fh=tempfile.TemporaryFile()
+    try:
+        if fmt=="xlsx":
+            _write_xlsx(columns, stmt, fh, dataset)
+        else:
+            try:
+                _write_parquet(columns, stmt, fh)
+            except ImportError:
+                fh.close()
+                return jsonify({"error":"parquet export requires pyarrow to be installed"}),501
+    except Exception:
+        fh.close()
+        raise
+    fh.seek(0)
+    return send_file(fh,mimetype=EXPORT_MIMETYPES[fmt],as_attachment=True,download_name=download_name)
+
+
+# ---------------- JOB HANDLERS ----------------
+# Jobs whose work lives in this module; the queue and the runner are in jobs.py.
+def _claim_mo_confirmation(mo_id):
+    """Move a planned MO to confirmed in the current transaction (no commit).
+
+    Returns the MO's (product_id, quantity), or None when it was no longer planned: a
+    concurrent or earlier run already confirmed it, and only that run generates and consumes.
+    """
+    M = ManufacturingOrder.__table__
+    mo = db.session.execute(select(M.c.product_id, M.c.quantity, M.c.created_at).where(M.c.id == mo_id)).first()
+    if mo is None:
+        raise ValueError(f'MO {mo_id} not found')
+    claimed = db.session.execute(M.update().where(M.c.id == mo_id, M.c.status == 'planned').values(status='confirmed'))
+    if claimed.rowcount != 1:
+        return None
+    # a Core update bypasses the ORM flush listeners: reserve, roll up and publish directly
+    conn = db.session.connection()
+    sync_reservations(conn, [(mo_id, (mo.product_id, mo.quantity, 'planned'), (mo.product_id, mo.quantity, 'confirmed'))])
+    deltas = defaultdict(float)
+    for status, sign in (('planned', -1), ('confirmed', 1)):
+        for key, d in rollup_contrib(ManufacturingOrder, (mo.created_at, mo.product_id, status)):
+            deltas[key] += sign * d
+    apply_rollup_deltas(conn, deltas)
+    touch_resources(db.session, 'manufacturing_order')
+    record_change('order', 'update', mo_id, to_dict(db.session.get(ManufacturingOrder, mo_id, populate_existing=True)))
+    return mo
+
+
+def _job_confirm_mo(params, job_id):
+    # the MO's planned -> confirmed step, generation, consumption and the job's result commit
+    # together: a retry after a lost worker finds the result, and a second job for the same
+    # MO (or a concurrent run of this one) finds it confirmed and does nothing.
+    J = Job.__table__
+    done = db.session.execute(select(J.c.result).where(J.c.id == job_id)).scalar()
+    if done:
+        return done
+    mo_id = int(params['mo_id'])
+    mo = _claim_mo_confirmation(mo_id)
+    if mo is None:
+        result = {'mo_id': mo_id, 'work_orders': 0, 'consumed': False, 'skipped': 'MO is not planned'}
+        # a concurrent run of this job that did the work keeps its result
+        db.session.execute(J.update().where(J.c.id == job_id, J.c.result.is_(None)).values(result=result))
+        db.session.commit()
+        return db.session.execute(select(J.c.result).where(J.c.id == job_id)).scalar()
+    generated = generate_work_orders([(mo_id, mo.product_id)])
+    comps = bom_components_for(mo.product_id)
+    if isinstance(comps, list):
+        consume_components(comps, mo.quantity or 1, f'MO:{mo_id}', params.get('check_stock'), mo_id)
+    result = {'mo_id': mo_id, 'work_orders': generated, 'consumed': isinstance(comps, list)}
+    db.session.execute(J.update().where(J.c.id == job_id).values(result=result))
+    db.session.commit()
+    return result
+
+
+def _job_generate_work_orders(params, job_id):
+    mo_ids = [int(i) for i in params.get('mo_ids') or []]
+    if not mo_ids:
+        raise ValueError('mo_ids required')
+    have = set(db.session.execute(select(WorkOrder.mo_id).where(WorkOrder.mo_id.in_(mo_ids)).distinct()).scalars())
+    mos = db.session.execute(select(ManufacturingOrder.id, ManufacturingOrder.product_id)
+                             .where(ManufacturingOrder.id.in_(mo_ids))).all()
+    n = generate_work_orders([(mo_id, pid) for mo_id, pid in mos if mo_id not in have])
+    db.session.commit()
+    return {'work_orders': n, 'skipped_mos': sorted(have), 'missing_mos': sorted(set(mo_ids) - {m for m, _ in mos})}
+
+
+def _job_export(params, job_id):
+    args = params.get('args') or {}
+    dataset, fmt = args.get('dataset', 'orders'), args.get('format', 'xlsx').lower()
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_MIMETYPES:
+        raise ValueError('unknown dataset or format')
+    columns, stmt = _export_statement(dataset, args)
+    os.makedirs(JOB_RESULT_DIR, exist_ok=True)
+    path = os.path.join(JOB_RESULT_DIR, f'job-{job_id}.{fmt}')
+    # written under a temporary name so a half-written file is never served
+    with open(path + '.part', 'wb') as fh:
+        if fmt == 'csv':
+            for chunk in _stream_csv(columns, stmt):
+                fh.write(chunk.encode())
+        elif fmt == 'xlsx':
+            _write_xlsx(columns, stmt, fh, dataset)
+        else:
+            try:
+                _write_parquet(columns, stmt, fh)
+            except ImportError:
+                raise ValueError('parquet export requires pyarrow to be installed')
+    os.replace(path + '.part', path)
+    return {'file': os.path.basename(path), 'bytes': os.path.getsize(path), 'mimetype': EXPORT_MIMETYPES[fmt],
+            'download_name': f"{EXPORT_DATASETS[dataset][3]}.{fmt}"}
+
+
+# queued by POST /api/orders only
+INTERNAL_JOB_KINDS.add('confirm_mo')
+JOB_HANDLERS.update({
+    'confirm_mo': _job_confirm_mo,
+    'generate_work_orders': _job_generate_work_orders,
+    'export': _job_export,
+})
+
+
+# ---------------- SEARCH ----------------
+# GET /api/search?q=ass wc3&types=products,work_orders&limit=20&status=planned
+# Every word of q must match the start of a word in the indexed columns ("ass" finds
+# "assembly"). The newest SEARCH_RANK_WINDOW matches are ranked by search_score, ties
+# newest first. Extra query args are exact filters on the SEARCH_SPECS filter
+# columns; types without a requested filter column are left out. Orders are only searched
+# for authenticated users. Without a full-text index the search falls back to LIKE.
+SEARCH_MAX_TERMS = int(os.environ.get("SEARCH_MAX_TERMS", "8"))
+SEARCH_DEFAULT_LIMIT = int(os.environ.get("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.environ.get("SEARCH_MAX_LIMIT", "200"))
+SEARCH_RANK_WINDOW = int(os.environ.get("SEARCH_RANK_WINDOW", "1000"))
+
+_search_modes = {}
+
+
+def search_mode(table_name):
+    """'fts5', 'fulltext' or 'like' for a searchable table (detected once per process)."""
+    mode = _search_modes.get(table_name)
+    if mode is None:
+        dialect = db.engine.dialect.name
+        mode = 'like'
+        if dialect == 'sqlite':
+            found = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"),
+                                       {'n': f'{table_name}_fts'}).first()
+            mode = 'fts5' if found else 'like'
+        elif dialect == 'mysql':
+            names = {ix['name'] for ix in inspect(db.engine).get_indexes(table_name)}
+            mode = 'fulltext' if f'ft_{table_name}' in names else 'like'
+        _search_modes[table_name] = mode
+    return mode
+
+
+def search_terms(q):
+    return re.findall(r'\w+', (q or '').lower())[:SEARCH_MAX_TERMS]
+
+
+def search_score(values, terms):
+    """Relevance of one row: per term, a whole-word hit counts 2 and a prefix hit 1, scaled
+    down for later columns and longer fields. Rows missing a term score 0."""
+    fields = [re.findall(r'\w+', v.lower()) if isinstance(v, str) else [] for v in values]
+    total = 0.0
+    for term in terms:
+        best = 0.0
+        for i, tokens in enumerate(fields):
+            hit = 2.0 if term in tokens else 1.0 if any(tok.startswith(term) for tok in tokens) else 0.0
+            if hit:
+                best = max(best, hit / (i + 1) / len(tokens) ** 0.5)
+        if not best:
+            return 0.0
+        total += best
+    return total
+
+
+def search_rows(kind, terms, filters, limit):
+    """Ranked rows of one SEARCH_SPECS type: (list of dicts with a 'score', search mode)."""
+    model, cols, _ = SEARCH_SPECS[kind]
+    t = model.__table__
+    mode = search_mode(t.name)
+    conds = [t.c[name] == value for name, value in filters.items()]
+    if mode == 'fts5' and any(isinstance(t.c[name].type, db.Integer) for name in filters):
+        # an id filter (mo_id, product_id, created_by) leaves a few rows on its index;
+        # checking those with LIKE is cheaper than seeking each one in the FTS index
+        mode = 'like'
+    # candidates: the newest SEARCH_RANK_WINDOW matches, ranked below in Python. Ranking in
+    # SQL (bm25, MATCH relevance) reads every match of a common prefix to weigh the terms.
+    cand = select(t.c.id, *[t.c[c] for c in cols])
+    if mode == 'fts5':
+        fts_name = f'{t.name}_fts'
+        fts = table(fts_name, column('rowid'), column(fts_name))
+        # quoted tokens with a trailing * are prefix queries served by the FTS5 prefix index;
+        # single characters only match whole tokens
+        query = ' '.join(f'"{term}"*' if len(term) > 1 else f'"{term}"' for term in terms)
+        hits = select(fts.c.rowid).select_from(fts).where(fts.c[fts_name].op('MATCH')(query))
+        if conds:
+            hits = hits.join(t, t.c.id == fts.c.rowid).where(*conds)
+        hits = hits.order_by(fts.c.rowid.desc()).limit(SEARCH_RANK_WINDOW).subquery()
+        cand = cand.join(hits, hits.c.rowid == t.c.id)
+    else:
+        if mode == 'fulltext':
+            from sqlalchemy.dialects.mysql import match  # MySQL only; SQLite workers never load it
+            cand = cand.where(match(*[t.c[c] for c in cols],
+                                    against=' '.join(f'+{term}*' for term in terms)).in_boolean_mode())
+        else:
+            for term in terms:
+                esc = term.replace('_', '\\_')  # terms are \w+ so '_' is the only LIKE wildcard
+                cand = cand.where(or_(*[or_(t.c[c].ilike(f'{esc}%', escape='\\'), t.c[c].ilike(f'% {esc}%', escape='\\'))
+                                        for c in cols]))
+        cand = cand.where(*conds).order_by(t.c.id.desc()).limit(SEARCH_RANK_WINDOW)
+    scored = sorted(((search_score(r[1:], terms), r[0]) for r in db.session.execute(cand)), reverse=True)
+    top = [(score, id_) for score, id_ in scored[:limit] if score]
+    if not top:
+        return [], mode
+    ser = get_serializer(model)
+    by_id = {r[0]: ser.row(r) for r in db.session.execute(select(*t.columns).where(t.c.id.in_([i for _, i in top])))}
+    out = []
+    for score, id_ in top:
+        row = by_id[id_]
+        row['score'] = round(score, 4)
+        out.append(row)
+    return out, mode
+
+
+@app.route("/api/search", methods=["GET"])
+def search():
+    terms = search_terms(request.args.get("q"))
+    if not terms:
+        return jsonify({"error":"q required"}),400
+    try:
+        limit = min(max(int(request.args.get("limit", SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error":"limit must be an integer"}),400
+    if request.args.get("types"):
+        kinds = [k.strip() for k in request.args["types"].split(",") if k.strip()]
+        unknown = [k for k in kinds if k not in SEARCH_SPECS]
+        if unknown:
+            return jsonify({"error":f"unknown types: {', '.join(unknown)}"}),400
+        if 'orders' in kinds and not g.get('user'):
+            return jsonify({'error':'authentication required'}),401
+    else:
+        kinds = [k for k in SEARCH_SPECS if k != 'orders' or g.get('user')]
+    filter_names = {f for _, _, fs in SEARCH_SPECS.values() for f in fs}
+    filters = {k: v for k, v in request.args.items() if k in filter_names}
+    kinds = [k for k in kinds if set(filters) <= set(SEARCH_SPECS[k][2])]
+    started = time.perf_counter()
+    results, modes = {}, {}
+    for kind in kinds:
+        cols = SEARCH_SPECS[kind][0].__table__.columns
+        try:
+            typed = {k: cols[k].type.python_type(v) for k, v in filters.items()}
+        except ValueError:
+            return jsonify({"error":"invalid filter value"}),400
+        results[kind], modes[kind] = search_rows(kind, terms, typed, limit)
+    return jsonify({"query": terms, "results": results, "mode": modes,
+                    "took_ms": round((time.perf_counter() - started) * 1000, 2)})
 
 
 @app.route('/api/sample/create', methods=['POST'])
@@ -505,18 +1557,17 @@ def create_sample():
     # This endpoint is for local testing only.
     comp = Product(name='component-A', type='raw', stock_qty=100)
     prod = Product(name='finished-widget', type='finished', stock_qty=0)
-    db.session.add_all([comp, prod]); db.session.commit()
+    db.session.add_all([comp, prod]); db.session.flush()
+    post_opening_balances([(comp.id, comp.stock_qty)])
+    db.session.commit()
     # BOM: 1 finished requires 2 components
     bom = BOM(product_id=prod.id, components=[{'product_id': comp.id, 'qty': 2}], operations=[{'name':'op1','work_center':'WC1','time':10}])
     db.session.add(bom); db.session.commit()
     # create MO with status=confirmed to auto-generate WOs
     mo = ManufacturingOrder(product_id=prod.id, quantity=3, status='confirmed')
     db.session.add(mo); db.session.commit()
-    # generate WOs now (duplicate logic to ensure generation if not triggered)
-    ops = bom.operations or []
-    for op in ops:
-        wo = WorkOrder(mo_id=mo.id, operation=op.get('name'), work_center=op.get('work_center'), planned_time_mins=int(op.get('time',0)))
-        db.session.add(wo)
+    # generate WOs now
+    generate_work_orders([(mo.id, prod.id)])
     db.session.commit()
     # find first WO and mark completed to trigger stock consumption
     first_wo = WorkOrder.query.filter_by(mo_id=mo.id).first()
@@ -530,6 +1581,29 @@ def create_sample():
             return jsonify({'error':'sample stock consumption failed','details':err}),500
     return jsonify({'sample_created':True,'product_id':prod.id,'component_id':comp.id,'mo_id':mo.id})
 
+@app.route('/api/metrics/pool', methods=['GET'])
+def pool_metrics():
+    return jsonify(pool_stats.snapshot())
+
+
 if __name__=="__main__":
-    print("✅ Backend running on http://127.0.0.1:5000")
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    with app.app_context():
+        try:
+            init_db()
+        except MigrationError as e:
+            # never serve (or report a deploy step as done) on a half-migrated schema
+            print("❌", e)
+            sys.exit(1)
+    if sys.argv[1:] == ["init-db"]:
+        sys.exit(0)
+    port = int(os.environ.get("PORT", "5000"))
+    # SERVE_MODE=waitress runs a multi-threaded production server; for multi-process use
+    # gunicorn -c gunicorn.conf.py wsgi:app (see README)
+    if os.environ.get("SERVE_MODE", "dev") == "waitress":
+        from waitress import serve
+        threads = int(os.environ.get("WAITRESS_THREADS", "16"))
+        print(f"✅ Backend (waitress, {threads} threads) running on http://127.0.0.1:{port}")
+        serve(app, host="0.0.0.0", port=port, threads=threads)
+    else:
+        print(f"✅ Backend running on http://127.0.0.1:{port}")
+        app.run(debug=os.environ.get("FLASK_DEBUG", "1") == "1", host="0.0.0.0", port=port)
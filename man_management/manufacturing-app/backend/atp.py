@@ -0,0 +1,216 @@
+import os
+from collections import defaultdict
+from sqlalchemy import inspect, select, or_, func, event, bindparam
+from sqlalchemy.orm import Session
+
+from core import db
+from models import BOM, ManufacturingOrder, StockLedger, WorkOrder
+from versions import touch_resources
+from rollups import history_old
+
+
+# ---------------- AVAILABILITY (ATP) ----------------
+# Available-to-promise per product, maintained incrementally instead of replaying BOMs
+# against every open MO:
+#   on_hand    Product.stock_qty (maintained by apply_stock_deltas)
+#   reserved   components open MOs still have to consume: first-level BOM x quantity,
+#              minus what has been consumed for the MO so far
+#   incoming   quantity of open MOs making the product
+#   atp = on_hand - reserved, projected = atp + incoming
+# mo_reservation holds each open MO's requirement per component, so closing, deleting or
+# resizing an MO releases exactly what it reserved; product_availability holds the sums.
+# ORM writes are picked up in after_flush (same transaction), Core bulk inserts call
+# sync_reservations() directly and consumption calls record_consumption(). The requirement
+# is taken from the BOM when the MO opens; later BOM edits only apply after a rebuild.
+ATP_OPEN_STATUSES = tuple(s.strip() for s in os.environ.get("ATP_OPEN_STATUSES", "confirmed,in_progress").split(",") if s.strip())
+
+
+class MoReservation(db.Model):
+    __tablename__ = 'mo_reservation'
+    __table_args__ = (db.Index('ix_mo_reservation_product', 'product_id'),)
+    mo_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    required = db.Column(db.Integer, nullable=False, default=0)
+    consumed = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ProductAvailability(db.Model):
+    __tablename__ = 'product_availability'
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    reserved = db.Column(db.Integer, nullable=False, default=0)
+    incoming = db.Column(db.Integer, nullable=False, default=0)
+
+
+# MO columns a reservation depends on
+_ATP_ATTRS = ('product_id', 'quantity', 'status')
+
+
+def component_needs(components, multiplier):
+    """{product_id: quantity} that components (a BOM components list) times multiplier consume."""
+    need = defaultdict(int)
+    for c in components if isinstance(components, list) else []:
+        need[int(c.get('product_id'))] += int(float(c.get('qty', 1)) * float(multiplier))
+    return need
+
+
+def outstanding(required, consumed):
+    return max(0, (required or 0) - (consumed or 0))
+
+
+def _availability_upsert_stmt(dialect):
+    t = ProductAvailability.__table__
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(t)
+        return stmt.on_duplicate_key_update(reserved=t.c.reserved + stmt.inserted.reserved,
+                                            incoming=t.c.incoming + stmt.inserted.incoming)
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    stmt = dialect_insert(t)
+    return stmt.on_conflict_do_update(index_elements=[t.c.product_id],
+                                      set_={'reserved': t.c.reserved + stmt.excluded.reserved,
+                                            'incoming': t.c.incoming + stmt.excluded.incoming})
+
+
+def apply_availability_deltas(conn, reserved, incoming):
+    """Atomically add {product_id: delta} to product_availability.reserved / .incoming using conn."""
+    pids = {p for p, d in reserved.items() if d} | {p for p, d in incoming.items() if d}
+    params = [{'product_id': p, 'reserved': reserved.get(p, 0), 'incoming': incoming.get(p, 0)}
+              for p in pids if p is not None]
+    if params:
+        conn.execute(_availability_upsert_stmt(conn.dialect.name), params)
+
+
+def _is_open(state):
+    return state is not None and state[2] in ATP_OPEN_STATUSES
+
+
+def _reservation_changed(old, new):
+    # only opening, closing or resizing an open MO moves reservations
+    if not _is_open(old) and not _is_open(new):
+        return False
+    return not (_is_open(old) and _is_open(new) and tuple(old[:2]) == tuple(new[:2]))
+
+
+def sync_reservations(conn, changes):
+    """Apply MO writes [(mo_id, old, new)] to the reservations using conn.
+
+    old / new are the MO's (product_id, quantity, status) before and after the write, None
+    when it did not / no longer exists. Quantities already consumed for an MO that stays
+    open are carried over.
+    """
+    R = MoReservation.__table__
+    reserved, incoming = defaultdict(int), defaultdict(int)
+    consumed = {}
+    was_open = [mo_id for mo_id, old, _ in changes if _is_open(old)]
+    if was_open:
+        for mo_id, pid, req, cons in conn.execute(
+                select(R.c.mo_id, R.c.product_id, R.c.required, R.c.consumed).where(R.c.mo_id.in_(was_open))):
+            reserved[pid] -= outstanding(req, cons)
+            consumed[(mo_id, pid)] = cons
+        conn.execute(R.delete().where(R.c.mo_id.in_(was_open)))
+        for _, old, _ in changes:
+            if _is_open(old):
+                incoming[old[0]] -= int(old[1] or 1)
+    opened = [(mo_id, new) for mo_id, _, new in changes if _is_open(new)]
+    if opened:
+        comps = {}
+        for pid, val in conn.execute(select(BOM.product_id, BOM.components)
+                                     .where(BOM.product_id.in_({new[0] for _, new in opened})).order_by(BOM.id)):
+            comps.setdefault(pid, val)
+        rows = []
+        for mo_id, (pid, qty, _) in opened:
+            qty = int(qty or 1)
+            incoming[pid] += qty
+            for cid, q in component_needs(comps.get(pid), qty).items():
+                cons = consumed.get((mo_id, cid), 0)
+                rows.append({'mo_id': mo_id, 'product_id': cid, 'required': q, 'consumed': cons})
+                reserved[cid] += outstanding(q, cons)
+        if rows:
+            conn.execute(R.insert(), rows)
+    apply_availability_deltas(conn, reserved, incoming)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_availability_after_flush(session, flush_context):
+    # same transaction as the MO write, like the report rollups
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, ManufacturingOrder):
+            changes.append((obj.id, None, (obj.product_id, obj.quantity, obj.status or 'planned')))
+    for obj in session.deleted:
+        if isinstance(obj, ManufacturingOrder):
+            state = inspect(obj)
+            changes.append((obj.id, tuple(history_old(state, a) for a in _ATP_ATTRS), None))
+    for obj in session.dirty:
+        if not isinstance(obj, ManufacturingOrder):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[a].history.has_changes() for a in _ATP_ATTRS):
+            changes.append((obj.id, tuple(history_old(state, a) for a in _ATP_ATTRS),
+                            tuple(getattr(obj, a) for a in _ATP_ATTRS)))
+    changes = [c for c in changes if _reservation_changed(c[1], c[2])]
+    if changes:
+        sync_reservations(session.connection(), changes)
+
+
+def record_consumption(needs):
+    """Count consumed {mo_id: {product_id: quantity}} against the open MOs' reservations (no commit)."""
+    R = MoReservation.__table__
+    conn = db.session.connection()
+    # lock the rows (MySQL) so concurrent completions of the same MO release each unit once
+    rows = [r for r in conn.execute(select(R.c.mo_id, R.c.product_id, R.c.required, R.c.consumed)
+                                    .where(R.c.mo_id.in_(list(needs))).with_for_update())
+            if r.product_id in needs[r.mo_id]]
+    if not rows:
+        return
+    reserved = defaultdict(int)
+    for mo_id, pid, req, cons in rows:
+        reserved[pid] += outstanding(req, cons + needs[mo_id][pid]) - outstanding(req, cons)
+    conn.execute(R.update().where(R.c.mo_id == bindparam('b_mo'), R.c.product_id == bindparam('b_pid'))
+                 .values(consumed=R.c.consumed + bindparam('b_q')),
+                 [{'b_mo': mo_id, 'b_pid': pid, 'b_q': needs[mo_id][pid]} for mo_id, pid, _, _ in rows])
+    apply_availability_deltas(conn, reserved, {})
+
+
+def rebuild_availability():
+    """Recompute reservations and availability from the open MOs and the consumption posted for them."""
+    mos = {mo_id: (pid, qty) for mo_id, pid, qty in db.session.execute(
+        select(ManufacturingOrder.id, ManufacturingOrder.product_id, ManufacturingOrder.quantity)
+        .where(ManufacturingOrder.status.in_(ATP_OPEN_STATUSES)))}
+    # consumption is posted under MO:<id> (MO confirmation) or WO:<id> (WO completion)
+    ref_mo = {f'MO:{mo_id}': mo_id for mo_id in mos}
+    for wo_id, mo_id in db.session.execute(
+            select(WorkOrder.id, WorkOrder.mo_id).join(ManufacturingOrder, ManufacturingOrder.id == WorkOrder.mo_id)
+            .where(ManufacturingOrder.status.in_(ATP_OPEN_STATUSES))):
+        ref_mo[f'WO:{wo_id}'] = mo_id
+    consumed = defaultdict(int)
+    L = StockLedger
+    for ref, pid, qty in db.session.execute(
+            select(L.reference, L.product_id, func.sum(L.quantity))
+            .where(L.movement_type == 'out', or_(L.reference.like('MO:%'), L.reference.like('WO:%')))
+            .group_by(L.reference, L.product_id)):
+        if ref in ref_mo:
+            consumed[(ref_mo[ref], pid)] += int(qty or 0)
+    comps = {}
+    for pid, val in db.session.execute(select(BOM.product_id, BOM.components).order_by(BOM.id)):
+        comps.setdefault(pid, val)
+    rows = []
+    reserved, incoming = defaultdict(int), defaultdict(int)
+    for mo_id, (pid, qty) in mos.items():
+        qty = int(qty or 1)
+        incoming[pid] += qty
+        for cid, q in component_needs(comps.get(pid), qty).items():
+            cons = consumed.get((mo_id, cid), 0)
+            rows.append({'mo_id': mo_id, 'product_id': cid, 'required': q, 'consumed': cons})
+            reserved[cid] += outstanding(q, cons)
+    db.session.execute(MoReservation.__table__.delete())
+    db.session.execute(ProductAvailability.__table__.delete())
+    for lo in range(0, len(rows), 5000):
+        db.session.execute(MoReservation.__table__.insert(), rows[lo:lo + 5000])
+    apply_availability_deltas(db.session.connection(), reserved, incoming)
+    touch_resources(db.session, 'product', 'manufacturing_order')
+    db.session.commit()
+    return len(mos)
@@ -0,0 +1,189 @@
+from flask import request, jsonify, g
+from datetime import datetime, timedelta
+import os, secrets, threading, time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import select
+
+from core import app, db
+from models import User
+
+
+# ---------------- AUTH CACHE ----------------
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))  # seconds; 0 disables the cache
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "10000"))
+# seconds between checks for users whose token/identity changed in another worker
+AUTH_CACHE_SYNC = float(os.environ.get("AUTH_CACHE_SYNC", "1.0"))
+# overlap between checks, covering commit latency and clock skew between app servers
+AUTH_CACHE_SYNC_SLACK = 5
+
+# identity attached to g.user; plain values so it is safe to share across requests/sessions
+AuthUser = namedtuple('AuthUser', ['id', 'email', 'role', 'name'])
+
+
+class TokenCache:
+    """Bounded LRU cache of token -> AuthUser (or None for unknown tokens) with a TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # token -> (expires_at, AuthUser|None)
+        self._lock = threading.Lock()
+        self._synced = None  # (monotonic time of the last check, changed-since cutoff for the next)
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, token):
+        """Return (found, identity)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(token)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(token)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._data[token]
+            self.misses += 1
+            return False, None
+
+    def put(self, token, identity):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[token] = (time.monotonic() + self.ttl, identity)
+            self._data.move_to_end(token)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token):
+        if not token:
+            return
+        with self._lock:
+            if self._data.pop(token, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_user(self, *user_ids):
+        ids = set(user_ids)
+        with self._lock:
+            stale = [t for t, (_, ident) in self._data.items() if ident is not None and ident.id in ids]
+            for t in stale:
+                del self._data[t]
+            self.invalidations += len(stale)
+
+    def sync_due(self, interval):
+        """Claim the periodic check for changed users; returns the cutoff to check from, or None."""
+        now = time.monotonic()
+        with self._lock:
+            if self._synced is not None and now - self._synced[0] < interval:
+                return None
+            since = self._synced[1] if self._synced else None
+            self._synced = (now, datetime.utcnow() - timedelta(seconds=AUTH_CACHE_SYNC_SLACK))
+            return since
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._synced = None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'ttl_seconds': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'hit_ratio': (self.hits / total) if total else 0.0}
+
+
+token_cache = TokenCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+# ---------------- AUTH ----------------
+@app.route('/api/auth/signup', methods=['POST'])
+def signup():
+    d = request.json
+    if not d.get('email') or not d.get('password'):
+        return jsonify({'error':'email and password required'}),400
+    if User.query.filter_by(email=d['email']).first():
+        return jsonify({'error':'user exists'}),400
+    u = User(email=d['email'], name=d.get('name'), role=d.get('role','Operator'))
+    u.set_password(d['password'])
+    u.generate_token()
+    db.session.add(u); db.session.commit()
+    return jsonify({'token':u.token,'id':u.id,'role':u.role}),201
+
+
+@app.route('/api/auth/login', methods=['POST'])
+def login():
+    d = request.json
+    u = User.query.filter_by(email=d.get('email')).first()
+    if not u or not u.check_password(d.get('password','')):
+        return jsonify({'error':'invalid creds'}),401
+    token = u.generate_token()
+    db.session.commit()
+    # a concurrent request may have re-cached the old token before the commit landed
+    token_cache.invalidate_user(u.id)
+    return jsonify({'token':token,'role':u.role,'id':u.id})
+
+
+@app.route('/api/auth/forgot', methods=['POST'])
+def forgot():
+    d = request.json
+    u = User.query.filter_by(email=d.get('email')).first()
+    if not u: return jsonify({'ok':True})
+    code = str(secrets.randbelow(1000000)).zfill(6)
+    u.otp_code = code
+    u.otp_expiry = datetime.utcnow() + timedelta(minutes=10)
+    db.session.commit()
+    # In production, send email. For now return code in response for local dev.
+    return jsonify({'otp':code})
+
+
+def require_token():
+    t = request.headers.get('Authorization')
+    if not t: return None
+    if t.startswith('Bearer '): t = t.split(' ',1)[1]
+    if not t: return None
+    if token_cache.enabled:
+        # token rotations and role changes in any worker stamp user.auth_changed_at; drop
+        # only those users' cached identities (within AUTH_CACHE_SYNC seconds)
+        since = token_cache.sync_due(AUTH_CACHE_SYNC)
+        if since is not None:
+            changed = db.session.execute(select(User.id).where(User.auth_changed_at >= since)).scalars().all()
+            if changed:
+                token_cache.invalidate_user(*changed)
+    found, ident = token_cache.get(t)
+    if found:
+        return ident
+    row = db.session.execute(select(User.id, User.email, User.role, User.name).where(User.token == t)).first()
+    ident = AuthUser(*row) if row else None
+    # unknown tokens are cached too so bad/expired tokens do not hammer the DB
+    token_cache.put(t, ident)
+    return ident
+
+
+@app.before_request
+def attach_user():
+    # CORS preflights and anonymous requests never touch the users table
+    if request.method == 'OPTIONS' or 'Authorization' not in request.headers:
+        g.user = None
+        return
+    g.user = require_token()
+
+
+@app.route('/api/auth/cache-stats', methods=['GET'])
+def auth_cache_stats():
+    return jsonify(token_cache.stats())
+
+
+def require_auth(func):
+    from functools import wraps
+    @wraps(func)
+    def wrapper(*a, **kw):
+        if not g.get('user'):
+            return jsonify({'error':'authentication required'}),401
+        return func(*a, **kw)
+    return wrapper
@@ -0,0 +1,331 @@
+"""Load test of the HTTP API: throughput and latency percentiles per scenario, as JSON.
+
+By default the app runs in process (Flask test client, one client per thread) on a
+throwaway SQLite database filled by benchmarks/datagen.py. With --url the same scenarios
+run over HTTP against a running server, whose database must already hold data.
+
+    python benchmarks/api_load.py --scale 1 --requests 300 --out bench.json
+    python benchmarks/api_load.py --baseline bench.json --tolerance 0.25   # exit 1 on regressions
+    python benchmarks/api_load.py --url http://127.0.0.1:5000 --scenarios list_products,reports
+
+Scenarios: list_products, list_work_orders, list_orders, poll_products (If-None-Match),
+confirm_mo (MO confirmation + WO generation + stock consumption), complete_wo (concurrent
+WO completions), reports, mrp, export_csv, export_xlsx, and the response-cache hit paths
+list_products_cached, list_work_orders_cached and reports_cached.
+
+Only the *_cached scenarios may be answered from the response cache. In process the cache
+is switched off for all others (as with RESPONSE_CACHE_SIZE=0); over --url their GETs carry
+a unique _bench= argument so every request misses it.
+"""
+import argparse, json, math, os, platform, statistics, subprocess, sys, tempfile, threading, time
+import urllib.error, urllib.request
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+# make(ctx, i) -> (method, path, json body or None, extra headers or None);
+# cached: the scenario measures response-cache hits, all others bypass the cache
+Scenario = namedtuple("Scenario", ["name", "concurrency", "share", "make", "cached"], defaults=(False,))
+
+
+class InProcessClient:
+    """Flask test client per thread; bodies are read and closed so streamed responses finish."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        c = getattr(self._local, "client", None)
+        if c is None:
+            c = self._local.client = self.app.test_client()
+        resp = c.open(path, method=method, json=body, headers=headers or {})
+        try:
+            data = resp.get_data()
+            return resp.status_code, data, resp.headers
+        finally:
+            resp.close()
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base = base_url.rstrip("/")
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method, headers=dict(headers or {}))
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                return resp.status, resp.read(), resp.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+
+def _get_json(client, path, headers=None):
+    status, data, hdrs = client.request("GET", path, headers=headers)
+    if status != 200:
+        raise RuntimeError(f"GET {path} -> {status}: {data[:200]!r}")
+    return json.loads(data), hdrs
+
+
+def _walk_ids(client, path, limit, headers=None):
+    """ids (and the page cursors) of a keyset-paginated list, up to limit rows."""
+    ids, cursors, cursor = [], [None], None
+    while len(ids) < limit:
+        rows, hdrs = _get_json(client, path + (f"&cursor={cursor}" if cursor else ""), headers)
+        ids += [r["id"] for r in rows]
+        cursor = hdrs.get("X-Next-Cursor")
+        if not cursor:
+            break
+        cursors.append(cursor)
+    return ids[:limit], cursors
+
+
+def build_context(client, requests):
+    """Log in a bench user and collect the ids the scenarios work on."""
+    email = f"bench-{time.time_ns()}@example.com"
+    status, data, _ = client.request("POST", "/api/auth/signup", {"email": email, "password": "bench", "role": "Admin"})
+    if status != 201:
+        raise RuntimeError(f"signup failed: {status} {data[:200]!r}")
+    auth = {"Authorization": "Bearer " + json.loads(data)["token"]}
+    boms, _ = _get_json(client, "/api/bom?fields=product_id&limit=5000")
+    finished = sorted({b["product_id"] for b in boms})
+    if not finished:
+        raise RuntimeError("no BOMs in the database; seed it with benchmarks/datagen.py first")
+    planned, _ = _walk_ids(client, "/api/work-orders?status=planned&fields=id&limit=5000", requests)
+    _, product_pages = _walk_ids(client, "/api/products?fields=id&limit=100", 100 * 50)
+    _, order_pages = _walk_ids(client, "/api/orders?fields=id&limit=100", 100 * 50, auth)
+    _, etag_hdrs = _get_json(client, "/api/products?limit=100")
+    return {"auth": auth, "finished": finished, "planned_wos": planned, "product_pages": product_pages,
+            "order_pages": order_pages, "products_etag": etag_hdrs.get("ETag")}
+
+
+def _page(path, cursors, i):
+    cursor = cursors[i % len(cursors)]
+    return path + (f"&cursor={cursor}" if cursor else "")
+
+
+def _export_path(dataset, fmt, i):
+    # a different date window per request, so consecutive exports are different queries
+    day = datetime(2025, 1, 1) - timedelta(days=7 * (i % 52))
+    return (f"/api/reports/export?dataset={dataset}&format={fmt}"
+            f"&from={(day - timedelta(days=90)):%Y-%m-%d}&to={day:%Y-%m-%d}")
+
+
+def _list_work_orders(ctx, i):
+    return ("GET", "/api/work-orders?status=planned&limit=500&fields=id,mo_id,operation,status,work_center"
+            + ("&order=-id" if i % 2 else ""), None, None)
+
+
+def _report_path(ctx, i):
+    day = datetime(2025, 1, 1) - timedelta(days=30 * (i % 12))
+    return ["/api/reports/orders", f"/api/reports/summary?from={(day - timedelta(days=30)):%Y-%m-%d}&to={day:%Y-%m-%d}",
+            f"/api/reports/daily?from={(day - timedelta(days=7)):%Y-%m-%d}&to={day:%Y-%m-%d}"][i % 3]
+
+
+SCENARIOS = [
+    Scenario("list_products", 8, 1.0,
+             lambda ctx, i: ("GET", _page("/api/products?limit=100", ctx["product_pages"], i), None, None)),
+    Scenario("list_work_orders", 8, 1.0, _list_work_orders),
+    Scenario("list_orders", 8, 1.0,
+             lambda ctx, i: ("GET", _page("/api/orders?limit=100", ctx["order_pages"], i), None, ctx["auth"])),
+    Scenario("poll_products", 8, 1.0,
+             lambda ctx, i: ("GET", "/api/products?limit=100", None,
+                             {"If-None-Match": ctx["products_etag"]} if ctx["products_etag"] else None)),
+    Scenario("confirm_mo", 4, 0.5,
+             lambda ctx, i: ("POST", "/api/orders", {"product_id": ctx["finished"][i % len(ctx["finished"])],
+                                                     "quantity": 1 + i % 5, "status": "confirmed"}, ctx["auth"])),
+    Scenario("complete_wo", 8, 0.5,
+             lambda ctx, i: ("PUT", f"/api/work-orders/{ctx['planned_wos'][i % len(ctx['planned_wos'])]}/status",
+                             {"status": "completed"}, ctx["auth"])),
+    Scenario("reports", 4, 1.0, lambda ctx, i: ("GET", _report_path(ctx, i), None, None)),
+    Scenario("mrp", 4, 0.5,
+             lambda ctx, i: ("GET", f"/api/mrp?product_id={ctx['finished'][i % len(ctx['finished'])]}&quantity=10", None, None)),
+    Scenario("export_csv", 2, 0.05,
+             lambda ctx, i: ("GET", _export_path(("orders", "work_orders", "stock")[i % 3], "csv", i), None, ctx["auth"])),
+    Scenario("export_xlsx", 1, 0.02, lambda ctx, i: ("GET", _export_path("orders", "xlsx", i), None, ctx["auth"])),
+    Scenario("list_products_cached", 8, 1.0,
+             lambda ctx, i: ("GET", _page("/api/products?limit=100", ctx["product_pages"], i), None, None), True),
+    Scenario("list_work_orders_cached", 8, 1.0, _list_work_orders, True),
+    Scenario("reports_cached", 4, 1.0, lambda ctx, i: ("GET", "/api/reports/orders", None, None), True),
+]
+
+
+def bypass_cache(sc, bust):
+    """sc with a unique _bench= argument on every GET, so no request is a response-cache hit."""
+    if sc.cached or not bust:
+        return sc
+    seq = iter(range(1 << 62))
+
+    def make(ctx, i):
+        method, path, body, headers = sc.make(ctx, i)
+        if method == "GET":
+            path += ("&" if "?" in path else "?") + f"_bench={next(seq)}"
+        return method, path, body, headers
+    return sc._replace(make=make)
+
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    # nearest rank
+    k = min(len(sorted_vals) - 1, max(0, math.ceil(q / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def run_scenario(client, sc, ctx, n_requests, concurrency=None, sql_counter=None, cache_counter=None):
+    concurrency = concurrency or sc.concurrency
+    n = max(int(n_requests * sc.share), 3)
+    if sc.name == "complete_wo":
+        n = min(n, len(ctx["planned_wos"]))
+    latencies, statuses, nbytes = [], Counter(), [0]
+    lock, counter = threading.Lock(), iter(range(n))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            method, path, body, headers = sc.make(ctx, i)
+            t0 = time.perf_counter()
+            status, data, _ = client.request(method, path, body, headers)
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed * 1000.0)
+                statuses[status] += 1
+                nbytes[0] += len(data)
+
+    sql_before = sql_counter() if sql_counter else None
+    hits_before = cache_counter() if cache_counter else None
+    threads = [threading.Thread(target=worker) for _ in range(min(concurrency, n))]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    lat = sorted(latencies)
+    res = {"requests": len(lat), "concurrency": len(threads), "seconds": round(wall, 3),
+           "throughput_rps": round(len(lat) / wall, 1) if wall else None,
+           "errors": sum(c for s, c in statuses.items() if s >= 400),
+           "statuses": {str(s): c for s, c in sorted(statuses.items())},
+           "bytes_per_request": round(nbytes[0] / len(lat)) if lat else 0,
+           "latency_ms": {"mean": round(statistics.fmean(lat), 2) if lat else None,
+                          **{f"p{q}": round(percentile(lat, q), 2) for q in (50, 90, 95, 99)},
+                          "max": round(lat[-1], 2) if lat else None}}
+    if sql_counter:
+        res["sql_per_request"] = round((sql_counter() - sql_before) / len(lat), 2) if lat else None
+    if cache_counter:
+        res["cache_hits"] = cache_counter() - hits_before
+    return res
+
+
+def compare(report, baseline, tolerance):
+    """Scenarios whose p50 latency or throughput moved more than tolerance against baseline."""
+    out = []
+    for name, cur in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        b50, c50 = base["latency_ms"]["p50"], cur["latency_ms"]["p50"]
+        if b50 and c50 > b50 * (1 + tolerance):
+            out.append({"scenario": name, "metric": "p50_ms", "baseline": b50, "current": c50})
+        brps, crps = base.get("throughput_rps"), cur.get("throughput_rps")
+        if brps and crps < brps * (1 - tolerance):
+            out.append({"scenario": name, "metric": "throughput_rps", "baseline": brps, "current": crps})
+        if cur["errors"] > base.get("errors", 0):
+            out.append({"scenario": name, "metric": "errors", "baseline": base.get("errors", 0), "current": cur["errors"]})
+    return out
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="run against a server instead of in process")
+    ap.add_argument("--scale", type=float, default=1.0, help="datagen scale for the in-process database")
+    ap.add_argument("--requests", type=int, default=300, help="requests per scenario (scaled by its share)")
+    ap.add_argument("--concurrency", type=int, help="override the per-scenario thread count")
+    ap.add_argument("--scenarios", help="comma separated subset, in the listed order")
+    ap.add_argument("--warmup", type=int, default=5, help="untimed requests per scenario")
+    ap.add_argument("--out", help="write the JSON report to this file")
+    ap.add_argument("--baseline", help="earlier JSON report to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p50/throughput change")
+    args = ap.parse_args()
+
+    selected = SCENARIOS
+    if args.scenarios:
+        names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+        unknown = set(names) - {s.name for s in SCENARIOS}
+        if unknown:
+            ap.error("unknown scenarios: " + ", ".join(sorted(unknown)))
+        selected = [s for s in SCENARIOS if s.name in names]
+
+    report = {"started": datetime.utcnow().isoformat(timespec="seconds"), "commit": _git_commit(),
+              "python": platform.python_version(), "requests": args.requests, "scenarios": {}}
+    sql_counter = cache_counter = A = None
+    if args.url:
+        client = HttpClient(args.url)
+        report["target"] = args.url
+    else:
+        os.environ.setdefault("DB_DIALECT", "sqlite")
+        os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="mfg_bench_"), "bench.db"))
+        os.environ.setdefault("SLOW_QUERY_MS", "1000000")  # keep the slow-query log quiet
+        os.environ.setdefault("N_PLUS_ONE_THRESHOLD", "1000000")
+        import app as A
+        import datagen
+        import http_cache, metrics
+        with A.app.app_context():
+            A.init_db()
+            report["data"] = datagen.generate(A, args.scale)
+        client = InProcessClient(A.app)
+        report["target"] = A.DB_DIALECT
+        if metrics.METRICS_ENABLED:
+            sql_counter = lambda: sum(n for n, _ in list(metrics.request_metrics.sql.values()))
+        cache_counter = lambda: http_cache.response_cache.stats()["hits"]
+        cache_size = http_cache.response_cache.maxsize
+
+    ctx = build_context(client, max(args.requests, 100) + args.warmup * len(selected))
+    for sc in selected:
+        sc = bypass_cache(sc, bust=bool(args.url))
+        if A is not None:
+            # uncached scenarios run as with RESPONSE_CACHE_SIZE=0
+            http_cache.response_cache.clear()
+            http_cache.response_cache.maxsize = cache_size if sc.cached else 0
+        for i in range(args.warmup):
+            client.request(*sc.make(ctx, -1 - i))
+        if sc.name == "complete_wo" and args.warmup:
+            # warmup requests (negative indexes) completed the last WOs of the list
+            ctx["planned_wos"] = ctx["planned_wos"][:-args.warmup]
+        report["scenarios"][sc.name] = run_scenario(client, sc, ctx, args.requests, args.concurrency, sql_counter,
+                                                    cache_counter)
+        print(f"{sc.name}: {report['scenarios'][sc.name]['throughput_rps']} req/s, "
+              f"p50 {report['scenarios'][sc.name]['latency_ms']['p50']} ms", file=sys.stderr)
+
+    code = 0
+    if args.baseline:
+        with open(args.baseline) as fh:
+            report["regressions"] = compare(report, json.load(fh), args.tolerance)
+        code = 1 if report["regressions"] else 0
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text + "\n")
+    print(text)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Worker cold start: time from `import app` to the first answered request.
+
+Starts fresh interpreters against an already initialized database and compares the
+default boot (no schema work on import) with DB_AUTO_INIT=1 (create_all, migration check
+and seeding on every import, the old behaviour). Each child times the import and the
+first GET /api/products separately; the median of --runs is reported as JSON, together
+with the heaviest top-level imports (python -X importtime) of one lazy boot.
+
+Bytecode is compiled up front, as in a deploy image; without it every boot also spends
+~150 ms recompiling the backend modules. On SQLite the schema step costs a few tens of ms, so the
+lazy boot is only about 1.03-1.08x faster; both are dominated by importing Flask and SQLAlchemy. Moving the step to
+`init-db` is about not running DDL from every worker at once; against a remote MySQL
+server it also saves the round trips of the schema inspection on each boot.
+
+    python benchmarks/cold_start.py --runs 10
+    DB_DIALECT=mysql DB_NAME=bench_db python benchmarks/cold_start.py   # against MySQL
+"""
+import argparse, compileall, json, os, re, statistics, subprocess, sys, tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+resp = app.app.test_client().get("/api/products?limit=1")
+resp.get_data(); resp.close()
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_request_ms": (t2 - t1) * 1000, "status": resp.status_code}))
+"""
+
+
+def boot(env, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD]
+    out = subprocess.run(cmd, cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+    sample = json.loads(out.stdout.strip().splitlines()[-1])
+    if importtime:
+        # "import time: self | cumulative | name", printed as each import finishes, so the
+        # modules app imports directly are the one-level-deeper lines just before "app"
+        rows = [m.groups() for m in re.finditer(r"\|\s*(\d+) \|( +)(\S+)$", out.stderr, re.M)]
+        end = next(i for i, (_, pad, name) in enumerate(rows) if name == "app" and len(pad) == 1)
+        start = max((i for i in range(end) if len(rows[i][1]) == 1), default=-1) + 1
+        tops = sorted(((int(us), name) for us, pad, name in rows[start:end] if len(pad) == 3), reverse=True)
+        sample["imports_ms"] = {name: round(us / 1000, 1) for us, name in tops[:6]}
+        sample["imports_ms"]["app (total)"] = round(int(rows[end][0]) / 1000, 1)
+    return sample
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=7)
+    args = ap.parse_args()
+    env = dict(os.environ, JOB_WORKERS="0")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    if "DB_DIALECT" not in env:
+        env.update(DB_DIALECT="sqlite", SQLITE_PATH=os.path.join(tempfile.mkdtemp(prefix="mfg_bench_"), "bench.db"))
+    compileall.compile_dir(BACKEND, maxlevels=0, quiet=1)
+    # initialize once, as a deploy would
+    subprocess.run([sys.executable, "app.py", "init-db"], cwd=BACKEND, env=env, check=True, capture_output=True)
+    report = {"dialect": env["DB_DIALECT"], "runs": args.runs}
+    for mode, extra in (("auto_init", {"DB_AUTO_INIT": "1"}), ("lazy", {"DB_AUTO_INIT": "0"})):
+        samples = [boot(dict(env, **extra)) for _ in range(args.runs)]
+        if any(s["status"] != 200 for s in samples):
+            raise SystemExit(f"{mode}: first request failed: {samples}")
+        report[mode] = {k: round(statistics.median(s[k] for s in samples), 1)
+                        for k in ("import_ms", "first_request_ms")}
+        report[mode]["total_ms"] = round(report[mode]["import_ms"] + report[mode]["first_request_ms"], 1)
+    report["speedup"] = round(report["auto_init"]["total_ms"] / report["lazy"]["total_ms"], 2)
+    report["lazy_imports_ms"] = boot(dict(env, DB_AUTO_INIT="0"), importtime=True)["imports_ms"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Synthetic manufacturing data for benchmarks.
+
+Generates raw materials, sub-assemblies and finished goods, multi-component (two-level)
+BOMs with routed operations, MOs across all statuses with their WOs, and a stock ledger
+history whose balances match Product.stock_qty. Rows are written with Core executemany
+INSERTs in chunks, then the report rollups and the ATP reservations are rebuilt.
+
+    python benchmarks/datagen.py --scale 2          # temp SQLite DB, prints the row counts
+    DB_DIALECT=sqlite SQLITE_PATH=bench.db python benchmarks/datagen.py --scale 10
+
+Scale 1 is 500 products, 5000 MOs (~15000 WOs) and 20000 ledger movements.
+"""
+import argparse, json, os, random, sys, tempfile, time
+from datetime import datetime, timedelta
+
+if __name__ == "__main__" and "DB_DIALECT" not in os.environ:
+    os.environ["DB_DIALECT"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="mfg_bench_"), "bench.db")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NOW = datetime(2025, 1, 1)
+MO_STATUSES = ["planned", "confirmed", "in_progress", "done"]
+
+
+def generate(A, scale=1.0, work_centers=8, history_days=365, seed=1, chunk=5000):
+    """Insert a synthetic data set into the app's database; returns the row counts."""
+    from sqlalchemy import func, select
+    rnd = random.Random(seed)
+    t0 = time.perf_counter()
+    ins = lambda model, rows: rows and A.db.session.execute(model.__table__.insert(), rows)
+    start = NOW - timedelta(days=history_days)
+    n_products = max(int(500 * scale), 10)
+    n_mos = int(5000 * scale)
+    n_moves = int(20000 * scale)
+    first_id = (A.db.session.execute(select(func.max(A.Product.id))).scalar() or 0) + 1
+    ids = list(range(first_id, first_id + n_products))
+    n_raw, n_sub = int(n_products * 0.7), int(n_products * 0.1)
+    raw, subs, finished = ids[:n_raw], ids[n_raw:n_raw + n_sub], ids[n_raw + n_sub:]
+    kinds = {**{p: "raw" for p in raw}, **{p: "subassembly" for p in subs}, **{p: "finished" for p in finished}}
+    opening = {p: rnd.randint(5000, 50000) if kinds[p] == "raw" else 0 for p in ids}
+
+    # ledger: opening balances plus random in/out movements spread over the history
+    ledger = [{"product_id": p, "movement_type": "in", "quantity": q, "reference": f"INIT:{p}", "timestamp": start}
+              for p, q in opening.items() if q]
+    balance = dict(opening)
+    for _ in range(n_moves):
+        p = rnd.choice(raw)
+        q = rnd.randint(1, 50)
+        out = balance[p] > q and rnd.random() < 0.5
+        balance[p] += -q if out else q
+        ledger.append({"product_id": p, "movement_type": "out" if out else "in", "quantity": q,
+                       "reference": rnd.choice(["PO", "ADJ", "MO"]) + f":{rnd.randint(1, 99999)}",
+                       "timestamp": start + timedelta(minutes=rnd.randrange(history_days * 1440))})
+    ins(A.Product, [{"id": p, "name": f"{kinds[p]}-{p}", "type": "raw" if kinds[p] == "raw" else "finished",
+                     "stock_qty": balance[p], "created_at": start} for p in ids])
+
+    # BOMs: sub-assemblies from raw materials, finished goods from raw materials and sub-assemblies
+    routing = {}
+    boms = []
+    for p in subs + finished:
+        pool = raw if p in subs or not subs else raw + subs
+        comps = rnd.sample(pool, min(rnd.randint(2, 4) if p in subs else rnd.randint(2, 6), len(pool)))
+        ops = [{"name": f"op{k}", "work_center": f"WC{rnd.randint(1, work_centers)}", "time": rnd.randint(5, 120)}
+               for k in range(1, rnd.randint(1, 5) + 1)]
+        routing[p] = ops
+        boms.append({"product_id": p, "components": [{"product_id": c, "qty": rnd.randint(1, 4)} for c in comps],
+                     "operations": ops, "created_at": start})
+    ins(A.BOM, boms)
+
+    # MOs and their WOs; WO progress follows the MO status
+    first_mo = (A.db.session.execute(select(func.max(A.ManufacturingOrder.id))).scalar() or 0) + 1
+    n_wos = 0
+    for lo in range(first_mo, first_mo + n_mos, chunk):
+        mos, wos = [], []
+        for mo_id in range(lo, min(lo + chunk, first_mo + n_mos)):
+            p = rnd.choice(finished)
+            created = start + timedelta(minutes=rnd.randrange(history_days * 1440))
+            status = rnd.choice(MO_STATUSES)
+            mos.append({"id": mo_id, "product_id": p, "quantity": rnd.randint(1, 20), "status": status,
+                        "start_date": created, "deadline": created + timedelta(days=rnd.randint(1, 30)),
+                        "assignee": f"user{rnd.randint(1, 20)}", "created_at": created})
+            t = created
+            for k, op in enumerate(routing[p]):
+                done = status == "done" or (status == "in_progress" and k == 0)
+                end = t + timedelta(minutes=op["time"] + rnd.randint(-3, 15))
+                wos.append({"mo_id": mo_id, "manufactured_id": p, "operation": op["name"], "work_center": op["work_center"],
+                            "planned_time_mins": op["time"], "status": "completed" if done else "planned",
+                            "start_time": t if done else None, "end_time": end if done else None})
+                t = end
+        ins(A.ManufacturingOrder, mos)
+        ins(A.WorkOrder, wos)
+        n_wos += len(wos)
+    for lo in range(0, len(ledger), chunk):
+        ins(A.StockLedger, ledger[lo:lo + chunk])
+    # Core inserts bypass the ORM hooks: bump the ETag versions explicitly
+    from versions import touch_resources, VERSIONED_TABLES
+    touch_resources(A.db.session, *VERSIONED_TABLES)
+    A.db.session.commit()
+    A.rebuild_rollups()
+    A.rebuild_availability()
+    A.bom_cache.invalidate()
+    return {"products": n_products, "boms": len(boms), "mos": n_mos, "wos": n_wos, "ledger": len(ledger),
+            "seconds": round(time.perf_counter() - t0, 2)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scale", type=float, default=1.0)
+    ap.add_argument("--work-centers", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    import app as A
+    with A.app.app_context():
+        A.init_db()
+        counts = generate(A, args.scale, args.work_centers, seed=args.seed)
+    print(json.dumps({"db": A.DB_URI if A.DB_DIALECT == "sqlite" else A.DB_NAME, **counts}))
+
+
+if __name__ == "__main__":
+    main()
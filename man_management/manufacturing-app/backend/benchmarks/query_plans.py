@@ -0,0 +1,127 @@
+"""Before/after query plans and timings for the hot-column indexes (migration 3).
+
+Runs each hot query with the indexes dropped ("before") and recreated ("after") and
+prints the database's plan (SQLite EXPLAIN QUERY PLAN / MySQL EXPLAIN) and the median time.
+
+    python benchmarks/query_plans.py                      # temp SQLite DB with synthetic data
+    DB_DIALECT=mysql DB_NAME=bench_db python benchmarks/query_plans.py --seed
+
+Without DB_DIALECT a throwaway SQLite file is used and seeded automatically; against a
+configured database data is only generated with --seed.
+"""
+import argparse, json, os, random, statistics, sys, tempfile, time
+from datetime import datetime, timedelta
+
+if "DB_DIALECT" not in os.environ:
+    os.environ["DB_DIALECT"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="mfg_bench_"), "bench.db")
+    AUTO_SEED = True
+else:
+    AUTO_SEED = False
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as A  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+NOW = datetime(2025, 1, 1)
+QUERIES = [
+    ("mo by status, newest", "SELECT id FROM manufacturing_order WHERE status = 'confirmed' ORDER BY created_at DESC LIMIT 100", {}),
+    ("mo due before date", "SELECT id FROM manufacturing_order WHERE status = 'confirmed' AND deadline < :d", {"d": NOW + timedelta(days=3)}),
+    ("wo of one mo", "SELECT id FROM work_order WHERE mo_id = :m", {"m": 4242}),
+    ("wo queue per center", "SELECT id FROM work_order WHERE status = 'planned' AND work_center = 'WC3'", {}),
+    ("first bom of product", "SELECT components FROM bom WHERE product_id = :p ORDER BY id LIMIT 1", {"p": 77}),
+    ("ledger of product", "SELECT id FROM stock_ledger WHERE product_id = :p ORDER BY timestamp DESC LIMIT 100", {"p": 77}),
+    ("ledger time window", "SELECT id FROM stock_ledger WHERE timestamp >= :t ORDER BY timestamp LIMIT 100", {"t": NOW + timedelta(days=300)}),
+]
+INDEXED_MODELS = (A.Product, A.BOM, A.ManufacturingOrder, A.WorkOrder, A.StockLedger)
+
+
+def seed(n_mos, n_products=500, chunk=5000):
+    rnd = random.Random(1)
+    ins = lambda model, rows: A.db.session.execute(model.__table__.insert(), rows)
+    ins(A.Product, [{"id": i, "name": f"p{i}", "type": "raw", "stock_qty": 1000, "created_at": NOW} for i in range(1, n_products + 1)])
+    ins(A.BOM, [{"product_id": i, "components": [{"product_id": rnd.randint(1, n_products), "qty": 2}],
+                 "operations": [], "created_at": NOW} for i in range(1, n_products + 1)])
+    statuses = ["planned", "confirmed", "in_progress", "done"]
+    for start in range(1, n_mos + 1, chunk):
+        ids = range(start, min(start + chunk, n_mos + 1))
+        ins(A.ManufacturingOrder, [{"id": i, "product_id": rnd.randint(1, n_products), "quantity": 1,
+                                    "status": rnd.choice(statuses), "deadline": NOW + timedelta(hours=rnd.randint(0, 9000)),
+                                    "created_at": NOW + timedelta(minutes=i)} for i in ids])
+        ins(A.WorkOrder, [{"mo_id": i, "operation": f"op{k}", "work_center": f"WC{rnd.randint(1, 8)}", "planned_time_mins": 30,
+                           "status": rnd.choice(statuses)} for i in ids for k in range(3)])
+        ins(A.StockLedger, [{"product_id": rnd.randint(1, n_products), "movement_type": "out", "quantity": 1,
+                             "reference": f"MO:{i}", "timestamp": NOW + timedelta(minutes=i)} for i in ids for _ in range(2)])
+    A.db.session.commit()
+
+
+def explain(sql, params):
+    prefix = "EXPLAIN QUERY PLAN " if A.DB_DIALECT == "sqlite" else "EXPLAIN "
+    rows = A.db.session.execute(text(prefix + sql), params).all()
+    if A.DB_DIALECT == "sqlite":
+        return [r[-1] for r in rows]
+    return [", ".join(f"{k}={v}" for k, v in r._mapping.items() if k in ("table", "type", "key", "rows", "Extra")) for r in rows]
+
+
+def timed(sql, params, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        A.db.session.execute(text(sql), params).all()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def set_indexes(enabled):
+    conn = A.db.session.connection()
+    kept = []
+    for model in INDEXED_MODELS:
+        for index in model.__table__.indexes:
+            try:
+                index.create(bind=conn, checkfirst=True) if enabled else index.drop(bind=conn, checkfirst=True)
+            except Exception:
+                # MySQL refuses to drop an index a foreign key depends on
+                A.db.session.rollback()
+                conn = A.db.session.connection()
+                kept.append(index.name)
+    A.db.session.commit()
+    if A.DB_DIALECT == "sqlite":
+        A.db.session.execute(text("ANALYZE")); A.db.session.commit()
+    return kept
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--mos", type=int, default=50000, help="MOs to generate (x3 WOs, x2 ledger rows)")
+    ap.add_argument("--seed", action="store_true", help="generate data in the configured database")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = ap.parse_args()
+    report = {"dialect": A.DB_DIALECT, "mos": None, "queries": []}
+    with A.app.app_context():
+        A.init_db()
+        if AUTO_SEED or args.seed:
+            seed(args.mos)
+        report["mos"] = A.db.session.execute(text("SELECT COUNT(*) FROM manufacturing_order")).scalar()
+        phases = {}
+        for phase, enabled in (("before", False), ("after", True)):
+            kept = set_indexes(enabled)
+            phases[phase] = [(explain(sql, p), timed(sql, p, args.repeat)) for _, sql, p in QUERIES]
+            if kept and not enabled:
+                report["indexes_not_dropped"] = kept
+        for i, (name, sql, _) in enumerate(QUERIES):
+            (plan_b, ms_b), (plan_a, ms_a) = phases["before"][i], phases["after"][i]
+            report["queries"].append({"name": name, "sql": sql, "before_ms": round(ms_b, 3), "after_ms": round(ms_a, 3),
+                                      "before_plan": plan_b, "after_plan": plan_a})
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['dialect']}: {report['mos']} MOs")
+    for q in report["queries"]:
+        print(f"\n{q['name']}: {q['before_ms']:.2f} ms -> {q['after_ms']:.2f} ms")
+        print("  before:", " | ".join(q["before_plan"]))
+        print("  after: ", " | ".join(q["after_plan"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Timing of the finite-capacity scheduler core on a synthetic shop.
+
+Builds N work orders (chains of 1-6 operations per MO over a set of work centers),
+runs build_schedule() in memory and reports the median time plus a capacity check.
+
+    python benchmarks/scheduler.py --wos 50000 --centers 20 --capacity 2
+"""
+import argparse, json, os, random, statistics, sys, tempfile, time
+
+if "DB_DIALECT" not in os.environ:
+    os.environ["DB_DIALECT"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="mfg_bench_"), "bench.db")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scheduling import build_schedule  # noqa: E402
+
+
+def make_jobs(n_wos, n_centers, seed=1):
+    rnd = random.Random(seed)
+    jobs, wo_id, mo_id = [], 0, 0
+    horizon = n_wos * 30 // max(n_centers, 1)
+    while wo_id < n_wos:
+        mo_id += 1
+        ops = []
+        for _ in range(min(rnd.randint(1, 6), n_wos - wo_id)):
+            wo_id += 1
+            ops.append((wo_id, "WC%d" % rnd.randrange(n_centers), rnd.randint(5, 120), None, False))
+        release = rnd.randrange(horizon // 2)
+        deadline = release + rnd.randint(60, horizon) if rnd.random() < 0.9 else None
+        jobs.append((mo_id, release, deadline, ops))
+    return jobs
+
+
+def check(plan, jobs, capacity):
+    # no center may run more than `capacity` operations at any instant
+    events = {}
+    for _, _, _, ops in jobs:
+        for op_id, wc, _, _, _ in ops:
+            s, e = plan[op_id]
+            if e > s:
+                events.setdefault(wc, []).extend(((s, 1), (e, -1)))
+    peak = 0
+    for ev in events.values():
+        load = 0
+        for _, d in sorted(ev):
+            load += d
+            peak = max(peak, load)
+    return peak <= capacity, peak
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--wos", type=int, default=50000)
+    ap.add_argument("--centers", type=int, default=20)
+    ap.add_argument("--capacity", type=int, default=2)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    jobs = make_jobs(args.wos, args.centers)
+    times, plan = [], None
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        plan = build_schedule(jobs, {}, args.capacity)
+        times.append(time.perf_counter() - t0)
+    ok, peak = check(plan, jobs, args.capacity)
+    late = sum(1 for _, _, dl, ops in jobs if dl is not None and plan[ops[-1][0]][1] > dl)
+    res = {"wos": args.wos, "mos": len(jobs), "centers": args.centers, "capacity": args.capacity,
+           "median_s": round(statistics.median(times), 3), "makespan_mins": max(e for _, e in plan.values()),
+           "late_mos": late, "peak_load": peak, "capacity_ok": ok}
+    if args.json:
+        print(json.dumps(res))
+    else:
+        for k, v in res.items():
+            print(f"{k:>14}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""WO status ingestion: direct (one transaction per PUT) vs write-behind batching.
+
+Simulates a shift change: --terminals threads each start and complete their own share of
+--wos planned work orders through PUT /api/work-orders/<id>/status, first with
+WO_STATUS_BATCH off, then on (each mode gets its own WOs of the same data set). Reports
+events/s, latency percentiles and the batcher's counters as JSON.
+
+    python benchmarks/wo_status_batch.py --scale 1 --wos 600 --terminals 16
+    python benchmarks/wo_status_batch.py --window-ms 2 --max-batch 200
+"""
+import argparse, json, os, sys, tempfile, threading, time
+
+if __name__ == "__main__" and "DB_DIALECT" not in os.environ:
+    os.environ["DB_DIALECT"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="mfg_bench_"), "bench.db")
+os.environ.setdefault("JOB_WORKERS", "0")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from api_load import InProcessClient, percentile
+
+
+def run(A, client, wo_ids, terminals):
+    """Start, then complete every WO; the WOs are dealt round-robin to the terminals."""
+    lat, codes, lock = [], {}, threading.Lock()
+
+    def terminal(ids):
+        mine = []
+        for status in ("started", "completed"):
+            for wo_id in ids:
+                t0 = time.perf_counter()
+                status_code, _, _ = client.request("PUT", f"/api/work-orders/{wo_id}/status", {"status": status})
+                mine.append(((time.perf_counter() - t0) * 1000, status_code))
+        with lock:
+            for ms, code in mine:
+                lat.append(ms)
+                codes[code] = codes.get(code, 0) + 1
+
+    threads = [threading.Thread(target=terminal, args=(wo_ids[k::terminals],)) for k in range(terminals)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    lat.sort()
+    return {"events": len(lat), "seconds": round(elapsed, 2), "events_per_s": round(len(lat) / elapsed, 1),
+            "status_codes": codes, **{f"p{q}_ms": round(percentile(lat, q), 2) for q in (50, 95, 99)}}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scale", type=float, default=0.5)
+    ap.add_argument("--wos", type=int, default=600, help="work orders per mode (two events each)")
+    ap.add_argument("--terminals", type=int, default=16)
+    ap.add_argument("--window-ms", type=float, help="override WO_BATCH_WINDOW_MS")
+    ap.add_argument("--max-batch", type=int, help="override WO_BATCH_MAX")
+    args = ap.parse_args()
+    import app as A
+    import datagen
+    from sqlalchemy import select
+    with A.app.app_context():
+        A.init_db()
+        datagen.generate(A, args.scale)
+        wo_ids = list(A.db.session.execute(select(A.WorkOrder.id).where(A.WorkOrder.status == "planned")
+                                           .order_by(A.WorkOrder.id).limit(2 * args.wos)).scalars())
+        A.db.session.remove()
+    if len(wo_ids) < 2 * args.wos:
+        raise SystemExit(f"only {len(wo_ids)} planned WOs; raise --scale or lower --wos")
+    if args.window_ms is not None:
+        A.wo_batcher.window = args.window_ms / 1000.0
+    if args.max_batch:
+        A.wo_batcher.max_batch = args.max_batch
+    client = InProcessClient(A.app)
+    report = {"dialect": A.DB_DIALECT, "wos": args.wos, "terminals": args.terminals,
+              "window_ms": A.wo_batcher.window * 1000, "max_batch": A.wo_batcher.max_batch}
+    for mode, ids in (("direct", wo_ids[:args.wos]), ("batched", wo_ids[args.wos:])):
+        A.wo_batcher.enabled = mode == "batched"
+        report[mode] = run(A, client, ids, args.terminals)
+    report["batcher"] = A.wo_batcher.stats()
+    report["speedup"] = round(report["batched"]["events_per_s"] / report["direct"]["events_per_s"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+from flask import request, jsonify, Response, stream_with_context
+from datetime import datetime
+import os, threading, time
+from collections import deque
+from sqlalchemy import select, func, event
+from sqlalchemy.orm import Session
+
+from core import app, db
+from models import ChangeEvent
+from serialization import json_dumps
+
+
+# ---------------- CHANGE FEED ----------------
+# Writes append a ChangeEvent row in the same transaction as the change (record_change/record_changes);
+# the row id is the sequence number. Each process keeps the newest CHANGE_FEED_BUFFER
+# events in memory and fans them out to waiting clients: a local commit wakes the waiters
+# at once, changes committed by other workers are picked up by one waiter polling every
+# CHANGE_FEED_POLL seconds. Clients further behind than the buffer are replayed from the
+# table; rows older than the newest CHANGE_FEED_RETAIN are pruned.
+#   GET /api/changes?since=&kinds=&wait=   long poll (JSON)
+#   GET /api/changes/stream?since=          server-sent events (resumes from Last-Event-ID)
+# A stream holds a server thread for its whole life (but no database connection), so every
+# process serves at most CHANGE_FEED_MAX_STREAMS of them and answers 503 with Retry-After
+# beyond that; clients fall back to reconnecting later. By default streams may take all but
+# CHANGE_FEED_FREE_THREADS of the server threads (GUNICORN_THREADS, or WAITRESS_THREADS under
+# waitress; 16 either way), i.e. 12 per process and WEB_CONCURRENCY * 12 per deployment.
+CHANGE_FEED_BUFFER = int(os.environ.get("CHANGE_FEED_BUFFER", "1000"))
+CHANGE_FEED_POLL = float(os.environ.get("CHANGE_FEED_POLL", "1.0"))
+CHANGE_FEED_RETAIN = int(os.environ.get("CHANGE_FEED_RETAIN", "100000"))
+CHANGE_FEED_MAX_WAIT = float(os.environ.get("CHANGE_FEED_MAX_WAIT", "30"))
+CHANGE_FEED_STREAM_SECONDS = float(os.environ.get("CHANGE_FEED_STREAM_SECONDS", "120"))
+CHANGE_FEED_FREE_THREADS = int(os.environ.get("CHANGE_FEED_FREE_THREADS", "4"))  # kept for ordinary requests
+_SERVER_THREADS = int(os.environ.get("GUNICORN_THREADS") or os.environ.get("WAITRESS_THREADS") or "16")
+CHANGE_FEED_MAX_STREAMS = int(os.environ.get("CHANGE_FEED_MAX_STREAMS",
+                                             max(_SERVER_THREADS - CHANGE_FEED_FREE_THREADS, 1)))  # per process; 0 = no limit
+CHANGE_FEED_BUSY_RETRY = int(os.environ.get("CHANGE_FEED_BUSY_RETRY", "10"))  # Retry-After seconds
+CHANGE_FEED_HEARTBEAT = float(os.environ.get("CHANGE_FEED_HEARTBEAT", "15"))
+CHANGE_FEED_GAP_SECONDS = float(os.environ.get("CHANGE_FEED_GAP_SECONDS", "5"))
+
+
+def record_changes(changes):
+    """Append (kind, op, entity_id, data) change events to the current transaction (no commit)."""
+    if not changes:
+        return
+    now = datetime.utcnow()
+    db.session.execute(ChangeEvent.__table__.insert(),
+                       [{'kind': k, 'op': op, 'entity_id': eid, 'data': data, 'created_at': now}
+                        for k, op, eid, data in changes])
+    db.session.info['changes_pending'] = True
+
+
+def record_change(kind, op, entity_id=None, data=None):
+    record_changes([(kind, op, entity_id, data)])
+
+
+class ChangeFeed:
+    """Bounded in-process replay buffer of change events with blocking reads.
+
+    Events are published strictly in sequence order. A missing sequence number (a
+    concurrent transaction that has not committed yet, or one that rolled back) holds
+    back later events until it shows up or CHANGE_FEED_GAP_SECONDS pass.
+    """
+
+    def __init__(self, size):
+        self._cond = threading.Condition()
+        self._buf = deque(maxlen=size)
+        self.size = size
+        self.last_seq = None  # highest published sequence; None until the first refresh
+        self._pending = {}
+        self._gap_since = None
+        self._stale = True
+        self._refreshing = False
+        self._polled = 0.0
+        self._pruned_at = 0
+        self.waiters = 0
+        self.streams = 0
+        self.streams_refused = 0
+
+    def poke(self):
+        # a local commit wrote events: the next waiter loads them right away
+        with self._cond:
+            self._stale = True
+            self._cond.notify_all()
+
+    def _refresh(self):
+        t = ChangeEvent.__table__
+        cols = (t.c.id, t.c.kind, t.c.op, t.c.entity_id, t.c.data, t.c.created_at)
+        with self._cond:
+            if self._refreshing:
+                return
+            self._refreshing, self._stale = True, False
+            since = self.last_seq
+        rows = []
+        try:
+            with db.engine.connect() as conn:
+                if since is None:
+                    rows = conn.execute(select(*cols).order_by(t.c.id.desc()).limit(self.size)).all()[::-1]
+                else:
+                    rows = conn.execute(select(*cols).where(t.c.id > since).order_by(t.c.id).limit(self.size)).all()
+                top = rows[-1][0] if rows else (since or 0)
+                if CHANGE_FEED_RETAIN and top - self._pruned_at > max(CHANGE_FEED_RETAIN // 10, 1):
+                    conn.execute(t.delete().where(t.c.id <= top - CHANGE_FEED_RETAIN))
+                    conn.commit()
+                    self._pruned_at = top
+        finally:
+            with self._cond:
+                self._refreshing = False
+                self._polled = time.monotonic()
+                if since is None:
+                    self._buf.extend(_change_dict(r) for r in rows)
+                    self.last_seq = rows[-1][0] if rows else 0
+                else:
+                    self._publish(rows)
+                self._cond.notify_all()
+
+    def _publish(self, rows):
+        pending = self._pending
+        for r in rows:
+            pending[r[0]] = r
+        while pending:
+            nxt = self.last_seq + 1
+            if nxt in pending:
+                self._buf.append(_change_dict(pending.pop(nxt)))
+                self.last_seq, self._gap_since = nxt, None
+                continue
+            if self._gap_since is None:
+                self._gap_since = time.monotonic()
+            elif time.monotonic() - self._gap_since >= CHANGE_FEED_GAP_SECONDS:
+                # the missing ids never committed: skip them
+                self.last_seq, self._gap_since = min(pending) - 1, None
+                continue
+            break
+
+    def current(self):
+        if self.last_seq is None or self._stale:
+            self._refresh()
+        return self.last_seq
+
+    def open_stream(self, limit):
+        """Claim a stream slot; False when limit (0 = none) streams are already open."""
+        with self._cond:
+            if limit and self.streams >= limit:
+                self.streams_refused += 1
+                return False
+            self.streams += 1
+            return True
+
+    def close_stream(self):
+        with self._cond:
+            self.streams -= 1
+
+    def read(self, since, kinds=None, limit=None):
+        """Events after since as (changes, last_seq, reset); reset means some were already pruned."""
+        limit = limit or self.size
+        # catch up first: local commits mark the buffer stale, other workers' show up after a poll
+        if self.last_seq is None or self._stale or time.monotonic() - self._polled >= CHANGE_FEED_POLL:
+            self._refresh()
+        with self._cond:
+            published = self.last_seq or 0
+            if since >= published or self._buf and since >= self._buf[0]['seq'] - 1:
+                out = [c for c in self._buf if c['seq'] > since][:limit]
+                last = out[-1]['seq'] if out else max(since, published)
+                return [c for c in out if not kinds or c['kind'] in kinds], last, False
+        # behind the buffer: replay from the table
+        t = ChangeEvent.__table__
+        with db.engine.connect() as conn:
+            first = conn.execute(select(func.min(t.c.id))).scalar()
+            rows = conn.execute(select(t.c.id, t.c.kind, t.c.op, t.c.entity_id, t.c.data, t.c.created_at)
+                                .where(t.c.id > since, t.c.id <= published).order_by(t.c.id).limit(limit)).all()
+        out = [_change_dict(r) for r in rows]
+        last = out[-1]['seq'] if out else published
+        return [c for c in out if not kinds or c['kind'] in kinds], last, first is not None and first > since + 1
+
+    def wait(self, since, timeout):
+        """Block until an event after since is published or timeout elapses; returns whether one was."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.waiters += 1
+        try:
+            while True:
+                if self._stale or time.monotonic() - self._polled >= CHANGE_FEED_POLL:
+                    self._refresh()
+                with self._cond:
+                    if (self.last_seq or 0) > since:
+                        return True
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        return False
+                    if not self._stale:
+                        self._cond.wait(min(left, CHANGE_FEED_POLL))
+        finally:
+            with self._cond:
+                self.waiters -= 1
+
+    def stats(self):
+        with self._cond:
+            return {'last_seq': self.last_seq, 'buffered': len(self._buf), 'buffer_size': self.size,
+                    'oldest_buffered': self._buf[0]['seq'] if self._buf else None,
+                    'held_back': len(self._pending), 'waiters': self.waiters,
+                    'streams': self.streams, 'max_streams': CHANGE_FEED_MAX_STREAMS,
+                    'streams_refused': self.streams_refused}
+
+
+def _change_dict(row):
+    seq, kind, op, entity_id, data, created_at = row
+    return {'seq': seq, 'kind': kind, 'op': op, 'id': entity_id, 'data': data,
+            'at': created_at.isoformat() if created_at else None}
+
+
+change_feed = ChangeFeed(CHANGE_FEED_BUFFER)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_change_feed(session):
+    if session.info.pop('changes_pending', False):
+        change_feed.poke()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending_changes(session):
+    session.info.pop('changes_pending', None)
+
+
+def _change_feed_args():
+    # since: sequence from the last response (or Last-Event-ID); absent means "from now"
+    raw = request.args.get("since") or request.headers.get("Last-Event-ID")
+    since = int(raw) if raw not in (None, "") else None
+    kinds = {k for k in (request.args.get("kinds") or "").split(",") if k} or None
+    return since, kinds
+
+
+@app.route("/api/changes", methods=["GET"])
+def changes():
+    # long poll: returns as soon as there are changes after ?since=, or after ?wait= seconds with none
+    try:
+        since, kinds = _change_feed_args()
+        wait = min(max(float(request.args.get("wait", CHANGE_FEED_MAX_WAIT)), 0), CHANGE_FEED_MAX_WAIT)
+        limit = int(request.args.get("limit", CHANGE_FEED_BUFFER))
+    except ValueError:
+        return jsonify({"error":"since, wait and limit must be numbers"}),400
+    if since is None:
+        return jsonify({"last_seq":change_feed.current(),"changes":[],"reset":False})
+    deadline=time.monotonic()+wait
+    while True:
+        out, last, reset = change_feed.read(since, kinds, limit)
+        if out or reset:
+            return jsonify({"last_seq":last,"changes":out,"reset":reset})
+        if last > since:
+            since=last  # only events of other kinds: keep waiting from there
+            continue
+        left=deadline-time.monotonic()
+        if left<=0 or not change_feed.wait(since, left):
+            return jsonify({"last_seq":since,"changes":[],"reset":False})
+
+
+@app.route("/api/changes/stream", methods=["GET"])
+def changes_stream():
+    # server-sent events; the stream ends after CHANGE_FEED_STREAM_SECONDS and EventSource reconnects with Last-Event-ID
+    try:
+        since, kinds = _change_feed_args()
+    except ValueError:
+        return jsonify({"error":"since must be a sequence number"}),400
+    if not change_feed.open_stream(CHANGE_FEED_MAX_STREAMS):
+        resp = jsonify({"error":"too many open change streams, retry later or long poll /api/changes"})
+        resp.headers["Retry-After"] = str(CHANGE_FEED_BUSY_RETRY)
+        return resp, 503
+    # the stream reads through short engine connections; hand back the one the auth lookup
+    # may have opened instead of holding it for CHANGE_FEED_STREAM_SECONDS
+    db.session.close()
+
+    def generate(since):
+        if since is None:
+            since = change_feed.current()
+        end = time.monotonic() + CHANGE_FEED_STREAM_SECONDS
+        yield f"retry: 2000\nid: {since}\n\n"
+        while time.monotonic() < end:
+            if not change_feed.wait(since, min(CHANGE_FEED_HEARTBEAT, max(end - time.monotonic(), 0))):
+                yield ": keepalive\n\n"
+                continue
+            out, last, reset = change_feed.read(since, kinds)
+            if reset:
+                yield f"event: reset\ndata: {json_dumps({'seq': last})}\n\n"
+            for c in out:
+                yield f"id: {c['seq']}\nevent: {c['kind']}\ndata: {json_dumps(c)}\n\n"
+            if last > since and not out:
+                yield f"id: {last}\n\n"  # advance Last-Event-ID past filtered events
+            since = last
+
+    resp = Response(stream_with_context(generate(since)), mimetype="text/event-stream",
+                    headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"})
+    # runs when the response is closed, also if the client went away before the first chunk
+    resp.call_on_close(change_feed.close_stream)
+    return resp
+
+
+@app.route("/api/changes/stats", methods=["GET"])
+def changes_stats():
+    return jsonify(change_feed.stats())
@@ -0,0 +1,185 @@
+from datetime import datetime
+import os
+from collections import defaultdict
+from sqlalchemy import text, select, func, bindparam
+
+from core import db, DB_DIALECT
+from models import BOM, ManufacturingOrder, Product, StockLedger, WorkOrder
+from versions import touch_resources
+from rollups import apply_rollup_deltas, ROLLUP_ATTRS, rollup_contrib
+from atp import component_needs, record_consumption
+from changes import record_changes
+
+
+# ---------------- STOCK CONSUMPTION ----------------
+# One engine for MO and WO consumption: a single IN query for the component products,
+# one executemany UPDATE stock_qty = stock_qty - :q (atomic, so concurrent completions
+# never lose updates) and one bulk INSERT of the ledger rows.
+# STOCK_CHECK_AVAILABILITY=1 refuses consumption that would drive stock negative.
+STOCK_CHECK_AVAILABILITY = os.environ.get("STOCK_CHECK_AVAILABILITY", "0") == "1"
+
+
+class InsufficientStock(ValueError):
+    pass
+
+
+def shortage_message(short):
+    return 'insufficient stock: ' + ', '.join(f'product {p} short by {n}' for p, n in sorted(short.items()))
+
+
+def bom_components_for(product_id):
+    """Return the components list of the product's (first) BOM, or None."""
+    return db.session.execute(
+        select(BOM.components).where(BOM.product_id == product_id).order_by(BOM.id).limit(1)).scalar()
+
+
+def apply_stock_deltas(deltas, reference=None):
+    """Atomically add {product_id: delta} to Product.stock_qty in one executemany UPDATE (no commit)."""
+    t = Product.__table__
+    params = [{'b_pid': pid, 'b_delta': d} for pid, d in deltas.items() if d]
+    if params:
+        stmt = t.update().where(t.c.id == bindparam('b_pid')).values(
+            stock_qty=func.coalesce(t.c.stock_qty, 0) + bindparam('b_delta'))
+        db.session.execute(stmt, params)
+        touch_resources(db.session, 'product')
+        record_changes([('stock', 'delta', p['b_pid'], {'delta': p['b_delta'], 'reference': reference}) for p in params])
+
+
+BULK_ID_CHUNK = 1000  # rows per multi-row INSERT when MySQL ids are derived from LAST_INSERT_ID()
+_mysql_autoinc = None
+
+
+def mysql_autoinc():
+    """(innodb_autoinc_lock_mode, auto_increment_increment) of the server, read once per process."""
+    global _mysql_autoinc
+    if _mysql_autoinc is None:
+        mode, step = db.session.execute(text("SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment")).one()
+        _mysql_autoinc = (int(mode), int(step))
+    return _mysql_autoinc
+
+
+def bulk_insert_rows(model, rows, need_ids=False):
+    """executemany INSERT of uniform column dicts, feeding the report rollups (no commit).
+
+    Returns the new ids in row order when the dialect supports INSERT..RETURNING for
+    executemany (SQLite); otherwise None, unless need_ids asks for them (MySQL). MySQL then
+    sends multi-row INSERTs and derives each one's ids from LAST_INSERT_ID() and the row
+    count, which is exact when InnoDB hands a statement consecutive values
+    (innodb_autoinc_lock_mode 0 or 1); under interleaved mode 2 it falls back to one INSERT
+    per row.
+    """
+    if not rows:
+        return []
+    t = model.__table__
+    if getattr(db.engine.dialect, 'insert_executemany_returning_sort_by_parameter_order', False):
+        ids = list(db.session.execute(t.insert().returning(t.c.id, sort_by_parameter_order=True), rows).scalars())
+    elif need_ids and DB_DIALECT == 'mysql' and mysql_autoinc()[0] in (0, 1):
+        step = mysql_autoinc()[1]
+        ids = []
+        for i in range(0, len(rows), BULK_ID_CHUNK):
+            chunk = rows[i:i + BULK_ID_CHUNK]
+            first = db.session.execute(t.insert().values(chunk)).lastrowid
+            ids.extend(range(first, first + len(chunk) * step, step))
+    elif need_ids:
+        ids = [db.session.execute(t.insert(), r).inserted_primary_key[0] for r in rows]
+    else:
+        db.session.execute(t.insert(), rows)
+        ids = None
+    touch_resources(db.session, t.name)
+    # Core inserts bypass the ORM flush listener, so feed the rollups directly
+    attrs = ROLLUP_ATTRS.get(model)
+    if attrs:
+        deltas = defaultdict(float)
+        for r in rows:
+            for key, d in rollup_contrib(model, [r.get(a) for a in attrs]):
+                deltas[key] += d
+        apply_rollup_deltas(db.session.connection(), deltas)
+    return ids
+
+
+def post_ledger_entries(entries):
+    """Bulk-insert ledger rows ({product_id, movement_type, quantity, reference}) plus their rollup deltas (no commit)."""
+    if not entries:
+        return
+    now = datetime.utcnow()
+    rows = [dict(e, timestamp=e.get('timestamp') or now) for e in entries]
+    return bulk_insert_rows(StockLedger, rows)
+
+
+def consume_components(components, multiplier, reference, check_availability=None, mo_id=None):
+    """Consume BOM components times multiplier against stock, recording ledger rows (no commit).
+
+    Consumption for mo_id is counted against that MO's reservation. Raises ValueError for
+    unknown products and InsufficientStock when availability checking is on and some
+    component is short.
+    """
+    if check_availability is None:
+        check_availability = STOCK_CHECK_AVAILABILITY
+    need = component_needs(components, multiplier)
+    if not need:
+        return
+    stmt = select(Product.id, Product.stock_qty).where(Product.id.in_(list(need)))
+    if check_availability:
+        # lock the rows (MySQL) so the check and the update see the same quantities
+        stmt = stmt.with_for_update()
+    on_hand = dict(db.session.execute(stmt).all())
+    for pid in need:
+        if pid not in on_hand:
+            raise ValueError(f'Product {pid} not found')
+    if check_availability:
+        short = {pid: q - (on_hand[pid] or 0) for pid, q in need.items() if q > (on_hand[pid] or 0)}
+        if short:
+            raise InsufficientStock(shortage_message(short))
+    apply_stock_deltas({pid: -q for pid, q in need.items()}, reference)
+    post_ledger_entries([{'product_id': pid, 'movement_type': 'out', 'quantity': q, 'reference': reference}
+                         for pid, q in need.items()])
+    if mo_id is not None:
+        record_consumption({mo_id: need})
+
+
+def _consume_for(mo_id, mo_quantity, mo_product_id, reference, check_availability):
+    comps = bom_components_for(mo_product_id)
+    if not isinstance(comps, list):
+        return True, None  # nothing to consume
+    consume_components(comps, mo_quantity or 1, reference, check_availability, mo_id)
+    db.session.commit()
+    return True, None
+
+
+def consume_stock_for_wo(wo_id, check_availability=None):
+    """Consume stock for the given work order. Returns (True, None) or (False, error_string)."""
+    try:
+        row = db.session.execute(
+            select(WorkOrder.mo_id, ManufacturingOrder.id, ManufacturingOrder.quantity, ManufacturingOrder.product_id)
+            .outerjoin(ManufacturingOrder, ManufacturingOrder.id == WorkOrder.mo_id)
+            .where(WorkOrder.id == wo_id)).first()
+        if not row:
+            return False, f'WO {wo_id} not found'
+        if row[1] is None:
+            return False, f'MO {row[0]} not found'
+        return _consume_for(row[1], row[2], row[3], f'WO:{wo_id}', check_availability)
+    except Exception as ex:
+        db.session.rollback()
+        return False, str(ex)
+
+
+def consume_stock_for_mo(mo_id, check_availability=None):
+    """Consume stock for the given manufacturing order. Returns (True, None) or (False, error_string)."""
+    try:
+        row = db.session.execute(
+            select(ManufacturingOrder.quantity, ManufacturingOrder.product_id).where(ManufacturingOrder.id == mo_id)).first()
+        if not row:
+            return False, f'MO {mo_id} not found'
+        return _consume_for(mo_id, row[0], row[1], f'MO:{mo_id}', check_availability)
+    except Exception as ex:
+        db.session.rollback()
+        return False, str(ex)
+
+
+def first_bom_values(product_ids, column):
+    """{product_id: column value of the product's first BOM} for many products in one query."""
+    out = {}
+    if product_ids:
+        for pid, val in db.session.execute(select(BOM.product_id, column).where(BOM.product_id.in_(set(product_ids))).order_by(BOM.id)):
+            out.setdefault(pid, val)
+    return out
@@ -0,0 +1,160 @@
+from flask import Flask, jsonify
+from flask_cors import CORS
+from flask_sqlalchemy import SQLAlchemy
+import os, threading, time
+from urllib.parse import quote_plus
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+
+# ---------------- CONFIG ----------------
+DB_USER = os.environ.get("DB_USER", "root")
+DB_PASS = os.environ.get("DB_PASS", "Rash@2004")
+DB_HOST = os.environ.get("DB_HOST", "localhost")
+DB_NAME = os.environ.get("DB_NAME", "manufacturing_db")
+# Optional dialect override for easier local dev/testing
+# set DB_DIALECT=sqlite to use a local file-based DB instead of MySQL
+DB_DIALECT = os.environ.get("DB_DIALECT", "mysql").lower()
+if DB_DIALECT == "sqlite":
+    SQLITE_PATH = os.environ.get("SQLITE_PATH", DB_NAME + ".db")
+    DB_URI = f"sqlite:///{SQLITE_PATH}"
+else:
+    # URL-encode username/password to avoid breaking the URI when they contain
+    # special characters such as '@' or ':'
+    DB_USER_Q = quote_plus(DB_USER)
+    DB_PASS_Q = quote_plus(DB_PASS)
+    DB_URI = f"mysql+pymysql://{DB_USER_Q}:{DB_PASS_Q}@{DB_HOST}/{DB_NAME}"
+
+# ---------------- CONNECTION POOL ----------------
+# Pool sizing is per process: with N workers the database sees up to
+# N * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections, which must stay below max_connections.
+#   DB_POOL_SIZE=10  DB_MAX_OVERFLOW=20  DB_POOL_TIMEOUT=30 (s to wait for a free connection)
+#   DB_POOL_RECYCLE=1800 (s; keep below MySQL wait_timeout)  DB_POOL_PRE_PING=1
+#   DB_STATEMENT_TIMEOUT_MS=0 (MySQL max_execution_time for SELECTs; SQLite busy timeout)
+class PoolStats:
+    """Counters for pool checkouts and the time requests spent waiting for a connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = self.checkins = self.connects = self.invalidations = self.timeouts = 0
+        self.wait_total = self.wait_max = 0.0
+        self.pool = None
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            out = {'checkouts': self.checkouts, 'checkins': self.checkins, 'connects': self.connects,
+                   'invalidations': self.invalidations, 'timeouts': self.timeouts,
+                   'wait_seconds_total': round(self.wait_total, 6), 'wait_seconds_max': round(self.wait_max, 6),
+                   'wait_seconds_avg': round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0}
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            out.update({'pool_size': pool.size(), 'checked_out': pool.checkedout(),
+                        'checked_in': pool.checkedin(), 'overflow': pool.overflow()})
+        return out
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            pool_stats.record_wait(time.perf_counter() - t0, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - t0)
+        return conn
+
+
+def engine_options_from_env():
+    """SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* / DB_STATEMENT_TIMEOUT_MS environment variables."""
+    timeout_ms = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "0"))
+    opts = {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+    }
+    if DB_DIALECT == "sqlite":
+        # wait for the database lock instead of failing immediately with "database is locked"
+        opts["connect_args"] = {"timeout": (timeout_ms / 1000.0) if timeout_ms else 30, "check_same_thread": False}
+    elif timeout_ms:
+        opts["connect_args"] = {"init_command": f"SET SESSION max_execution_time={timeout_ms}"}
+    return opts
+
+
+app = Flask(__name__)
+app.config["SQLALCHEMY_DATABASE_URI"] = DB_URI
+app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options_from_env()
+db = SQLAlchemy(app)
+
+
+def _attach_pool_listeners(engine):
+    pool_stats.pool = engine.pool
+    event.listen(engine, 'checkout', lambda *a: pool_stats.incr('checkouts'))
+    event.listen(engine, 'checkin', lambda *a: pool_stats.incr('checkins'))
+    event.listen(engine, 'connect', lambda *a: pool_stats.incr('connects'))
+    event.listen(engine, 'invalidate', lambda *a: pool_stats.incr('invalidations'))
+
+
+with app.app_context():
+    _attach_pool_listeners(db.engine)
+# Ensure CORS headers are present for API endpoints (helpful during local dev)
+app.config['CORS_HEADERS'] = 'Content-Type'
+# Allow all origins for /api/* during development; tighten this in production
+CORS(app, resources={r"/api/*": {"origins": "*"}})
+
+
+@app.after_request
+def add_cors_headers(response):
+    # Ensure browsers always receive an Access-Control-Allow-Origin header during local dev
+    try:
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization'
+        response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
+        # let browsers read the pagination cursor of list endpoints
+        response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor,ETag,Last-Modified'
+    except Exception:
+        pass
+    return response
+
+
+# Global error handler to ensure JSON responses and CORS headers on exceptions
+@app.errorhandler(Exception)
+def handle_exception(e):
+    # Import traceback lazily to avoid top-level cost
+    import traceback
+    tb = traceback.format_exc()
+    # Log to stdout so user's terminal shows the error
+    print("--- Exception caught by global handler ---")
+    print(tb)
+    # Build JSON response
+    body = {'error': 'internal_server_error', 'details': str(e)}
+    resp = jsonify(body)
+    resp.status_code = 500
+    # Ensure CORS headers are present on error responses too
+    try:
+        resp.headers['Access-Control-Allow-Origin'] = '*'
+        resp.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization'
+        resp.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
+    except Exception:
+        pass
+    return resp
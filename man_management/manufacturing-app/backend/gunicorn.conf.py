@@ -0,0 +1,31 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Each worker process has its own SQLAlchemy pool, so the database sees up to
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections. Keep threads <= DB_POOL_SIZE +
+# DB_MAX_OVERFLOW (16 <= 30 by default) so a worker never times out on its own pool; watch
+# /api/metrics/pool (wait_seconds_*, timeouts).
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:" + os.environ.get("PORT", "5000"))
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# each open /api/changes/stream holds one of these threads (but no DB connection);
+# CHANGE_FEED_MAX_STREAMS caps them per worker at GUNICORN_THREADS - CHANGE_FEED_FREE_THREADS (12)
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+worker_class = "gthread" if threads > 1 else "sync"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then to bound memory growth
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+preload_app = os.environ.get("GUNICORN_PRELOAD", "0") == "1"
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    # with preload_app the parent may already hold pooled connections; never share them across processes
+    if preload_app:
+        from app import app, db
+        with app.app_context():
+            db.engine.dispose(close=False)
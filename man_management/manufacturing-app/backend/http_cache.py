@@ -0,0 +1,159 @@
+from flask import request, jsonify, Response
+from datetime import timezone
+import os, threading
+from collections import OrderedDict
+from werkzeug.wsgi import ClosingIterator
+
+from core import app
+from versions import resource_versions
+
+
+# ---------------- HTTP CACHING ----------------
+# GETs wrapped in conditional_get(tables) carry ETag / Last-Modified built from the
+# resource versions of those tables and answer If-None-Match / If-Modified-Since with 304
+# before any query runs. Full bodies are kept in an in-process LRU keyed by
+# (endpoint, query args, versions), so a repeated GET after no writes is one dict lookup.
+#   RESPONSE_CACHE_SIZE=256 (entries; 0 disables)  RESPONSE_CACHE_MAX_BYTES=32 MiB (total)
+#   RESPONSE_CACHE_ITEM_BYTES=4 MiB (larger bodies are streamed and never cached)
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_ITEM_BYTES = int(os.environ.get("RESPONSE_CACHE_ITEM_BYTES", str(4 * 1024 * 1024)))
+# headers that are recomputed for every response and so not stored with a cached body
+_UNCACHED_HEADERS = {'content-length', 'etag', 'last-modified', 'cache-control'}
+
+
+class ResponseCache:
+    """LRU of key -> (mimetype, headers, body) bounded by entry count and total body bytes."""
+
+    def __init__(self, maxsize, max_bytes, item_bytes):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.item_bytes = min(item_bytes, max_bytes)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.not_modified = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.item_bytes > 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, mimetype, headers, body):
+        if not self.enabled or len(body) > self.item_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[2])
+            self._data[key] = (mimetype, headers, body)
+            self.bytes += len(body)
+            while len(self._data) > self.maxsize or self.bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= len(evicted[2])
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'bytes': self.bytes,
+                    'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'not_modified': self.not_modified,
+                    'hit_ratio': (self.hits / total) if total else 0.0}
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_ITEM_BYTES)
+# a failed bump leaves the old stamp on new data: don't keep serving bodies cached under it
+resource_versions.failure_hooks.append(response_cache.clear)
+
+
+def _cache_streamed(chunks, key, mimetype, headers):
+    # pass the stream through unchanged and keep a copy while it stays under the item limit
+    buf, size = [], 0
+    for chunk in chunks:
+        if buf is not None:
+            b = chunk if isinstance(chunk, bytes) else chunk.encode()
+            size += len(b)
+            if size > response_cache.item_bytes:
+                buf = None
+            else:
+                buf.append(b)
+        yield chunk
+    if buf is not None:
+        response_cache.put(key, mimetype, headers, b''.join(buf))
+
+
+def _set_validators(resp, etag, modified):
+    resp.set_etag(etag)
+    if modified is not None:
+        resp.last_modified = modified.replace(tzinfo=timezone.utc)
+    # clients may keep the body but must revalidate; unchanged data costs a 304
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+def _not_modified(etag, modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    ims = request.if_modified_since
+    return ims is not None and modified is not None and modified.replace(microsecond=0, tzinfo=timezone.utc) <= ims
+
+
+def conditional_get(*tables):
+    """Add ETag / Last-Modified, 304 answers and the response cache to a view's GETs.
+
+    tables are the resource_version names the response is derived from.
+    """
+    from functools import wraps
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*a, **kw):
+            if request.method not in ('GET', 'HEAD'):
+                return func(*a, **kw)
+            versions, modified = resource_versions.get(tables)
+            stamp = int(modified.replace(tzinfo=timezone.utc).timestamp()) if modified else 0
+            etag = f"{request.endpoint}-{'.'.join(map(str, versions))}-{stamp:x}"
+            if _not_modified(etag, modified):
+                response_cache.not_modified += 1
+                return _set_validators(Response(status=304), etag, modified)
+            key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), tuple(versions))
+            hit = response_cache.get(key) if response_cache.enabled else None
+            if hit is not None:
+                mimetype, headers, body = hit
+                return _set_validators(Response(body, mimetype=mimetype, headers=headers), etag, modified)
+            resp = app.make_response(func(*a, **kw))
+            if resp.status_code != 200:
+                return resp
+            if response_cache.enabled:
+                headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in _UNCACHED_HEADERS]
+                if resp.is_streamed:
+                    # close the inner stream too: it holds the request context until closed,
+                    # even when the client goes away before the wrapper is first iterated
+                    inner = resp.response
+                    resp.response = ClosingIterator(_cache_streamed(inner, key, resp.mimetype, headers),
+                                                    getattr(inner, 'close', None))
+                else:
+                    response_cache.put(key, resp.mimetype, headers, resp.get_data())
+            return _set_validators(resp, etag, modified)
+        return wrapper
+    return decorate
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def http_cache_stats():
+    return jsonify({'responses': response_cache.stats(), 'resource_versions': resource_versions.stats()})
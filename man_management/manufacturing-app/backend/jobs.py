@@ -0,0 +1,278 @@
+from flask import request, jsonify, send_file, g
+from datetime import datetime, timedelta
+import os, tempfile, threading, time, socket
+from sqlalchemy import select, and_, or_, func
+from sqlalchemy.exc import IntegrityError
+
+from core import app, db
+from models import Job
+from auth import require_auth
+from serialization import to_dict
+from listing import list_response
+from changes import record_change
+
+
+# ---------------- JOBS ----------------
+# Local job queue in the job table, no external broker. Every process runs JOB_WORKERS
+# threads (started with the first request) that claim queued jobs with a compare-and-set
+# UPDATE, so several gunicorn workers can share the queue. A local enqueue wakes a worker
+# at once; jobs queued elsewhere are picked up within JOB_POLL_SECONDS.
+#   retries: failures other than validation errors (ValueError) are retried up to
+#            max_attempts (JOB_MAX_ATTEMPTS=3) with exponential backoff (JOB_RETRY_SECONDS=5)
+#   leases:  a job running longer than JOB_LEASE_SECONDS (900) is assumed lost and re-run
+#   idempotency: an Idempotency-Key header returns the existing job instead of a new one
+#   results: export files go to JOB_RESULT_DIR and are removed after JOB_RESULT_TTL_HOURS (24)
+#   access:  users see their own jobs; roles in JOB_ADMIN_ROLES (Admin) see every job
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# upper bound for a client-supplied max_attempts
+JOB_MAX_ATTEMPTS_LIMIT = int(os.environ.get("JOB_MAX_ATTEMPTS_LIMIT", "10"))
+JOB_RETRY_SECONDS = float(os.environ.get("JOB_RETRY_SECONDS", "5"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "900"))
+JOB_RESULT_DIR = os.environ.get("JOB_RESULT_DIR") or os.path.join(tempfile.gettempdir(), "mfg_jobs")
+JOB_RESULT_TTL_HOURS = float(os.environ.get("JOB_RESULT_TTL_HOURS", "24"))
+JOB_ADMIN_ROLES = tuple(r.strip() for r in os.environ.get("JOB_ADMIN_ROLES", "Admin").split(",") if r.strip())
+# MO_CONFIRM_ASYNC=1 makes confirmed MO creation asynchronous without ?async=1 / Prefer: respond-async
+MO_CONFIRM_ASYNC = os.environ.get("MO_CONFIRM_ASYNC", "0") == "1"
+
+
+# kind -> handler(params, job_id) returning a JSON-able result; runs in an app context.
+# Filled in by the modules that own the work: app.py (confirm_mo, generate_work_orders,
+# export) and scheduling.py (schedule, reschedule).
+JOB_HANDLERS = {}
+# kinds queued only by the server as part of another write (their params are not validated
+# for clients); POST /api/jobs refuses them
+INTERNAL_JOB_KINDS = set()
+
+
+class JobRunner:
+    """Worker threads of this process; restarted lazily after a fork."""
+
+    def __init__(self, workers, poll):
+        self.workers = workers
+        self.poll = poll
+        self._cond = threading.Condition()
+        self._pid = None
+        self._swept = 0.0
+        self.name = None
+        self.done = self.failed = self.retried = 0
+
+    def ensure_started(self):
+        if self.workers <= 0 or self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.name = f'{socket.gethostname()}:{self._pid}'
+            for i in range(self.workers):
+                threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True).start()
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            try:
+                with app.app_context():
+                    job = self._claim()
+                    if job is not None:
+                        self._run(job)
+                        continue
+                    self._sweep_results()
+            except Exception as e:
+                print("Job worker error:", e)
+            with self._cond:
+                self._cond.wait(self.poll)
+
+    def _claim(self):
+        t = Job.__table__
+        now = datetime.utcnow()
+        expired = and_(t.c.status == 'running', t.c.locked_at < now - timedelta(seconds=JOB_LEASE_SECONDS))
+        ready = or_(and_(t.c.status == 'queued', or_(t.c.run_after.is_(None), t.c.run_after <= now)),
+                    and_(expired, t.c.attempts < t.c.max_attempts))
+        with db.engine.begin() as conn:
+            conn.execute(t.update().where(expired, t.c.attempts >= t.c.max_attempts).values(
+                status='failed', error='worker lost the job (lease expired)', finished_at=now))
+            for job_id in conn.execute(select(t.c.id).where(ready).order_by(t.c.id).limit(5)).scalars().all():
+                claimed = conn.execute(t.update().where(t.c.id == job_id, ready).values(
+                    status='running', locked_by=self.name, locked_at=now, attempts=t.c.attempts + 1))
+                if claimed.rowcount == 1:
+                    return conn.execute(select(t.c.id, t.c.kind, t.c.params, t.c.attempts, t.c.max_attempts)
+                                        .where(t.c.id == job_id)).first()
+        return None
+
+    def _run(self, job):
+        handler = JOB_HANDLERS.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f'unknown job kind: {job.kind}')
+            result = handler(job.params or {}, job.id)
+        except Exception as e:
+            db.session.rollback()
+            # validation errors (incl. InsufficientStock) fail at once; anything else is retried
+            if not isinstance(e, ValueError) and job.attempts < job.max_attempts:
+                delay = JOB_RETRY_SECONDS * 2 ** (job.attempts - 1)
+                self._finish(job.id, 'queued', error=str(e), run_after=datetime.utcnow() + timedelta(seconds=delay))
+                self.retried += 1
+            else:
+                self._finish(job.id, 'failed', error=str(e), finished_at=datetime.utcnow())
+                self.failed += 1
+            return
+        self._finish(job.id, 'done', result=result, error=None, finished_at=datetime.utcnow())
+        self.done += 1
+
+    def _finish(self, job_id, status, **values):
+        t = Job.__table__
+        # only the current lease holder may record the outcome
+        res = db.session.execute(t.update().where(t.c.id == job_id, t.c.locked_by == self.name, t.c.status == 'running')
+                                 .values(status=status, locked_by=None, locked_at=None, **values))
+        if res.rowcount:
+            record_change('job', status, job_id, {'error': values.get('error')} if values.get('error') else None)
+        db.session.commit()
+
+    def _sweep_results(self):
+        if JOB_RESULT_TTL_HOURS <= 0 or time.monotonic() - self._swept < 3600 or not os.path.isdir(JOB_RESULT_DIR):
+            return
+        self._swept = time.monotonic()
+        cutoff = time.time() - JOB_RESULT_TTL_HOURS * 3600
+        for entry in os.scandir(JOB_RESULT_DIR):
+            if entry.name.startswith('job-') and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        return {'workers': self.workers if self._pid == os.getpid() else 0, 'name': self.name,
+                'done': self.done, 'failed': self.failed, 'retried': self.retried}
+
+
+job_runner = JobRunner(JOB_WORKERS, JOB_POLL_SECONDS)
+
+
+@app.before_request
+def _start_job_workers():
+    job_runner.ensure_started()
+
+
+def add_job(kind, params, idempotency_key=None, created_by=None, max_attempts=None, run_after=None):
+    """Add a job to the current transaction (no commit); call job_runner.wake() after committing.
+
+    A duplicate idempotency key makes the commit fail with IntegrityError, so a job can be
+    queued atomically with the write it belongs to.
+    """
+    job = Job(kind=kind, params=params, idempotency_key=idempotency_key or None, created_by=created_by,
+              max_attempts=max_attempts or JOB_MAX_ATTEMPTS, run_after=run_after or datetime.utcnow())
+    db.session.add(job)
+    return job
+
+
+def enqueue_job(kind, params, idempotency_key=None, created_by=None, max_attempts=None, run_after=None):
+    """Queue a job (commits); returns (job, created). run_after delays it (UTC datetime).
+
+    With an idempotency key already in use the existing job is returned instead;
+    ValueError if that job is of another kind.
+    """
+    job = Job.query.filter_by(idempotency_key=idempotency_key).first() if idempotency_key else None
+    created = job is None
+    if created:
+        job = add_job(kind, params, idempotency_key, created_by, max_attempts, run_after)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            if not idempotency_key:
+                raise
+            # a concurrent request with the same key won
+            db.session.rollback()
+            job, created = Job.query.filter_by(idempotency_key=idempotency_key).first(), False
+    if job.kind != kind:
+        raise ValueError('idempotency key already used for a different kind of job')
+    if created:
+        job_runner.ensure_started()
+        job_runner.wake()
+    return job, created
+
+
+def wants_async(default=False):
+    # ?async=1 or the RFC 7240 "Prefer: respond-async" header
+    flag = request.args.get("async")
+    if flag is not None:
+        return flag.lower() in ("1", "true", "yes")
+    return "respond-async" in request.headers.get("Prefer", "") or default
+
+
+def job_dict(job):
+    out = to_dict(job)
+    out['status_url'] = f'/api/jobs/{job.id}'
+    if job.status == 'done' and job.kind == 'export':
+        out['result_url'] = f'/api/jobs/{job.id}/result'
+    return out
+
+
+def job_response(job, created, **extra):
+    # 202 while the work is pending; a replayed idempotency key answers 200
+    return jsonify({**extra, 'job': job_dict(job)}), 202 if created else 200
+
+
+def _own_job(job_id):
+    # other users' jobs are reported missing rather than forbidden
+    job=db.session.get(Job, job_id)
+    if job is None or (job.created_by != g.user.id and g.user.role not in JOB_ADMIN_ROLES):
+        return None
+    return job
+
+
+@app.route("/api/jobs", methods=["GET","POST"])
+@require_auth
+def jobs():
+    if request.method=="POST":
+        d=request.json or {}
+        public=[k for k in JOB_HANDLERS if k not in INTERNAL_JOB_KINDS]
+        if d.get("kind") not in public:
+            return jsonify({"error":"kind must be one of: "+", ".join(public)}),400
+        max_attempts=d.get("max_attempts")
+        if max_attempts is not None and (type(max_attempts) is not int or not 1 <= max_attempts <= JOB_MAX_ATTEMPTS_LIMIT):
+            return jsonify({"error":f"max_attempts must be an integer from 1 to {JOB_MAX_ATTEMPTS_LIMIT}"}),400
+        try:
+            job, created = enqueue_job(d["kind"], d.get("params") or {}, request.headers.get("Idempotency-Key"),
+                                       g.user.id, max_attempts)
+        except ValueError as e:
+            return jsonify({"error":str(e)}),409
+        return job_response(job, created)
+    filters=[getattr(Job, k)==request.args[k] for k in ("status","kind") if request.args.get(k)]
+    if g.user.role not in JOB_ADMIN_ROLES:
+        filters.append(Job.created_by==g.user.id)
+    return list_response(Job, *filters, default_order='-id', default_limit=100)
+
+
+@app.route("/api/jobs/<int:job_id>", methods=["GET"])
+@require_auth
+def job_status(job_id):
+    job=_own_job(job_id)
+    if not job: return jsonify({"error":"Not found"}),404
+    return jsonify(job_dict(job))
+
+
+@app.route("/api/jobs/<int:job_id>/result", methods=["GET"])
+@require_auth
+def job_result(job_id):
+    job=_own_job(job_id)
+    if not job: return jsonify({"error":"Not found"}),404
+    if job.status!="done":
+        return jsonify({"error":f"job is {job.status}","job":job_dict(job)}),409
+    res=job.result or {}
+    if job.kind!="export":
+        return jsonify(res)
+    path=os.path.join(JOB_RESULT_DIR, os.path.basename(res.get("file","")))
+    if not os.path.isfile(path):
+        return jsonify({"error":"result file expired"}),410
+    return send_file(path,mimetype=res.get("mimetype"),as_attachment=True,download_name=res.get("download_name"))
+
+
+@app.route("/api/jobs/stats", methods=["GET"])
+def jobs_stats():
+    counts={s:n for s,n in db.session.execute(select(Job.status, func.count()).group_by(Job.status))}
+    return jsonify({"queue":counts,"runner":job_runner.stats()})
@@ -0,0 +1,141 @@
+from flask import request, jsonify, Response, stream_with_context
+from datetime import datetime
+import os, json, base64
+from sqlalchemy import select, and_, or_
+
+from core import db
+from serialization import get_serializer, json_default, json_dumps
+
+
+# ---------------- LIST HELPERS ----------------
+# List endpoints stream their JSON array row by row instead of loading the whole table.
+# Optional query args (all endpoints using list_response):
+#   fields=id,name      only select these columns (SQL-level projection)
+#   limit=100           page size; enables keyset pagination
+#   cursor=...          opaque value from the X-Next-Cursor header of the previous page
+#   order=created_at    keyset column ('id' default, or 'created_at' where the model has it); prefix '-' for descending
+LIST_STREAM_CHUNK = int(os.environ.get("LIST_STREAM_CHUNK", "1000"))
+LIST_DEFAULT_LIMIT = int(os.environ.get("LIST_DEFAULT_LIMIT", "100"))
+LIST_MAX_LIMIT = int(os.environ.get("LIST_MAX_LIMIT", "5000"))
+
+
+class ListArgsError(ValueError):
+    pass
+
+
+def _encode_cursor(values):
+    raw = json.dumps(values, default=json_default, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, key_cols):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception:
+        raise ListArgsError('invalid cursor')
+    if not isinstance(values, list) or len(values) != len(key_cols):
+        raise ListArgsError('invalid cursor')
+    out = []
+    for col, val in zip(key_cols, values):
+        if val is not None and isinstance(col.type, db.DateTime):
+            try:
+                val = datetime.fromisoformat(val)
+            except Exception:
+                raise ListArgsError('invalid cursor')
+        out.append(val)
+    return out
+
+
+def _keyset_after(key_cols, values, desc):
+    # (k1, k2) > (v1, v2) expanded so it works on both MySQL and SQLite and can use the index
+    clauses = []
+    for i, col in enumerate(key_cols):
+        cmp = col < values[i] if desc else col > values[i]
+        clauses.append(and_(*[key_cols[j] == values[j] for j in range(i)], cmp))
+    return or_(*clauses)
+
+
+def parse_list_args(model, args, default_order='id', default_limit=None):
+    """Validate fields/order/limit/cursor query args for a list endpoint."""
+    table_cols = model.__table__.columns
+    fields = [f.strip() for f in (args.get('fields') or '').split(',') if f.strip()]
+    for f in fields:
+        if f not in table_cols:
+            raise ListArgsError(f'unknown field: {f}')
+    order = args.get('order') or default_order
+    desc = order.startswith('-')
+    order = order.lstrip('-')
+    if order == 'id':
+        key_cols = [table_cols['id']]
+    elif order in ('created_at', 'timestamp') and order in table_cols:
+        key_cols = [table_cols[order], table_cols['id']]
+    else:
+        raise ListArgsError(f'cannot order by: {order}')
+    limit = args.get('limit')
+    cursor = args.get('cursor')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ListArgsError('limit must be an integer')
+        if limit < 1:
+            raise ListArgsError('limit must be positive')
+        limit = min(limit, LIST_MAX_LIMIT)
+    elif cursor:
+        limit = default_limit or LIST_DEFAULT_LIMIT
+    else:
+        limit = default_limit
+    after = _decode_cursor(cursor, key_cols) if cursor else None
+    return {'fields': fields, 'key_cols': key_cols, 'desc': desc, 'limit': limit, 'after': after}
+
+
+def _stream_json_array(rows, serializer):
+    # yield the array in chunks so large lists never exist as one string in memory;
+    # each chunk is encoded with a single json_dumps call
+    yield '['
+    first = True
+    buf = []
+    for row in rows:
+        buf.append(serializer.row(row))
+        if len(buf) >= LIST_STREAM_CHUNK:
+            yield ('' if first else ',') + json_dumps(buf)[1:-1]
+            first = False
+            buf = []
+    if buf:
+        yield ('' if first else ',') + json_dumps(buf)[1:-1]
+    yield ']'
+
+
+def list_response(model, *filters, default_order='id', default_limit=None):
+    """Stream a JSON array of model rows honouring fields/limit/cursor/order query args."""
+    try:
+        opts = parse_list_args(model, request.args, default_order, default_limit)
+    except ListArgsError as e:
+        return jsonify({'error': str(e)}), 400
+    table_cols = model.__table__.columns
+    keys = opts['fields'] or [c.name for c in table_cols]
+    key_cols = opts['key_cols']
+    # key columns are always selected so the next cursor can be computed; they are trimmed from output
+    extra = [c for c in key_cols if c.name not in keys]
+    stmt = select(*[table_cols[k] for k in keys], *extra)
+    for f in filters:
+        stmt = stmt.where(f)
+    if opts['after'] is not None:
+        stmt = stmt.where(_keyset_after(key_cols, opts['after'], opts['desc']))
+    stmt = stmt.order_by(*[c.desc() if opts['desc'] else c.asc() for c in key_cols])
+
+    headers = {}
+    if opts['limit'] is not None:
+        # a page is bounded by limit, so fetch one extra row to know whether another page exists
+        rows = db.session.execute(stmt.limit(opts['limit'] + 1)).all()
+        if len(rows) > opts['limit']:
+            rows = rows[:opts['limit']]
+            last = rows[-1]._mapping
+            headers['X-Next-Cursor'] = _encode_cursor([last[c.name] for c in key_cols])
+        rows = [tuple(r)[:len(keys)] for r in rows]
+    else:
+        result = db.session.execute(stmt.execution_options(yield_per=LIST_STREAM_CHUNK))
+        rows = (tuple(r)[:len(keys)] for r in result)
+    serializer = get_serializer(model, opts['fields'])
+    return Response(stream_with_context(_stream_json_array(rows, serializer)), mimetype='application/json', headers=headers)
@@ -0,0 +1,210 @@
+from flask import request, jsonify, g, Response, has_request_context
+from datetime import datetime
+import os, threading, time, bisect
+from collections import defaultdict, deque
+from sqlalchemy import event
+
+from core import app, db, pool_stats
+
+
+# ---------------- INSTRUMENTATION ----------------
+# Per-endpoint request latency, SQL statement counts and time (engine cursor events),
+# N+1 warnings and a slow-query log; GET /metrics exports them in Prometheus text format.
+# With METRICS_ENABLED=0 none of the request hooks or engine listeners are installed.
+#   SLOW_QUERY_MS=200  SLOW_QUERY_LOG_SIZE=200 (newest entries kept for /api/metrics/slow-queries)
+#   N_PLUS_ONE_THRESHOLD=10 (executions of one statement within one request that trigger a warning)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "10"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """Prometheus-style histogram with fixed upper bounds (not thread-safe; callers lock)."""
+    __slots__ = ('bounds', 'counts', 'total', 'n')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.n += 1
+
+    def lines(self, name, labels):
+        out, cum = [], 0
+        for bound, c in zip(self.bounds, self.counts):
+            cum += c
+            out.append(f'{name}_bucket{{{labels},le="{bound}"}} {cum}')
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.n}')
+        out.append(f'{name}_sum{{{labels}}} {self.total:.6f}')
+        out.append(f'{name}_count{{{labels}}} {self.n}')
+        return out
+
+
+class RequestStats:
+    """SQL activity of one request; only touched by the thread serving it."""
+    __slots__ = ('started', 'queries', 'sql_seconds', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = defaultdict(int)
+
+
+class RequestMetrics:
+    """Process-wide aggregates of request and SQL timings, keyed by (endpoint, method)."""
+
+    def __init__(self, slow_log_size):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.query_counts = {}
+        self.sql = defaultdict(lambda: [0, 0.0])  # (endpoint, method) -> [statements, seconds]
+        self.requests = defaultdict(int)  # (endpoint, method, status) -> count
+        self.n_plus_one = defaultdict(int)
+        self.background = [0, 0.0]  # statements run outside a request (startup, feed polling)
+        self.slow = deque(maxlen=slow_log_size)
+        self.slow_total = 0
+
+    def record_query(self, stats, statement, seconds, executemany):
+        if stats is None:
+            with self._lock:
+                self.background[0] += 1
+                self.background[1] += seconds
+        else:
+            stats.queries += 1
+            stats.sql_seconds += seconds
+            if not executemany:
+                stats.statements[statement] += 1
+                if stats.statements[statement] == N_PLUS_ONE_THRESHOLD:
+                    endpoint = request.endpoint or 'unmatched'
+                    with self._lock:
+                        self.n_plus_one[endpoint] += 1
+                    print(f"N+1 warning ({endpoint}): statement ran {N_PLUS_ONE_THRESHOLD} times in one request:",
+                          ' '.join(statement.split())[:300])
+        if seconds * 1000.0 >= SLOW_QUERY_MS:
+            endpoint = (request.endpoint or 'unmatched') if stats is not None else None
+            entry = {'at': datetime.utcnow().isoformat(), 'endpoint': endpoint, 'ms': round(seconds * 1000.0, 3),
+                     'executemany': executemany, 'statement': ' '.join(statement.split())[:2000]}
+            with self._lock:
+                self.slow.append(entry)
+                self.slow_total += 1
+            print(f"Slow query ({entry['ms']} ms, {endpoint or 'background'}):", entry['statement'][:300])
+
+    def finish(self, stats, endpoint, method, status):
+        elapsed = time.perf_counter() - stats.started
+        key = (endpoint, method)
+        with self._lock:
+            hist = self.latency.get(key)
+            if hist is None:
+                hist = self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.query_counts[key] = Histogram(QUERY_COUNT_BUCKETS)
+            hist.observe(elapsed)
+            self.query_counts[key].observe(stats.queries)
+            sql = self.sql[key]
+            sql[0] += stats.queries
+            sql[1] += stats.sql_seconds
+            self.requests[(endpoint, method, status)] += 1
+
+    def slow_queries(self):
+        with self._lock:
+            return {'threshold_ms': SLOW_QUERY_MS, 'total': self.slow_total, 'queries': list(self.slow)[::-1]}
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        out = []
+        with self._lock:
+            out += ['# HELP http_request_duration_seconds Request latency until the response body is sent.',
+                    '# TYPE http_request_duration_seconds histogram']
+            for (endpoint, method), hist in sorted(self.latency.items()):
+                out += hist.lines('http_request_duration_seconds', f'endpoint="{endpoint}",method="{method}"')
+            out += ['# HELP http_requests_total Requests by endpoint, method and status code.',
+                    '# TYPE http_requests_total counter']
+            for (endpoint, method, status), n in sorted(self.requests.items()):
+                out.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {n}')
+            out += ['# HELP db_queries_per_request SQL statements executed per request.',
+                    '# TYPE db_queries_per_request histogram']
+            for (endpoint, method), hist in sorted(self.query_counts.items()):
+                out += hist.lines('db_queries_per_request', f'endpoint="{endpoint}",method="{method}"')
+            out += ['# HELP db_queries_total SQL statements executed (executemany counts once).',
+                    '# TYPE db_queries_total counter']
+            for (endpoint, method), (n, _) in sorted(self.sql.items()):
+                out.append(f'db_queries_total{{endpoint="{endpoint}",method="{method}"}} {n}')
+            out.append(f'db_queries_total{{endpoint="",method=""}} {self.background[0]}')
+            out += ['# HELP db_query_seconds_total Time spent executing SQL statements.',
+                    '# TYPE db_query_seconds_total counter']
+            for (endpoint, method), (_, secs) in sorted(self.sql.items()):
+                out.append(f'db_query_seconds_total{{endpoint="{endpoint}",method="{method}"}} {secs:.6f}')
+            out.append(f'db_query_seconds_total{{endpoint="",method=""}} {self.background[1]:.6f}')
+            out += ['# HELP db_n_plus_one_warnings_total Requests that repeated one statement N_PLUS_ONE_THRESHOLD times.',
+                    '# TYPE db_n_plus_one_warnings_total counter']
+            for endpoint, n in sorted(self.n_plus_one.items()):
+                out.append(f'db_n_plus_one_warnings_total{{endpoint="{endpoint}"}} {n}')
+            out += ['# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+                    '# TYPE db_slow_queries_total counter', f'db_slow_queries_total {self.slow_total}']
+        return out
+
+
+request_metrics = RequestMetrics(SLOW_QUERY_LOG_SIZE)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    stats = g.get('perf') if has_request_context() else None
+    request_metrics.record_query(stats, statement, elapsed, executemany)
+
+
+def _start_request_stats():
+    g.perf = RequestStats()
+
+
+def _finish_request_stats(response):
+    stats = g.get('perf')
+    if stats is not None:
+        endpoint, method, status = request.endpoint or 'unmatched', request.method, response.status_code
+        if response.direct_passthrough:
+            # send_file bodies are built already, and the server never calls their close hooks
+            request_metrics.finish(stats, endpoint, method, status)
+        else:
+            # streamed bodies keep querying after this hook; count the request once the body is sent
+            response.call_on_close(lambda: request_metrics.finish(stats, endpoint, method, status))
+    return response
+
+
+if METRICS_ENABLED:
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request_stats)
+    app.after_request(_finish_request_stats)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    out = request_metrics.render() if METRICS_ENABLED else []
+    pool = pool_stats.snapshot()
+    out += ['# HELP db_pool_checkouts_total Connections checked out of the pool.',
+            '# TYPE db_pool_checkouts_total counter', f"db_pool_checkouts_total {pool['checkouts']}",
+            '# HELP db_pool_timeouts_total Checkouts that timed out waiting for a connection.',
+            '# TYPE db_pool_timeouts_total counter', f"db_pool_timeouts_total {pool['timeouts']}",
+            '# HELP db_pool_wait_seconds_total Time spent waiting for a pooled connection.',
+            '# TYPE db_pool_wait_seconds_total counter', f"db_pool_wait_seconds_total {pool['wait_seconds_total']}"]
+    if 'checked_out' in pool:
+        out += ['# HELP db_pool_checked_out Connections currently in use.',
+                '# TYPE db_pool_checked_out gauge', f"db_pool_checked_out {pool['checked_out']}"]
+    return Response('\n'.join(out) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/metrics/slow-queries', methods=['GET'])
+def slow_queries():
+    return jsonify(request_metrics.slow_queries())
@@ -0,0 +1,192 @@
+from datetime import datetime
+import secrets
+from sqlalchemy.orm import validates
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from core import db
+
+
+# ---------------- MODELS ----------------
+def parse_datetime(val):
+    """Parse an ISO date/datetime string ('2025-01-31', '2025-01-31T08:00:00Z') into a naive datetime."""
+    if val is None or isinstance(val, datetime):
+        return val
+    val = str(val).strip()
+    if not val:
+        return None
+    try:
+        parsed = datetime.fromisoformat(val)
+    except ValueError:
+        raise ValueError(f'invalid date: {val!r} (expected YYYY-MM-DD or ISO datetime)')
+    return parsed.replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+class Product(db.Model):
+    __table_args__ = (db.Index('ix_product_created', 'created_at', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100))
+    type = db.Column(db.String(20)) # raw or finished
+    stock_qty = db.Column(db.Integer, default=0)
+    # owner reference: which user created this product
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class BOM(db.Model):
+    __table_args__ = (db.Index('ix_bom_product', 'product_id', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("product.id"))
+    # store structured JSON for easy validation and querying
+    components = db.Column(db.JSON)  # list of {product_id, qty}
+    operations = db.Column(db.JSON)  # list of {name, work_center, time}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ManufacturingOrder(db.Model):
+    __table_args__ = (
+        db.Index('ix_mo_status_created', 'status', 'created_at'),
+        db.Index('ix_mo_status_deadline', 'status', 'deadline'),
+        db.Index('ix_mo_created', 'created_at', 'id'),
+        db.Index('ix_mo_product', 'product_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("product.id"))
+    quantity = db.Column(db.Integer)
+    status = db.Column(db.String(20), default="planned")
+    start_date = db.Column(db.DateTime)
+    deadline = db.Column(db.DateTime)
+    assignee = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @validates('start_date', 'deadline')
+    def _parse_dates(self, key, val):
+        # clients send ISO dates/datetimes as strings
+        return parse_datetime(val)
+
+class WorkOrder(db.Model):
+    __table_args__ = (
+        db.Index('ix_wo_mo', 'mo_id'),
+        db.Index('ix_wo_status_center', 'status', 'work_center'),
+        db.Index('ix_wo_center_sched', 'work_center', 'scheduled_start'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    mo_id = db.Column(db.Integer, db.ForeignKey("manufacturing_order.id"))
+    manufactured_id = db.Column(db.Integer, db.ForeignKey("product.id"))
+    operation = db.Column(db.String(100))
+    work_center = db.Column(db.String(100))
+    planned_time_mins = db.Column(db.Integer)
+    status = db.Column(db.String(20), default="planned")
+    operator_id = db.Column(db.String(50))
+    start_time = db.Column(db.DateTime)
+    end_time = db.Column(db.DateTime)
+    comments = db.Column(db.Text)
+    # slot assigned by the finite-capacity scheduler (POST /api/schedule)
+    scheduled_start = db.Column(db.DateTime)
+    scheduled_end = db.Column(db.DateTime)
+
+class StockLedger(db.Model):
+    __table_args__ = (
+        db.Index('ix_ledger_product_ts', 'product_id', 'timestamp'),
+        db.Index('ix_ledger_ts', 'timestamp'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("product.id"))
+    movement_type = db.Column(db.String(10)) # in / out
+    quantity = db.Column(db.Integer)
+    reference = db.Column(db.String(50))
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class StockSnapshot(db.Model):
+    # on-hand of a product including every ledger row with timestamp <= as_of
+    __tablename__ = 'stock_snapshot'
+    __table_args__ = (db.UniqueConstraint('product_id', 'as_of', name='uq_stock_snapshot_product_as_of'),)
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)
+    qty = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ChangeEvent(db.Model):
+    # change feed: the autoincrement id is the monotonic sequence clients resume from
+    __tablename__ = 'change_event'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # order / work_order / stock / schedule
+    op = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer)
+    data = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Job(db.Model):
+    # background job queue; workers claim rows with a compare-and-set UPDATE on status
+    __tablename__ = 'job'
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / done / failed
+    idempotency_key = db.Column(db.String(200), unique=True)
+    params = db.Column(db.JSON)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    created_by = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+
+class WoStatusEvent(db.Model):
+    # WO status changes the write-behind batcher could not apply from memory (queue full,
+    # failed commit, ack timeout); the next batch of any worker applies them in id order and
+    # deletes them. A row that keeps failing is kept with failed_at set and no longer retried.
+    __tablename__ = 'wo_status_event'
+    id = db.Column(db.Integer, primary_key=True)
+    wo_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    check_stock = db.Column(db.Boolean)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(500))
+    failed_at = db.Column(db.DateTime)
+
+
+class ResourceVersion(db.Model):
+    # version stamp per table, bumped after every committed write; drives ETag / Last-Modified
+    __tablename__ = 'resource_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(200), unique=True, nullable=False)
+    password_hash = db.Column(db.String(200), nullable=False)
+    role = db.Column(db.String(50), default="Operator")
+    name = db.Column(db.String(200))
+    token = db.Column(db.String(200), index=True)
+    otp_code = db.Column(db.String(20))
+    otp_expiry = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # when the token or the identity cached by attach_user last changed; workers poll it to
+    # drop just those users from their token caches
+    auth_changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_user_auth_changed', 'auth_changed_at'),)
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+
+    def generate_token(self):
+        self.token = secrets.token_hex(24)
+        return self.token
+
+    @validates('token', 'email', 'role', 'name')
+    def _stamp_auth_change(self, key, val):
+        self.auth_changed_at = datetime.utcnow()
+        return val
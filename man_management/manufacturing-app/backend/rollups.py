@@ -0,0 +1,143 @@
+from datetime import datetime
+from collections import defaultdict
+from sqlalchemy import inspect, select, event
+from sqlalchemy.orm import Session
+
+from core import db
+from models import ManufacturingOrder, StockLedger, WorkOrder
+
+
+# ---------------- REPORT ROLLUPS ----------------
+# Daily aggregates maintained incrementally as MOs, WOs and ledger rows are written.
+# One row per (day, product_id, work_center, metric); 0 / '' stand for "none" so the
+# unique key also works on databases where NULLs never collide.
+# Metrics:
+#   mo:<status>      MOs created that day, counted under their current status
+#   wo_completed     WOs completed that day (day of end_time)
+#   wo_planned_mins  planned minutes of those completed WOs
+#   wo_actual_mins   end_time - start_time of those completed WOs
+#   stock_in/out     ledger quantities posted that day
+class ReportRollup(db.Model):
+    __tablename__ = 'report_rollup'
+    __table_args__ = (db.UniqueConstraint('day', 'product_id', 'work_center', 'metric', name='uq_report_rollup_key'),)
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    product_id = db.Column(db.Integer, nullable=False, default=0)
+    work_center = db.Column(db.String(100), nullable=False, default='')
+    metric = db.Column(db.String(40), nullable=False)
+    value = db.Column(db.Float, nullable=False, default=0)
+
+
+# columns each model's rollup contribution depends on
+ROLLUP_ATTRS = {
+    ManufacturingOrder: ('created_at', 'product_id', 'status'),
+    WorkOrder: ('end_time', 'start_time', 'planned_time_mins', 'manufactured_id', 'work_center'),
+    StockLedger: ('timestamp', 'product_id', 'movement_type', 'quantity'),
+}
+
+
+def rollup_contrib(model, vals):
+    """Return [(key, delta)] that one row with column values vals adds to the rollup."""
+    if model is ManufacturingOrder:
+        created_at, product_id, status = vals
+        day = (created_at or datetime.utcnow()).date()
+        return [((day, product_id or 0, '', 'mo:' + (status or 'planned')), 1)]
+    if model is WorkOrder:
+        end_time, start_time, planned, product_id, work_center = vals
+        if end_time is None:
+            return []
+        key = (end_time.date(), product_id or 0, work_center or '')
+        out = [(key + ('wo_completed',), 1), (key + ('wo_planned_mins',), planned or 0)]
+        if start_time is not None:
+            out.append((key + ('wo_actual_mins',), (end_time - start_time).total_seconds() / 60.0))
+        return out
+    if model is StockLedger:
+        ts, product_id, movement_type, quantity = vals
+        metric = 'stock_in' if movement_type == 'in' else 'stock_out'
+        return [(((ts or datetime.utcnow()).date(), product_id or 0, '', metric), quantity or 0)]
+    return []
+
+
+def _rollup_upsert_stmt(dialect):
+    t = ReportRollup.__table__
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(t)
+        return stmt.on_duplicate_key_update(value=t.c.value + stmt.inserted.value)
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    stmt = dialect_insert(t)
+    return stmt.on_conflict_do_update(index_elements=[t.c.day, t.c.product_id, t.c.work_center, t.c.metric],
+                                      set_={'value': t.c.value + stmt.excluded.value})
+
+
+def apply_rollup_deltas(conn, deltas):
+    """Atomically add {(day, product_id, work_center, metric): delta} to the rollup table using conn."""
+    params = [{'day': k[0], 'product_id': k[1], 'work_center': k[2], 'metric': k[3], 'value': v}
+              for k, v in deltas.items() if v]
+    if params:
+        conn.execute(_rollup_upsert_stmt(conn.dialect.name), params)
+
+
+def history_old(state, attr):
+    h = state.attrs[attr].history
+    if h.deleted:
+        return h.deleted[0]
+    return h.unchanged[0] if h.unchanged else None
+
+
+@event.listens_for(Session, 'before_flush')
+def _guard_append_only_ledger(session, flush_context, instances):
+    # the ledger is append-only: corrections are new compensating entries
+    for obj in session.deleted:
+        if isinstance(obj, StockLedger):
+            raise ValueError('stock ledger is append-only; post a compensating entry instead')
+    for obj in session.dirty:
+        if isinstance(obj, StockLedger) and session.is_modified(obj):
+            raise ValueError('stock ledger is append-only; post a compensating entry instead')
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_rollups_after_flush(session, flush_context):
+    # runs inside the flush transaction so the rollup commits (or rolls back) with the write itself
+    deltas = defaultdict(float)
+    for obj in session.new:
+        attrs = ROLLUP_ATTRS.get(type(obj))
+        if attrs:
+            for key, d in rollup_contrib(type(obj), [getattr(obj, a) for a in attrs]):
+                deltas[key] += d
+    for obj in session.deleted:
+        attrs = ROLLUP_ATTRS.get(type(obj))
+        if attrs:
+            state = inspect(obj)
+            for key, d in rollup_contrib(type(obj), [history_old(state, a) for a in attrs]):
+                deltas[key] -= d
+    for obj in session.dirty:
+        attrs = ROLLUP_ATTRS.get(type(obj))
+        if not attrs:
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[a].history.has_changes() for a in attrs):
+            continue
+        for key, d in rollup_contrib(type(obj), [history_old(state, a) for a in attrs]):
+            deltas[key] -= d
+        for key, d in rollup_contrib(type(obj), [getattr(obj, a) for a in attrs]):
+            deltas[key] += d
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+def rebuild_rollups():
+    """Recompute the rollup table from the full MO / WO / ledger history (one streaming pass each)."""
+    deltas = defaultdict(float)
+    for model, attrs in ROLLUP_ATTRS.items():
+        cols = [model.__table__.columns[a] for a in attrs]
+        for row in db.session.execute(select(*cols).execution_options(yield_per=5000)):
+            for key, d in rollup_contrib(model, row):
+                deltas[key] += d
+    db.session.execute(ReportRollup.__table__.delete())
+    apply_rollup_deltas(db.session.connection(), deltas)
+    db.session.commit()
+    return len(deltas)
@@ -0,0 +1,317 @@
+from flask import request, jsonify
+from datetime import datetime, timedelta
+import os, json, time, bisect, heapq
+from sqlalchemy import select, or_, func, bindparam
+
+from core import app, db
+from models import Job, ManufacturingOrder, parse_datetime, WorkOrder
+from versions import touch_resources
+from auth import require_auth
+from changes import record_change
+from jobs import enqueue_job, JOB_HANDLERS, JOB_RESULT_TTL_HOURS
+
+
+# ---------------- SCHEDULER ----------------
+# Finite-capacity scheduling of open WOs onto work centers.
+# Time is measured in working minutes of a shift calendar, so an operation's length is
+# constant wherever it lands. Each work center has `capacity` parallel machines, each a
+# sorted list of busy intervals searched with bisect (gaps are backfilled). MOs are
+# dispatched from a heap ordered by deadline (EDD); the WOs of an MO run in id order,
+# each one ready when its predecessor ends. Started WOs stay where they are.
+#   SCHEDULE_SHIFT=00:00-24:00   daily working window
+#   SCHEDULE_WORKDAYS=0,1,2,3,4,5,6   Monday=0
+#   WORK_CENTER_CAPACITY={"WC1": 2}   machines per center (default WORK_CENTER_DEFAULT_CAPACITY=1)
+#   SCHEDULE_ON_STATUS_CHANGE=1   reschedule when a scheduled WO changes status; the re-plan
+#                                 runs as a 'reschedule' job, one per SCHEDULE_DEBOUNCE_SECONDS
+#   SCHEDULE_DEBOUNCE_SECONDS=10   status changes within one window share a single reschedule
+#   SCHEDULE_FROZEN_MINUTES=60   slots starting within this horizon are kept on those reschedules
+SCHEDULE_SHIFT = os.environ.get("SCHEDULE_SHIFT", "00:00-24:00")
+SCHEDULE_WORKDAYS = os.environ.get("SCHEDULE_WORKDAYS", "0,1,2,3,4,5,6")
+WORK_CENTER_CAPACITY = json.loads(os.environ.get("WORK_CENTER_CAPACITY", "{}") or "{}")
+WORK_CENTER_DEFAULT_CAPACITY = int(os.environ.get("WORK_CENTER_DEFAULT_CAPACITY", "1"))
+SCHEDULE_ON_STATUS_CHANGE = os.environ.get("SCHEDULE_ON_STATUS_CHANGE", "1") == "1"
+SCHEDULE_DEBOUNCE_SECONDS = float(os.environ.get("SCHEDULE_DEBOUNCE_SECONDS", "10"))
+SCHEDULE_FROZEN_MINUTES = int(os.environ.get("SCHEDULE_FROZEN_MINUTES", "60"))
+CLOSED_WO_STATUSES = ('completed', 'done', 'cancelled')
+
+
+class ShiftCalendar:
+    """Maps wall-clock datetimes to working minutes counted from the Monday of origin's week."""
+
+    def __init__(self, origin, shift=SCHEDULE_SHIFT, workdays=SCHEDULE_WORKDAYS):
+        start, end = shift.split('-')
+        self.start = int(start[:2]) * 60 + int(start[3:5])
+        self.end = int(end[:2]) * 60 + int(end[3:5])
+        self.length = self.end - self.start
+        self.workdays = sorted({int(x) for x in str(workdays).split(',') if x.strip()})
+        if self.length <= 0 or not self.workdays:
+            raise ValueError('SCHEDULE_SHIFT must be HH:MM-HH:MM with end after start and SCHEDULE_WORKDAYS non-empty')
+        monday = origin.date() - timedelta(days=origin.weekday())
+        self.origin = datetime(monday.year, monday.month, monday.day)
+        # rank[wd] = workdays strictly before weekday wd
+        self._rank = [sum(1 for w in self.workdays if w < wd) for wd in range(8)]
+
+    def to_minutes(self, dt):
+        """Working minutes at dt; non-working times snap forward to the next shift start."""
+        delta = dt - self.origin
+        week, wd = divmod(delta.days, 7)
+        minute = delta.seconds // 60
+        n = len(self.workdays)
+        if wd in self.workdays and minute < self.end:
+            return (week * n + self._rank[wd]) * self.length + max(minute - self.start, 0)
+        return (week * n + self._rank[wd + 1]) * self.length
+
+    def to_datetime(self, minutes, end=False):
+        """Wall-clock time of a working minute; with end=True a shift-end boundary stays on its own day."""
+        if end and minutes > 0 and minutes % self.length == 0:
+            return self.to_datetime(minutes - 1) + timedelta(minutes=1)
+        day, m = divmod(minutes, self.length)
+        week, k = divmod(day, len(self.workdays))
+        return self.origin + timedelta(days=week * 7 + self.workdays[k], minutes=self.start + m)
+
+
+class _Machine:
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self):
+        self.starts, self.ends = [], []
+
+    def earliest_fit(self, t, dur):
+        # intervals never overlap, so ends are sorted as well
+        starts, ends = self.starts, self.ends
+        i = bisect.bisect_right(ends, t)
+        n = len(starts)
+        while i < n and starts[i] < t + dur:
+            # the gap before interval i is too short: continue after it
+            if ends[i] > t:
+                t = ends[i]
+            i += 1
+        return t, i
+
+    def reserve(self, start, end, i=None):
+        if end <= start:
+            return
+        if i is None:
+            i = bisect.bisect_left(self.starts, start)
+        starts, ends = self.starts, self.ends
+        # coalesce with touching neighbours so a packed machine stays a few long intervals
+        left = i > 0 and ends[i - 1] == start
+        right = i < len(starts) and starts[i] == end
+        if left and right:
+            ends[i - 1] = ends[i]
+            del starts[i], ends[i]
+        elif left:
+            ends[i - 1] = end
+        elif right:
+            starts[i] = start
+        else:
+            starts.insert(i, start)
+            ends.insert(i, end)
+
+
+def build_schedule(jobs, capacity, default_capacity=1):
+    """Place the operations of every job on finite-capacity work centers.
+
+    jobs: iterable of (job_id, release, deadline or None, ops) where ops is the ordered list
+    of (op_id, work_center, duration, fixed_start or None, pinned); all times in working
+    minutes. Pinned operations (running) occupy exactly fixed_start; other fixed ones
+    (frozen) take the earliest free slot from fixed_start. Returns {op_id: (start, end)}.
+    """
+    machines = {}
+
+    def center(wc):
+        if wc not in machines:
+            machines[wc] = [_Machine() for _ in range(max(int(capacity.get(wc, default_capacity)), 1))]
+        return machines[wc]
+
+    def place(wc, t, dur):
+        best = None
+        for m in center(wc):
+            start, i = m.earliest_fit(t, dur)
+            if best is None or start < best[0]:
+                best = (start, i, m)
+        start, i, m = best
+        m.reserve(start, start + dur, i)
+        return start, start + dur
+
+    heap = []
+    out = {}
+    frozen = []
+    for job_id, release, deadline, ops in jobs:
+        if not ops:
+            continue
+        # running operations claim their machine time before anything else is placed
+        for op_id, wc, dur, fixed, pinned in ops:
+            if pinned:
+                ms = center(wc)
+                m = next((m for m in ms if m.earliest_fit(fixed, dur)[0] == fixed), ms[0])
+                m.reserve(fixed, fixed + dur)
+                out[op_id] = (fixed, fixed + dur)
+            elif fixed is not None:
+                frozen.append((fixed, op_id, wc, dur))
+        heapq.heappush(heap, (float('inf') if deadline is None else deadline, release, job_id, 0, ops))
+    for fixed, op_id, wc, dur in sorted(frozen):
+        out[op_id] = place(wc, fixed, dur)
+    while heap:
+        deadline, ready, job_id, k, ops = heapq.heappop(heap)
+        op_id, wc, dur, fixed, pinned = ops[k]
+        if fixed is None:
+            out[op_id] = place(wc, ready, dur)
+        if k + 1 < len(ops):
+            heapq.heappush(heap, (deadline, max(ready, out[op_id][1]), job_id, k + 1, ops))
+    return out
+
+
+def _open_work_orders():
+    W, M = WorkOrder, ManufacturingOrder
+    stmt = (select(W.id, W.mo_id, W.work_center, W.planned_time_mins, W.status, W.start_time, W.scheduled_start,
+                   M.deadline, M.start_date)
+            .outerjoin(M, M.id == W.mo_id)
+            .where(or_(W.status.is_(None), W.status.not_in(CLOSED_WO_STATUSES)))
+            .order_by(W.mo_id, W.id))
+    return db.session.execute(stmt.execution_options(yield_per=10000))
+
+
+def run_scheduler(frozen_before=None, now=None):
+    """Schedule all open WOs and store their slots; returns a summary.
+
+    With frozen_before, WOs scheduled to start between now and that time keep their slot
+    (or the next free one, if a running WO overran into it) and only the rest of the plan
+    is recomputed (incremental rescheduling).
+    """
+    t0 = time.perf_counter()
+    now = now or datetime.utcnow()
+    cal = ShiftCalendar(now)
+    now_m = cal.to_minutes(now)
+    jobs, deadlines = {}, {}
+    for wo_id, mo_id, wc, mins, status, started, sched, deadline, start_date in _open_work_orders():
+        dur = max(int(mins or 0), 0)
+        fixed, pinned = None, False
+        if status == 'started' and started is not None:
+            # running: occupies its machine from now for whatever is left of the planned time
+            done = max(int((now - started).total_seconds() // 60), 0)
+            fixed, dur, pinned = now_m, max(dur - done, 0), True
+        elif frozen_before is not None and sched is not None and now <= sched < frozen_before:
+            fixed = cal.to_minutes(sched)
+        job = jobs.get(mo_id)
+        if job is None:
+            release = max(cal.to_minutes(start_date), now_m) if start_date else now_m
+            job = jobs[mo_id] = (mo_id, release, cal.to_minutes(deadline) if deadline else None, [])
+            deadlines[mo_id] = deadline
+        job[3].append((wo_id, wc or '', dur, fixed, pinned))
+    plan = build_schedule(jobs.values(), WORK_CENTER_CAPACITY, WORK_CENTER_DEFAULT_CAPACITY)
+    t = WorkOrder.__table__
+    params = [{'b_id': wo_id, 'b_start': cal.to_datetime(s), 'b_end': cal.to_datetime(e, end=True)}
+              for wo_id, (s, e) in plan.items()]
+    if params:
+        db.session.execute(t.update().where(t.c.id == bindparam('b_id')).values(
+            scheduled_start=bindparam('b_start'), scheduled_end=bindparam('b_end')), params)
+        touch_resources(db.session, 'work_order')
+    record_change('schedule', 'run', None, {'scheduled': len(params)})
+    db.session.commit()
+    finish = {}
+    for mo_id, _, _, ops in jobs.values():
+        if ops:
+            finish[mo_id] = max(plan[op[0]][1] for op in ops)
+    late = sum(1 for mo_id, m in finish.items() if deadlines.get(mo_id) and cal.to_datetime(m, end=True) > deadlines[mo_id])
+    return {'scheduled': len(plan), 'mos': len(finish), 'late_mos': late,
+            'makespan_end': cal.to_datetime(max(finish.values()), end=True).isoformat() if finish else None,
+            'elapsed_ms': round((time.perf_counter() - t0) * 1000, 1)}
+
+
+def reschedule_from(when):
+    """Incremental reschedule: keep slots starting before `when`, re-plan everything after it."""
+    return run_scheduler(frozen_before=when)
+
+
+def reschedule_after_status_change():
+    return reschedule_from(datetime.utcnow() + timedelta(minutes=SCHEDULE_FROZEN_MINUTES))
+
+
+_reschedule_slot = None  # debounce window this process last queued a reschedule for
+
+
+def request_reschedule():
+    """Queue the reschedule for the current debounce window (commits); returns the job.
+
+    The window number is the job's idempotency key, so every status change of every worker
+    in that window lands on one job, which runs when the window closes. Each process hits
+    the job table at most once per window.
+    """
+    global _reschedule_slot
+    window = max(SCHEDULE_DEBOUNCE_SECONDS, 0.001)
+    slot = int(time.time() // window)
+    if slot == _reschedule_slot:
+        return None
+    job, _ = enqueue_job('reschedule', {}, idempotency_key=f'reschedule:{slot}',
+                         run_after=datetime.utcnow() + timedelta(seconds=(slot + 1) * window - time.time()))
+    _reschedule_slot = slot
+    return job
+
+
+@app.route("/api/schedule", methods=["POST"])
+@require_auth
+def schedule_run():
+    # full re-plan, or {"from": ISO datetime} to keep slots starting before it
+    d=request.get_json(silent=True) or {}
+    try:
+        frozen=parse_datetime(d.get("from"))
+        return jsonify(run_scheduler(frozen_before=frozen))
+    except ValueError as e:
+        return jsonify({"error":str(e)}),400
+
+
+@app.route("/api/schedule/gantt", methods=["GET"])
+def schedule_gantt():
+    # ?work_center=&from=&to= (ISO); bars grouped by work center
+    W=WorkOrder
+    filters=[W.scheduled_start.isnot(None), or_(W.status.is_(None), W.status.not_in(CLOSED_WO_STATUSES))]
+    try:
+        if request.args.get("from"): filters.append(W.scheduled_end >= parse_datetime(request.args["from"]))
+        if request.args.get("to"): filters.append(W.scheduled_start <= parse_datetime(request.args["to"]))
+    except ValueError as e:
+        return jsonify({"error":str(e)}),400
+    if request.args.get("work_center") is not None:
+        filters.append(W.work_center==request.args["work_center"])
+    stmt=select(W.work_center, W.id, W.mo_id, W.operation, W.status, W.scheduled_start, W.scheduled_end).where(*filters).order_by(W.work_center, W.scheduled_start)
+    centers={}
+    for wc, wo_id, mo_id, op, status, start, end in db.session.execute(stmt):
+        centers.setdefault(wc or "", []).append({"wo_id":wo_id,"mo_id":mo_id,"operation":op,"status":status,
+                                                "start":start.isoformat(),"end":end.isoformat()})
+    return jsonify([{"work_center":wc,"bars":bars} for wc,bars in centers.items()])
+
+
+@app.route("/api/schedule/lateness", methods=["GET"])
+def schedule_lateness():
+    # planned completion (last scheduled WO end) vs deadline per MO; ?all=1 includes on-time MOs
+    W,M=WorkOrder,ManufacturingOrder
+    finish=select(W.mo_id, func.max(W.scheduled_end).label("planned_end")).where(W.scheduled_end.isnot(None)).group_by(W.mo_id).subquery()
+    stmt=select(M.id, M.deadline, finish.c.planned_end).join(finish, finish.c.mo_id==M.id).order_by(M.deadline)
+    rows=[]
+    for mo_id, deadline, planned_end in db.session.execute(stmt):
+        lateness=(planned_end-deadline).total_seconds()/60.0 if deadline else None
+        if request.args.get("all")=="1" or (lateness is not None and lateness>0):
+            rows.append({"mo_id":mo_id,"deadline":deadline.isoformat() if deadline else None,
+                         "planned_end":planned_end.isoformat(),"lateness_mins":lateness})
+    late=[r for r in rows if r["lateness_mins"] and r["lateness_mins"]>0]
+    return jsonify({"late_mos":len(late),"total_lateness_mins":sum(r["lateness_mins"] for r in late),"mos":rows})
+
+
+def _job_schedule(params, job_id):
+    frozen = parse_datetime(params['from']) if params.get('from') else None
+    return run_scheduler(frozen_before=frozen)
+
+
+def _job_reschedule(params, job_id):
+    # queued by request_reschedule(); finished ones are dropped after JOB_RESULT_TTL_HOURS
+    # since every debounce window with status changes leaves one behind
+    t = Job.__table__
+    db.session.execute(t.delete().where(t.c.kind == 'reschedule', t.c.status == 'done',
+                                        t.c.finished_at < datetime.utcnow() - timedelta(hours=JOB_RESULT_TTL_HOURS)))
+    return reschedule_after_status_change()
+
+
+JOB_HANDLERS.update({
+    'schedule': _job_schedule,
+    'reschedule': _job_reschedule,
+})
@@ -0,0 +1,85 @@
+from datetime import datetime
+import os, json, operator
+
+from core import db
+from models import BOM, ManufacturingOrder, Product, StockLedger, User, WorkOrder
+
+
+# ---------------- SERIALIZATION ----------------
+# Optional fast JSON encoder: JSON_ENCODER=auto (orjson when installed), orjson or json
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "auto").lower()
+try:
+    import orjson
+except ImportError:
+    orjson = None
+if JSON_ENCODER == "orjson" and orjson is None:
+    print("JSON_ENCODER=orjson requested but orjson is not installed; falling back to json")
+
+
+def json_default(val):
+    if isinstance(val, datetime):
+        return val.isoformat()
+    return str(val)
+
+
+if orjson is not None and JSON_ENCODER in ("auto", "orjson"):
+    def json_dumps(val):
+        return orjson.dumps(val, default=json_default).decode()
+else:
+    def json_dumps(val):
+        return json.dumps(val, default=json_default, separators=(',', ':'))
+
+
+class RowSerializer:
+    """Serializer compiled once per (model, columns).
+
+    Maps ORM instances (obj) or Core result tuples (row) to JSON-ready dicts without
+    per-value reflection: column names, the attribute getter and the positions of
+    datetime columns are all resolved up front.
+    """
+    __slots__ = ('keys', 'dt_idx', '_get')
+
+    def __init__(self, columns):
+        self.keys = tuple(c.name for c in columns)
+        self.dt_idx = tuple(i for i, c in enumerate(columns) if isinstance(c.type, db.DateTime))
+        if len(self.keys) == 1:
+            key = self.keys[0]
+            self._get = lambda o: (getattr(o, key),)
+        else:
+            self._get = operator.attrgetter(*self.keys)
+
+    def row(self, values):
+        if self.dt_idx:
+            values = list(values)
+            for i in self.dt_idx:
+                v = values[i]
+                if v is not None:
+                    values[i] = v.isoformat()
+        return dict(zip(self.keys, values))
+
+    def obj(self, obj):
+        return self.row(self._get(obj))
+
+
+_serializers = {}
+
+
+def get_serializer(model, fields=None):
+    """Return the cached RowSerializer for model (optionally restricted to fields)."""
+    key = (model, tuple(fields) if fields else None)
+    ser = _serializers.get(key)
+    if ser is None:
+        cols = model.__table__.columns
+        ser = RowSerializer([cols[f] for f in fields] if fields else list(cols))
+        _serializers[key] = ser
+    return ser
+
+
+# compile the full-row serializers once at startup
+for _model in (Product, BOM, ManufacturingOrder, WorkOrder, StockLedger, User):
+    get_serializer(_model)
+
+
+def to_dict(obj):
+    # Convert SQLAlchemy model to plain dict with JSON-serializable values
+    return get_serializer(type(obj)).obj(obj)
@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# a throwaway SQLite database and no background job threads; set before app is imported
+os.environ["DB_DIALECT"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="mfg_test_"), "test.db")
+os.environ.setdefault("JOB_WORKERS", "0")
+os.environ.setdefault("WO_STATUS_BATCH", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as A  # noqa: E402
+import changes, core, http_cache, models  # noqa: E402
+from auth import token_cache  # noqa: E402
+
+
+def _reset_process_state():
+    token_cache.clear()
+    http_cache.response_cache.clear()
+    A.bom_cache.invalidate()
+    A._search_modes.clear()
+    with A.resource_versions._lock:
+        A.resource_versions._loaded_at = None
+    changes.change_feed = changes.ChangeFeed(changes.CHANGE_FEED_BUFFER)
+
+
+@pytest.fixture
+def app():
+    """The Flask app on a fresh, initialized database (one per test)."""
+    with A.app.app_context():
+        A.db.session.remove()
+        A.db.engine.dispose()
+    if os.path.exists(core.SQLITE_PATH):
+        os.remove(core.SQLITE_PATH)
+    _reset_process_state()
+    with A.app.app_context():
+        A.init_db()
+        A.db.session.remove()
+    yield A.app
+    with A.app.app_context():
+        A.db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+        A.db.session.remove()
+
+
+def signup(client, email="op@example.com", role="Manager"):
+    r = client.post("/api/auth/signup", json={"email": email, "password": "pw", "role": role})
+    assert r.status_code == 201, r.get_data(as_text=True)
+    return {"Authorization": "Bearer " + r.get_json()["token"]}
+
+
+@pytest.fixture
+def auth(client):
+    return signup(client)
+
+
+def expire_versions():
+    """What RESOURCE_VERSION_TTL passing looks like to this worker."""
+    with A.resource_versions._lock:
+        A.resource_versions._loaded_at = None
+
+
+def bump_elsewhere(conn, name):
+    """Bump a resource version the way another worker's commit does, bypassing local caches."""
+    rv = models.ResourceVersion.__table__
+    conn.execute(rv.update().where(rv.c.name == name).values(version=rv.c.version + 1))
+
+
+def make_product(client, auth, name, stock_qty=0, type="raw"):
+    r = client.post("/api/products", json={"name": name, "type": type, "stock_qty": stock_qty}, headers=auth)
+    assert r.status_code == 201, r.get_data(as_text=True)
+    return r.get_json()["id"]
+
+
+def run_jobs(due_now=False):
+    """Run queued jobs in this thread the way a job worker does; returns how many ran."""
+    A.job_runner.name = A.job_runner.name or "test-worker"
+    n = 0
+    with A.app.app_context():
+        if due_now:
+            t = A.Job.__table__
+            with A.db.engine.begin() as conn:
+                conn.execute(t.update().where(t.c.status == "queued").values(run_after=A.datetime.utcnow()))
+        while True:
+            job = A.job_runner._claim()
+            if job is None:
+                break
+            A.job_runner._run(job)
+            n += 1
+        A.db.session.remove()
+    return n
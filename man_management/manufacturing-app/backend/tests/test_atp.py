@@ -0,0 +1,87 @@
+from conftest import make_product
+
+
+def _atp(client, *pids):
+    r = client.get("/api/atp?product_id=" + ",".join(map(str, pids)))
+    assert r.status_code == 200
+    return r.get_json()["products"]
+
+
+def _mo(client, auth, pid, quantity, status="planned"):
+    r = client.post("/api/orders", json={"product_id": pid, "quantity": quantity, "status": status}, headers=auth)
+    assert r.status_code == 201, r.get_data(as_text=True)
+    return r.get_json()["id"]
+
+
+def _desk(client, auth, stock=100):
+    top = make_product(client, auth, "Desk", type="finished")
+    board = make_product(client, auth, "Board", stock_qty=stock)
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": board, "qty": 2}]}, headers=auth)
+    return top, board
+
+
+def _numbers(client, top, board):
+    atp = _atp(client, top, board)
+    return atp[str(board)]["on_hand"], atp[str(board)]["reserved"], atp[str(board)]["atp"], atp[str(top)]["incoming"]
+
+
+def test_put_with_string_quantity_on_open_mo(client, auth):
+    top = make_product(client, auth, "Chair", type="finished")
+    leg = make_product(client, auth, "Leg", stock_qty=100)
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": leg, "qty": 4}]}, headers=auth)
+    mo = _mo(client, auth, top, 2, status="in_progress")
+    r = client.put("/api/orders", json={"id": mo, "quantity": "5"}, headers=auth)
+    assert r.status_code == 200, r.get_data(as_text=True)
+    assert r.get_json()["quantity"] == 5
+    atp = _atp(client, top, leg)
+    assert atp[str(top)]["incoming"] == 5
+    assert atp[str(leg)]["reserved"] == 20
+
+
+def test_put_with_non_numeric_quantity_is_400(client, auth):
+    top = make_product(client, auth, "Desk", type="finished")
+    mo = _mo(client, auth, top, 1, status="in_progress")
+    r = client.put("/api/orders", json={"id": mo, "quantity": "five"}, headers=auth)
+    assert r.status_code == 400
+    assert _atp(client, top)[str(top)]["incoming"] == 1
+
+
+def test_planned_mo_reserves_nothing(client, auth):
+    top, board = _desk(client, auth)
+    _mo(client, auth, top, 3)
+    assert _numbers(client, top, board) == (100, 0, 100, 0)
+
+
+def test_confirm_update_delete(client, auth):
+    top, board = _desk(client, auth)
+    mo = _mo(client, auth, top, 3)
+    assert client.put("/api/orders", json={"id": mo, "status": "confirmed"}, headers=auth).status_code == 200
+    assert _numbers(client, top, board) == (100, 6, 94, 3)
+    assert client.put("/api/orders", json={"id": mo, "quantity": 5}, headers=auth).status_code == 200
+    assert _numbers(client, top, board) == (100, 10, 90, 5)
+    r = client.get(f"/api/atp/{board}/reservations").get_json()
+    assert r["reserved"] == 10 and [x["mo_id"] for x in r["reservations"]] == [mo]
+    assert client.put("/api/orders", json={"id": mo, "status": "done"}, headers=auth).status_code == 200
+    assert _numbers(client, top, board) == (100, 0, 100, 0)
+    assert client.put("/api/orders", json={"id": mo, "status": "in_progress"}, headers=auth).status_code == 200
+    assert _numbers(client, top, board) == (100, 10, 90, 5)
+    assert client.delete(f"/api/orders?id={mo}", headers=auth).status_code == 200
+    assert _numbers(client, top, board) == (100, 0, 100, 0)
+
+
+def test_confirmed_on_create_consumes_its_reservation(client, auth):
+    top, board = _desk(client, auth)
+    _mo(client, auth, top, 3, status="confirmed")
+    # confirmation posts MO:<id> consumption, which draws the reservation down
+    assert _numbers(client, top, board) == (94, 0, 94, 3)
+
+
+def test_rebuild_matches_maintained_numbers(client, auth):
+    top, board = _desk(client, auth)
+    _mo(client, auth, top, 3, status="confirmed")
+    open_mo = _mo(client, auth, top, 2)
+    client.put("/api/orders", json={"id": open_mo, "status": "in_progress"}, headers=auth)
+    maintained = _numbers(client, top, board)
+    assert maintained == (94, 4, 90, 5)
+    assert client.post("/api/atp/rebuild", headers=auth).status_code == 200
+    assert _numbers(client, top, board) == maintained
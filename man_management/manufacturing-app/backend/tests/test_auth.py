@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from auth import token_cache
+from conftest import A, signup
+from models import User
+
+
+def test_login_rotation_invalidates_old_token(client, auth):
+    assert client.get("/api/jobs", headers=auth).status_code == 200
+    r = client.post("/api/auth/login", json={"email": "op@example.com", "password": "pw"})
+    assert r.status_code == 200
+    assert client.get("/api/jobs", headers=auth).status_code == 401
+    new = {"Authorization": "Bearer " + r.get_json()["token"]}
+    assert client.get("/api/jobs", headers=new).status_code == 200
+
+
+def test_rotation_in_another_worker_retires_cached_token(client, auth, monkeypatch):
+    monkeypatch.setattr("auth.AUTH_CACHE_SYNC", 0)
+    assert client.get("/api/jobs", headers=auth).status_code == 200
+    assert client.get("/api/jobs", headers=auth).status_code == 200
+    assert token_cache.stats()["hits"] >= 1
+    # another worker rotates the token: its commit stamps auth_changed_at in the DB,
+    # but nothing reaches this process's caches directly
+    with A.app.app_context():
+        with A.db.engine.begin() as conn:
+            conn.execute(update(User.__table__).values(token="rotated-elsewhere", auth_changed_at=datetime.utcnow()))
+    assert client.get("/api/jobs", headers=auth).status_code == 401
+    rotated = {"Authorization": "Bearer rotated-elsewhere"}
+    assert client.get("/api/jobs", headers=rotated).status_code == 200
+
+
+def test_unknown_tokens_are_cached_as_anonymous(client, auth):
+    bad = {"Authorization": "Bearer nope"}
+    assert client.get("/api/jobs", headers=bad).status_code == 401
+    misses = token_cache.stats()["misses"]
+    assert client.get("/api/jobs", headers=bad).status_code == 401
+    assert token_cache.stats()["misses"] == misses
+
+
+def test_other_users_logins_and_otp_requests_keep_cached_tokens(client, auth, monkeypatch):
+    monkeypatch.setattr("auth.AUTH_CACHE_SYNC", 0)
+    signup(client, "second@example.com")
+    with A.app.app_context():
+        with A.db.engine.begin() as conn:
+            conn.execute(update(User.__table__).values(auth_changed_at=datetime.utcnow() - timedelta(hours=1)))
+    assert client.get("/api/jobs", headers=auth).status_code == 200
+    hits = token_cache.stats()["hits"]
+    # shift change: someone else logs in, and /forgot writes an OTP for this user
+    assert client.post("/api/auth/login", json={"email": "second@example.com", "password": "pw"}).status_code == 200
+    assert client.post("/api/auth/forgot", json={"email": "op@example.com"}).status_code == 200
+    assert client.get("/api/jobs", headers=auth).status_code == 200
+    assert token_cache.stats()["hits"] == hits + 1
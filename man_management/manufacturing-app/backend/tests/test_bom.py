@@ -0,0 +1,32 @@
+from conftest import A, bump_elsewhere, expire_versions, make_product
+
+
+def test_bom_post_shows_up_in_explosion(client, auth):
+    top = make_product(client, auth, "Chair", type="finished")
+    leg = make_product(client, auth, "Leg")
+    assert client.get(f"/api/bom/{top}/explode").get_json()["leaves"] == {}
+    r = client.post("/api/bom", json={"product_id": top, "components": [{"product_id": leg, "qty": 4}]}, headers=auth)
+    assert r.status_code in (200, 201)
+    assert client.get(f"/api/bom/{top}/explode?quantity=2").get_json()["leaves"] == {str(leg): 8.0}
+
+
+def test_bom_written_by_another_worker_invalidates_cache(client, auth):
+    top = make_product(client, auth, "Table", type="finished")
+    top_leg = make_product(client, auth, "Table leg")
+    assert client.get(f"/api/bom/{top}/explode").get_json()["leaves"] == {}
+    with A.app.app_context():
+        with A.db.engine.begin() as conn:
+            conn.execute(A.BOM.__table__.insert().values(
+                product_id=top, components=[{"product_id": top_leg, "qty": 4}]))
+            bump_elsewhere(conn, "bom")
+    expire_versions()
+    assert client.get(f"/api/bom/{top}/explode").get_json()["leaves"] == {str(top_leg): 4.0}
+
+
+def test_bom_cycle_is_400(client, auth):
+    a = make_product(client, auth, "A", type="finished")
+    b = make_product(client, auth, "B")
+    client.post("/api/bom", json={"product_id": a, "components": [{"product_id": b, "qty": 1}]}, headers=auth)
+    client.post("/api/bom", json={"product_id": b, "components": [{"product_id": a, "qty": 1}]}, headers=auth)
+    r = client.get(f"/api/bom/{a}/explode")
+    assert r.status_code == 400 and r.get_json()["cycle"]
@@ -0,0 +1,37 @@
+import json
+
+import consumption
+from conftest import make_product
+
+
+def _stock(client, pid):
+    return next(p for p in client.get("/api/products").get_json() if p["id"] == pid)["stock_qty"]
+
+
+def _bom(client, auth, top, comp, qty):
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": comp, "qty": qty}]}, headers=auth)
+
+
+def test_bulk_products_report_ids_and_opening_stock(client, auth):
+    r = client.post("/api/products/bulk", json=[{"name": "P1", "stock_qty": 3}, {"name": "P2"}], headers=auth)
+    body = r.get_json()
+    assert r.status_code == 201 and body["inserted"] == 2
+    ids = [x["id"] for x in body["results"]]
+    assert [_stock(client, i) for i in ids] == [3, 0]
+
+
+def test_bulk_orders_check_stock_defaults_to_setting(client, auth, monkeypatch):
+    top = make_product(client, auth, "Top", type="finished")
+    comp = make_product(client, auth, "Comp", stock_qty=1)
+    _bom(client, auth, top, comp, 5)
+    order = [{"product_id": top, "quantity": 1, "status": "confirmed"}]
+    monkeypatch.setattr(consumption, "STOCK_CHECK_AVAILABILITY", True)
+    r = client.post("/api/orders/bulk", json=order, headers=auth)
+    assert r.status_code == 207 and r.get_json()["failed"] == 1
+    r = client.post("/api/orders/bulk?check_stock=0", json=order, headers=auth)
+    assert r.status_code == 201
+    assert _stock(client, comp) == -4
+    monkeypatch.setattr(consumption, "STOCK_CHECK_AVAILABILITY", False)
+    r = client.post("/api/orders/bulk", data=json.dumps(order), content_type="application/json", headers=auth)
+    assert r.status_code == 201
+    assert _stock(client, comp) == -9
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import changes
+from conftest import A, make_product
+from models import ChangeEvent
+
+
+def _last_seq(client):
+    return client.get("/api/changes").get_json()["last_seq"]
+
+
+def _insert_elsewhere(kind, entity_id):
+    # a change committed by another worker: nothing pokes this process's feed
+    with A.app.app_context():
+        with A.db.engine.begin() as conn:
+            conn.execute(ChangeEvent.__table__.insert().values(
+                kind=kind, op="status", entity_id=entity_id, data=None, created_at=datetime.utcnow()))
+
+
+def test_wait_zero_returns_local_commits(client, auth):
+    pid = make_product(client, auth, "Widget")
+    since = _last_seq(client)
+    mo = client.post("/api/orders", json={"product_id": pid, "quantity": 2}, headers=auth).get_json()
+    body = client.get(f"/api/changes?since={since}&wait=0").get_json()
+    assert [(c["kind"], c["op"], c["id"]) for c in body["changes"]] == [("order", "create", mo["id"])]
+    assert body["last_seq"] > since
+    again = client.get(f"/api/changes?since={body['last_seq']}&wait=0").get_json()
+    assert again == {"last_seq": body["last_seq"], "changes": [], "reset": False}
+
+
+def test_manual_work_order_is_on_the_feed(client, auth):
+    pid = make_product(client, auth, "Hinge")
+    mo = client.post("/api/orders", json={"product_id": pid, "quantity": 1}, headers=auth).get_json()
+    since = _last_seq(client)
+    wo = client.post("/api/work-orders", json={"mo_id": mo["id"], "operation": "drill", "work_center": "WC3"},
+                     headers=auth).get_json()
+    body = client.get(f"/api/changes?since={since}&kinds=work_order&wait=0").get_json()
+    assert [(c["op"], c["id"], c["data"]["operation"]) for c in body["changes"]] == [("create", wo["id"], "drill")]
+
+
+def test_wait_zero_sees_other_workers_after_a_poll(client, monkeypatch):
+    since = _last_seq(client)
+    _insert_elsewhere("work_order", 7)
+    monkeypatch.setattr(changes, "CHANGE_FEED_POLL", 0)
+    body = client.get(f"/api/changes?since={since}&wait=0").get_json()
+    assert [(c["kind"], c["id"]) for c in body["changes"]] == [("work_order", 7)]
+
+
+def test_kinds_filter_advances_last_seq(client, auth):
+    pid = make_product(client, auth, "Gear")
+    since = _last_seq(client)
+    client.post("/api/orders", json={"product_id": pid, "quantity": 1}, headers=auth)
+    body = client.get(f"/api/changes?since={since}&kinds=work_order&wait=0").get_json()
+    assert body["changes"] == [] and body["last_seq"] > since
+
+
+def test_stream_limit_answers_503_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(changes, "CHANGE_FEED_MAX_STREAMS", 1)
+    first = client.get("/api/changes/stream", buffered=False)
+    assert first.status_code == 200 and first.mimetype == "text/event-stream"
+    busy = client.get("/api/changes/stream")
+    assert busy.status_code == 503 and busy.headers["Retry-After"] == str(changes.CHANGE_FEED_BUSY_RETRY)
+    first.close()
+    assert changes.change_feed.stats()["streams"] == 0
+    monkeypatch.setattr(changes, "CHANGE_FEED_STREAM_SECONDS", 0)
+    again = client.get("/api/changes/stream")
+    assert again.status_code == 200 and again.get_data(as_text=True).startswith("retry:")
@@ -0,0 +1,87 @@
+import threading
+
+from sqlalchemy import func, select
+
+from conftest import A, make_product
+
+
+def _stock_and_ledger(pid):
+    L = A.StockLedger
+    with A.app.app_context():
+        qty = A.db.session.get(A.Product, pid).stock_qty
+        out = A.db.session.execute(select(func.coalesce(func.sum(L.quantity), 0), func.count())
+                                   .where(L.product_id == pid, L.movement_type == "out")).one()
+        A.db.session.remove()
+    return qty, tuple(out)
+
+
+def _in_threads(n, fn):
+    start, errors = threading.Barrier(n), []
+
+    def run(i):
+        start.wait()
+        try:
+            fn(i)
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+
+
+def test_concurrent_deltas_are_not_lost(client, auth):
+    pid = make_product(client, auth, "Screw", stock_qty=1000)
+
+    def consume(i):
+        with A.app.app_context():
+            for _ in range(10):
+                A.apply_stock_deltas({pid: -(i + 1)}, f"T{i}")
+                A.db.session.commit()
+            A.db.session.remove()
+    _in_threads(6, consume)
+    assert _stock_and_ledger(pid)[0] == 1000 - 10 * sum(range(1, 7))
+
+
+def test_concurrent_wo_completions_consume_once_each(client, auth):
+    top = make_product(client, auth, "Crate", type="finished")
+    nail = make_product(client, auth, "Nail", stock_qty=500)
+    board = make_product(client, auth, "Slat", stock_qty=500)
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": nail, "qty": 6}, {"product_id": board, "qty": 2}],
+                                  "operations": [{"name": "nail", "work_center": "WC1", "time": 5}]}, headers=auth)
+    for _ in range(8):
+        client.post("/api/orders", json={"product_id": top, "quantity": 3}, headers=auth)
+    with A.app.app_context():
+        mos = A.db.session.execute(select(A.ManufacturingOrder.id)).scalars().all()
+        A.generate_work_orders([(mo, top) for mo in mos])
+        A.db.session.commit()
+        wos = A.db.session.execute(select(A.WorkOrder.id).order_by(A.WorkOrder.id)).scalars().all()
+        A.db.session.remove()
+    assert len(wos) == 8
+
+    def complete(i):
+        r = A.app.test_client().put(f"/api/work-orders/{wos[i]}/status", json={"status": "completed"}, headers=auth)
+        assert r.status_code == 200, r.get_data(as_text=True)
+    _in_threads(8, complete)
+    assert _stock_and_ledger(nail) == (500 - 8 * 18, (8 * 18, 8))
+    assert _stock_and_ledger(board) == (500 - 8 * 6, (8 * 6, 8))
+    assert client.get(f"/api/stock/reconcile?product_id={nail},{board}").get_json()["drifted"] == 0
+
+
+def test_check_stock_refuses_a_short_completion_without_side_effects(client, auth):
+    top = make_product(client, auth, "Stool", type="finished")
+    leg = make_product(client, auth, "Peg", stock_qty=5)
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": leg, "qty": 3}],
+                                  "operations": [{"name": "fit", "work_center": "WC1", "time": 5}]}, headers=auth)
+    client.post("/api/orders", json={"product_id": top, "quantity": 2}, headers=auth)
+    with A.app.app_context():
+        mo = A.db.session.execute(select(A.ManufacturingOrder.id)).scalar()
+        A.generate_work_orders([(mo, top)])
+        A.db.session.commit()
+        wo = A.db.session.execute(select(A.WorkOrder.id)).scalar()
+        A.db.session.remove()
+    r = client.put(f"/api/work-orders/{wo}/status", json={"status": "completed", "check_stock": True}, headers=auth)
+    assert r.status_code == 500 and "short by 1" in r.get_json()["details"]
+    assert _stock_and_ledger(leg) == (5, (0, 0))
@@ -0,0 +1,76 @@
+import csv
+import io
+from datetime import datetime
+
+from conftest import A, make_product
+
+
+def _orders(client, auth, n=7):
+    top = make_product(client, auth, "Bench", type="finished")
+    for i in range(n):
+        client.post("/api/orders", json={"product_id": top, "quantity": i + 1, "assignee": "ann" if i % 2 else "bob",
+                                         "deadline": f"2026-04-{i + 1:02d}T16:00:00"}, headers=auth)
+    return client.get("/api/orders", headers=auth).get_json()
+
+
+def _csv_rows(r):
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return list(csv.DictReader(io.StringIO(r.get_data(as_text=True))))
+
+
+def test_csv_streams_every_row_across_chunks(client, auth, monkeypatch):
+    monkeypatch.setattr(A, "EXPORT_CHUNK", 3)
+    orders = _orders(client, auth)
+    r = client.get("/api/reports/export?dataset=orders&format=csv", headers=auth)
+    assert r.is_streamed and r.mimetype == "text/csv"
+    assert r.headers["Content-Disposition"] == "attachment; filename=mo_report.csv"
+    rows = _csv_rows(r)
+    expected = [{k: "" if v is None else str(v) for k, v in o.items()} for o in orders]
+    assert rows == expected
+
+
+def test_csv_filters(client, auth):
+    orders = _orders(client, auth)
+    rows = _csv_rows(client.get("/api/reports/export?dataset=orders&format=csv&assignee=ann", headers=auth))
+    assert [int(r["id"]) for r in rows] == [o["id"] for o in orders if o["assignee"] == "ann"]
+    today = datetime.utcnow().date().isoformat()
+    assert len(_csv_rows(client.get(f"/api/reports/export?dataset=orders&format=csv&from={today}&to={today}",
+                                    headers=auth))) == len(orders)
+    assert _csv_rows(client.get("/api/reports/export?dataset=orders&format=csv&to=2000-01-01", headers=auth)) == []
+
+
+def test_xlsx_has_header_and_every_row(client, auth, monkeypatch):
+    from openpyxl import load_workbook
+    monkeypatch.setattr(A, "EXPORT_CHUNK", 2)
+    orders = _orders(client, auth)
+    r = client.get("/api/reports/export?dataset=orders&format=xlsx", headers=auth)
+    assert r.status_code == 200 and r.mimetype == A.EXPORT_MIMETYPES["xlsx"]
+    rows = list(load_workbook(io.BytesIO(r.get_data())).active.iter_rows(values_only=True))
+    assert list(rows[0]) == list(orders[0])
+    assert [row[0] for row in rows[1:]] == [o["id"] for o in orders]
+    qty = rows[0].index("quantity")
+    assert [row[qty] for row in rows[1:]] == [o["quantity"] for o in orders]
+
+
+def test_parquet_or_501_without_pyarrow(client, auth):
+    orders = _orders(client, auth, 3)
+    r = client.get("/api/reports/export?dataset=orders&format=parquet", headers=auth)
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        assert r.status_code == 501
+        return
+    table = pq.read_table(io.BytesIO(r.get_data()))
+    assert table.column("id").to_pylist() == [o["id"] for o in orders]
+
+
+def test_bad_export_args_are_400(client, auth):
+    for qs in ("dataset=users", "format=pdf", "from=2026-13-01"):
+        assert client.get("/api/reports/export?" + qs, headers=auth).status_code == 400
+
+
+def test_export_requires_auth(client, auth):
+    _orders(client, auth, 2)
+    assert client.get("/api/reports/export?dataset=orders&format=csv").status_code == 401
+    assert client.get("/api/reports/export?dataset=orders&format=csv&async=1").status_code == 401
+    assert client.get("/api/jobs", headers=auth).get_json() == []
@@ -0,0 +1,71 @@
+from conftest import A, bump_elsewhere, expire_versions, make_product
+from http_cache import response_cache
+from versions import resource_versions
+
+
+def test_etag_and_304(client, auth):
+    make_product(client, auth, "Cog")
+    first = client.get("/api/products")
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+    etag, modified = first.headers["ETag"], first.headers["Last-Modified"]
+    again = client.get("/api/products", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.get_data() == b"" and again.headers["ETag"] == etag
+    assert client.get("/api/products", headers={"If-Modified-Since": modified}).status_code == 304
+    # another query string is another representation of the same versions
+    assert client.get("/api/products?fields=id", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/products", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_local_write_changes_etag_and_skips_cached_body(client, auth):
+    make_product(client, auth, "Cog")
+    first = client.get("/api/products")
+    body, hits = first.get_json(), response_cache.stats()["hits"]
+    assert client.get("/api/products").get_json() == body
+    assert response_cache.stats()["hits"] == hits + 1
+    make_product(client, auth, "Sprocket")
+    after = client.get("/api/products", headers={"If-None-Match": first.headers["ETag"]})
+    assert after.status_code == 200 and after.headers["ETag"] != first.headers["ETag"]
+    assert [p["name"] for p in after.get_json()] == ["Cog", "Sprocket"]
+    # unrelated tables keep their validators
+    wos = client.get("/api/work-orders")
+    make_product(client, auth, "Pulley")
+    assert client.get("/api/work-orders", headers={"If-None-Match": wos.headers["ETag"]}).status_code == 304
+
+
+def test_other_workers_writes_show_up_after_the_version_ttl(client, auth):
+    make_product(client, auth, "Cog")
+    etag = client.get("/api/products").headers["ETag"]
+    with A.app.app_context():
+        with A.db.engine.begin() as conn:
+            conn.execute(A.Product.__table__.insert().values(name="Elsewhere", type="raw", stock_qty=0))
+            bump_elsewhere(conn, "product")
+    # within the TTL this worker still trusts its versions
+    assert client.get("/api/products", headers={"If-None-Match": etag}).status_code == 304
+    expire_versions()
+    r = client.get("/api/products", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and [p["name"] for p in r.get_json()] == ["Cog", "Elsewhere"]
+
+
+def test_non_200_responses_are_not_cached(client):
+    assert client.get("/api/products?limit=x").status_code == 400
+    assert response_cache.stats()["size"] == 0
+
+
+def test_failed_bump_is_logged_and_drops_cached_bodies(client, auth, monkeypatch, caplog):
+    make_product(client, auth, "Cog")
+    client.get("/api/products").get_json()
+    assert response_cache.stats()["size"] == 1
+    failures = resource_versions.stats()["failures"]
+
+    def broken_begin():
+        raise RuntimeError("resource_version is locked")
+    with A.app.app_context():
+        monkeypatch.setattr(A.db.engine, "begin", broken_begin)
+        A.db.session.add(A.Product(name="Gear", type="raw", stock_qty=0))
+        A.db.session.commit()
+        A.db.session.remove()
+    assert "Could not bump resource versions" in caplog.text
+    assert resource_versions.stats()["failures"] == failures + 1
+    assert response_cache.stats()["size"] == 0
+    monkeypatch.undo()
+    assert [p["name"] for p in client.get("/api/products").get_json()] == ["Cog", "Gear"]
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+from sqlalchemy import inspect, select, text
+
+import core
+from conftest import A
+
+# tables as an early release created them: no product.created_by, free-form MO dates,
+# no WO schedule columns, no user.auth_changed_at, no indexes and no schema_migrations
+LEGACY_SCHEMA = (
+    "CREATE TABLE user (id INTEGER PRIMARY KEY, email VARCHAR(200) NOT NULL UNIQUE, password_hash VARCHAR(200) NOT NULL,"
+    " role VARCHAR(50), name VARCHAR(200), token VARCHAR(200), otp_code VARCHAR(20), otp_expiry DATETIME, created_at DATETIME)",
+    "CREATE TABLE product (id INTEGER PRIMARY KEY, name VARCHAR(100), type VARCHAR(20), stock_qty INTEGER, created_at DATETIME)",
+    "CREATE TABLE bom (id INTEGER PRIMARY KEY, product_id INTEGER, components JSON, operations JSON, created_at DATETIME)",
+    "CREATE TABLE manufacturing_order (id INTEGER PRIMARY KEY, product_id INTEGER, quantity INTEGER, status VARCHAR(20),"
+    " start_date VARCHAR(50), deadline VARCHAR(50), assignee VARCHAR(100), created_at DATETIME)",
+    "CREATE TABLE work_order (id INTEGER PRIMARY KEY, mo_id INTEGER, manufactured_id INTEGER, operation VARCHAR(100),"
+    " work_center VARCHAR(100), planned_time_mins INTEGER, status VARCHAR(20), operator_id VARCHAR(50),"
+    " start_time DATETIME, end_time DATETIME, comments TEXT)",
+    "CREATE TABLE stock_ledger (id INTEGER PRIMARY KEY, product_id INTEGER, movement_type VARCHAR(10), quantity INTEGER,"
+    " reference VARCHAR(50), timestamp DATETIME)",
+    "INSERT INTO user (id, email, password_hash, role) VALUES (1, 'old@example.com', 'x', 'Manager')",
+    "INSERT INTO product (id, name, type, stock_qty, created_at) VALUES (1, 'Legacy bolt', 'raw', 4, '2024-05-01 08:00:00')",
+    "INSERT INTO manufacturing_order (id, product_id, quantity, status, start_date, deadline, created_at)"
+    " VALUES (1, 1, 2, 'planned', '2025-01-31', 'next week', '2024-05-02 09:00:00')",
+    "INSERT INTO work_order (id, mo_id, manufactured_id, operation, work_center, planned_time_mins, status)"
+    " VALUES (1, 1, 1, 'cut', 'WC1', 15, 'planned')",
+)
+
+
+@pytest.fixture
+def legacy(app):
+    """An app context on a database written by an early release, before any migration."""
+    with A.app.app_context():
+        A.db.session.remove()
+        A.db.engine.dispose()
+    os.remove(core.SQLITE_PATH)
+    with A.app.app_context():
+        with A.db.engine.begin() as conn:
+            for stmt in LEGACY_SCHEMA:
+                conn.execute(text(stmt))
+        yield
+        A.db.session.remove()
+
+
+def _columns(table):
+    return {c["name"] for c in inspect(A.db.engine).get_columns(table)}
+
+
+def _applied():
+    return sorted(A.db.session.execute(select(A.SchemaMigration.version)).scalars())
+
+
+def test_init_db_is_idempotent(ctx):
+    A.init_db()
+    assert A.db.session.query(A.SchemaMigration).count() == len(A.MIGRATIONS)
+
+
+def test_failed_migration_raises(ctx, monkeypatch):
+    monkeypatch.setattr(A, "run_migrations", lambda fresh=False: False)
+    with pytest.raises(A.MigrationError):
+        A.init_db()
+
+
+def test_init_db_command_exits_1_on_failed_migration(app, monkeypatch):
+    monkeypatch.setattr(A, "run_migrations", lambda fresh=False: False)
+    result = app.test_cli_runner().invoke(args=["init-db"])
+    assert result.exit_code == 1
+    assert "Database initialized" not in result.output
+
+
+def test_migrations_upgrade_an_existing_database(legacy, capsys):
+    A.init_db()
+    assert "created_by" in _columns("product")
+    assert {"scheduled_start", "scheduled_end"} <= _columns("work_order")
+    assert "auth_changed_at" in _columns("user")
+    indexes = {ix["name"] for ix in inspect(A.db.engine).get_indexes("manufacturing_order")}
+    assert {"ix_mo_status_created", "ix_mo_status_deadline", "ix_mo_created", "ix_mo_product"} <= indexes
+    assert "ix_user_auth_changed" in {ix["name"] for ix in inspect(A.db.engine).get_indexes("user")}
+    assert _applied() == sorted(v for v, _, _ in A.MIGRATIONS)
+    # free-form dates became DATETIMEs; the unparseable one was cleared
+    mo = A.db.session.get(A.ManufacturingOrder, 1)
+    assert mo.start_date.isoformat() == "2025-01-31T00:00:00" and mo.deadline is None
+    A.db.session.remove()
+    out = capsys.readouterr().out
+    assert "Applied migration 2" in out and "Cleared 1 unparseable" in out
+    # the rows written before the upgrade are still served
+    assert [p["name"] for p in A.app.test_client().get("/api/products").get_json()] == ["Legacy bolt"]
+    # a second run has nothing left to apply
+    A.init_db()
+    assert "Applied migration" not in capsys.readouterr().out
+
+
+def test_failed_migration_stops_the_run_and_is_retried(legacy, monkeypatch):
+    def broken():
+        raise RuntimeError("disk full")
+    real = list(A.MIGRATIONS)
+    monkeypatch.setattr(A, "MIGRATIONS", [(v, n, broken if v == 4 else fn) for v, n, fn in real])
+    with pytest.raises(A.MigrationError):
+        A.init_db()
+    assert _applied() == [1, 2, 3]
+    assert "scheduled_start" not in _columns("work_order")
+    monkeypatch.setattr(A, "MIGRATIONS", real)
+    A.init_db()
+    assert _applied() == sorted(v for v, _, _ in real)
+    assert "scheduled_start" in _columns("work_order")
@@ -0,0 +1,174 @@
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from conftest import A, make_product, run_jobs, signup
+
+
+def _finished_product(client, auth, comp_stock=100):
+    top = make_product(client, auth, "Desk", type="finished")
+    comp = make_product(client, auth, "Board", stock_qty=comp_stock)
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": comp, "qty": 2}],
+                                  "operations": [{"name": "assemble", "work_center": "WC1", "time": 15}]}, headers=auth)
+    return top, comp
+
+
+def _count(model, *where):
+    with A.app.app_context():
+        n = A.db.session.execute(select(func.count()).select_from(model).where(*where)).scalar()
+        A.db.session.remove()
+    return n
+
+
+def _confirm_async(client, auth, top, key=None, quantity=1):
+    headers = dict(auth, **({"Idempotency-Key": key} if key else {}))
+    return client.post("/api/orders?async=1", json={"product_id": top, "quantity": quantity, "status": "confirmed"},
+                       headers=headers)
+
+
+def test_async_confirm_runs_once_per_idempotency_key(client, auth):
+    top, comp = _finished_product(client, auth)
+    first = _confirm_async(client, auth, top, "k1")
+    again = _confirm_async(client, auth, top, "k1")
+    assert first.status_code == 202 and again.status_code == 200
+    assert again.get_json()["job"]["id"] == first.get_json()["job"]["id"]
+    assert again.get_json()["order"]["id"] == first.get_json()["order"]["id"]
+    assert _count(A.ManufacturingOrder) == 1
+    assert run_jobs() == 1
+    job = client.get(f"/api/jobs/{first.get_json()['job']['id']}", headers=auth).get_json()
+    assert job["status"] == "done" and job["result"]["work_orders"] == 1
+
+
+def test_concurrent_request_with_same_key_replays_instead_of_creating(client, auth):
+    top, _ = _finished_product(client, auth)
+    other = client.post("/api/orders", json={"product_id": top, "quantity": 3}, headers=auth).get_json()
+
+    # the competing request commits its MO and job between our key lookup and our commit
+    raced = []
+
+    def competitor(session, flush_context, instances):
+        if raced:
+            return
+        raced.append(True)
+        with A.db.engine.begin() as conn:
+            conn.execute(A.Job.__table__.insert().values(
+                kind="confirm_mo", status="queued", idempotency_key="race", params={"mo_id": other["id"]},
+                attempts=0, max_attempts=3, run_after=A.datetime.utcnow()))
+    event.listen(Session, "before_flush", competitor)
+    try:
+        r = _confirm_async(client, auth, top, "race")
+    finally:
+        event.remove(Session, "before_flush", competitor)
+    assert r.status_code == 200 and r.get_json()["order"]["id"] == other["id"]
+    assert _count(A.ManufacturingOrder) == 1
+    assert _count(A.Job, A.Job.idempotency_key == "race") == 1
+
+
+def test_retry_after_lost_worker_does_not_double_consumption(client, auth):
+    top, comp = _finished_product(client, auth)
+    job_id = _confirm_async(client, auth, top).get_json()["job"]["id"]
+    assert run_jobs() == 1
+    # the worker committed its work, then died before recording the job as done
+    with A.app.app_context():
+        with A.db.engine.begin() as conn:
+            conn.execute(A.Job.__table__.update().where(A.Job.id == job_id).values(status="queued"))
+    assert run_jobs() == 1
+    assert _count(A.WorkOrder) == 1
+    assert _count(A.StockLedger, A.StockLedger.product_id == comp, A.StockLedger.movement_type == "out") == 1
+
+
+def test_reused_mo_id_is_still_confirmed(client, auth):
+    top, comp = _finished_product(client, auth)
+    first = _confirm_async(client, auth, top).get_json()["order"]["id"]
+    run_jobs()
+    assert client.delete(f"/api/orders?id={first}", headers=auth).status_code == 200
+    # SQLite hands the deleted id out again
+    r = _confirm_async(client, auth, top)
+    assert r.get_json()["order"]["id"] == first
+    run_jobs()
+    job = client.get(f"/api/jobs/{r.get_json()['job']['id']}", headers=auth).get_json()
+    assert job["result"] == {"mo_id": first, "work_orders": 1, "consumed": True}
+    assert _count(A.StockLedger, A.StockLedger.product_id == comp, A.StockLedger.movement_type == "out") == 2
+
+
+def test_failing_job_is_retried_with_backoff_then_fails(client, auth, monkeypatch):
+    calls = []
+
+    def flaky(params, job_id):
+        calls.append(job_id)
+        raise RuntimeError("database went away")
+    monkeypatch.setitem(A.JOB_HANDLERS, "schedule", flaky)
+    job = client.post("/api/jobs", json={"kind": "schedule", "max_attempts": 2}, headers=auth).get_json()["job"]
+    assert run_jobs() == 1
+    queued = client.get(f"/api/jobs/{job['id']}", headers=auth).get_json()
+    assert queued["status"] == "queued" and queued["error"] == "database went away"
+    assert run_jobs() == 0  # backing off
+    assert run_jobs(due_now=True) == 1
+    failed = client.get(f"/api/jobs/{job['id']}", headers=auth).get_json()
+    assert failed["status"] == "failed" and failed["attempts"] == 2 and len(calls) == 2
+
+
+def test_validation_errors_fail_without_retry(client, auth):
+    job = client.post("/api/jobs", json={"kind": "generate_work_orders", "params": {}}, headers=auth).get_json()["job"]
+    assert run_jobs() == 1
+    failed = client.get(f"/api/jobs/{job['id']}", headers=auth).get_json()
+    assert failed["status"] == "failed" and failed["attempts"] == 1 and failed["error"] == "mo_ids required"
+
+
+def test_async_order_is_planned_until_its_job_confirms_it(client, auth):
+    top, comp = _finished_product(client, auth)
+    r = _confirm_async(client, auth, top, quantity=3)
+    mo = r.get_json()["order"]["id"]
+    assert r.get_json()["order"]["status"] == "planned"
+    run_jobs()
+    assert client.get("/api/orders?status=confirmed", headers=auth).get_json()[0]["id"] == mo
+    atp = client.get(f"/api/atp?product_id={top},{comp}").get_json()["products"]
+    assert atp[str(top)]["incoming"] == 3 and atp[str(comp)]["on_hand"] == 94
+    summary = client.get("/api/reports/summary").get_json()
+    assert summary["mo_by_status"] == {"confirmed": 1}
+
+
+def test_second_confirm_job_for_the_same_mo_does_nothing(client, auth):
+    top, comp = _finished_product(client, auth)
+    mo = _confirm_async(client, auth, top).get_json()["order"]["id"]
+    # e.g. a job re-queued by hand, or two workers running one job after a lease expired
+    with A.app.app_context():
+        dup = A.add_job("confirm_mo", {"mo_id": mo})
+        A.db.session.commit()
+        dup_id = dup.id
+        A.db.session.remove()
+    assert run_jobs() == 2
+    admin = signup(client, "admin@example.com", role="Admin")
+    assert _count(A.WorkOrder) == 1
+    assert _count(A.StockLedger, A.StockLedger.product_id == comp, A.StockLedger.movement_type == "out") == 1
+    result = client.get(f"/api/jobs/{dup_id}", headers=admin).get_json()["result"]
+    assert result["work_orders"] == 0 and result["skipped"] == "MO is not planned"
+
+
+def test_internal_kinds_and_unbounded_retries_are_refused(client, auth):
+    top, _ = _finished_product(client, auth)
+    mo = client.post("/api/orders", json={"product_id": top, "quantity": 1, "status": "confirmed"}, headers=auth).get_json()
+    r = client.post("/api/jobs", json={"kind": "confirm_mo", "params": {"mo_id": mo["id"]}}, headers=auth)
+    assert r.status_code == 400 and "confirm_mo" not in r.get_json()["error"]
+    for bad in (0, 11, 10 ** 9, "3", 2.5, True):
+        assert client.post("/api/jobs", json={"kind": "schedule", "max_attempts": bad}, headers=auth).status_code == 400
+    assert _count(A.Job) == 0 and _count(A.WorkOrder) == 1
+
+
+def test_jobs_are_visible_to_their_owner_and_admins_only(client, auth):
+    job = client.post("/api/jobs", json={"kind": "schedule"}, headers=auth).get_json()["job"]
+    run_jobs()
+    other = signup(client, "other@example.com", role="Operator")
+    admin = signup(client, "admin@example.com", role="Admin")
+    for url in (f"/api/jobs/{job['id']}", f"/api/jobs/{job['id']}/result"):
+        assert client.get(url, headers=auth).status_code == 200
+        assert client.get(url, headers=other).status_code == 404
+        assert client.get(url, headers=admin).status_code == 200
+    assert client.get("/api/jobs", headers=other).get_json() == []
+    assert [j["id"] for j in client.get("/api/jobs", headers=admin).get_json()] == [job["id"]]
+
+
+def test_job_idempotency_key_for_other_kind_is_409(client, auth):
+    h = dict(auth, **{"Idempotency-Key": "same"})
+    assert client.post("/api/jobs", json={"kind": "schedule"}, headers=h).status_code == 202
+    assert client.post("/api/jobs", json={"kind": "schedule"}, headers=h).status_code == 200
+    assert client.post("/api/jobs", json={"kind": "export"}, headers=h).status_code == 409
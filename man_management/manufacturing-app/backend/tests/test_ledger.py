@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from conftest import A, make_product
+
+T0 = datetime(2026, 1, 5, 8, 0)
+
+
+def _post(pid, movement_type, qty, ts):
+    # a ledger row at a given time, with the stock_qty counter moved alongside it
+    with A.app.app_context():
+        A.post_ledger_entries([{"product_id": pid, "movement_type": movement_type, "quantity": qty,
+                                "reference": "TEST", "timestamp": ts}])
+        A.apply_stock_deltas({pid: qty if movement_type == "in" else -qty})
+        A.db.session.commit()
+        A.db.session.remove()
+
+
+def _on_hand(client, pid, as_of=None):
+    qs = f"?product_id={pid}" + (f"&as_of={as_of.isoformat()}" if as_of else "")
+    return client.get("/api/stock/on-hand" + qs).get_json()["on_hand"][str(pid)]
+
+
+def _history(client, auth):
+    pid = make_product(client, auth, "Rivet")
+    for day, (kind, qty) in enumerate((("in", 50), ("out", 8), ("in", 5), ("out", 12))):
+        _post(pid, kind, qty, T0 + timedelta(days=day))
+    return pid
+
+
+def test_snapshot_plus_delta_matches_the_full_scan(client, auth):
+    pid = _history(client, auth)
+    points = [T0 - timedelta(hours=1)] + [T0 + timedelta(days=d, hours=1) for d in range(4)] + [None]
+    full = [_on_hand(client, pid, p) for p in points]
+    assert full == [0, 50, 42, 47, 35, 35]
+    r = client.post("/api/stock/snapshots", json={"as_of": (T0 + timedelta(days=1, hours=2)).isoformat()}, headers=auth)
+    assert r.status_code == 201 and r.get_json()["snapshots"] == 1
+    assert [_on_hand(client, pid, p) for p in points] == full
+    # reads after the snapshot point start from it; earlier ones do not
+    with A.app.app_context():
+        A.db.session.execute(update(A.StockSnapshot).values(qty=A.StockSnapshot.qty + 100))
+        A.db.session.commit()
+        A.db.session.remove()
+    assert [_on_hand(client, pid, p) for p in points] == full[:3] + [v + 100 for v in full[3:]]
+
+
+def test_snapshots_only_cover_products_that_moved(client, auth):
+    pid = _history(client, auth)
+    make_product(client, auth, "Idle")
+    as_of = T0 + timedelta(days=10)
+    assert client.post("/api/stock/snapshots", json={"as_of": as_of.isoformat()}, headers=auth).get_json()["snapshots"] == 1
+    assert client.post("/api/stock/snapshots", json={"as_of": (as_of + timedelta(days=1)).isoformat()},
+                       headers=auth).get_json()["snapshots"] == 0
+    _post(pid, "out", 1, as_of + timedelta(days=2))
+    assert client.post("/api/stock/snapshots", json={"as_of": (as_of + timedelta(days=3)).isoformat()},
+                       headers=auth).get_json()["snapshots"] == 1
+    assert _on_hand(client, pid) == 34
+    assert client.post("/api/stock/snapshots", json={"as_of": "soon"}, headers=auth).status_code == 400
+
+
+def test_reconcile_reports_and_fixes_drift(client, auth):
+    pid = _history(client, auth)
+    assert client.get("/api/stock/reconcile").get_json()["drifted"] == 0
+    with A.app.app_context():
+        A.db.session.execute(update(A.Product).where(A.Product.id == pid).values(stock_qty=40))
+        A.db.session.commit()
+        A.db.session.remove()
+    drift = client.get("/api/stock/reconcile").get_json()
+    assert drift["products"] == [{"product_id": pid, "stock_qty": 40, "ledger_qty": 35, "drift": 5}]
+    assert client.post("/api/stock/reconcile", json={"apply": "set_stock"}).status_code == 401
+    assert client.post("/api/stock/reconcile", json={"apply": "guess"}, headers=auth).status_code == 400
+    assert client.post("/api/stock/reconcile", json={"apply": "set_stock"}, headers=auth).get_json()["fixed"] == 1
+    assert client.get("/api/products").get_json()[0]["stock_qty"] == 35
+    # the other direction: trust stock_qty (e.g. legacy data) and post ADJ entries
+    with A.app.app_context():
+        A.db.session.execute(update(A.Product).where(A.Product.id == pid).values(stock_qty=30))
+        A.db.session.commit()
+        A.db.session.remove()
+    assert client.post("/api/stock/reconcile", json={"apply": "adjust_ledger"}, headers=auth).get_json()["fixed"] == 1
+    assert _on_hand(client, pid) == 30
+    assert client.get("/api/stock/reconcile").get_json()["drifted"] == 0
+
+
+def test_ledger_rows_are_append_only(client, auth):
+    _history(client, auth)
+    with A.app.app_context():
+        row = A.db.session.execute(select(A.StockLedger)).scalars().first()
+        row.quantity = 1
+        with pytest.raises(ValueError, match="append-only"):
+            A.db.session.flush()
+        A.db.session.rollback()
+        A.db.session.delete(A.db.session.execute(select(A.StockLedger)).scalars().first())
+        with pytest.raises(ValueError, match="append-only"):
+            A.db.session.flush()
+        A.db.session.rollback()
+        A.db.session.remove()
@@ -0,0 +1,80 @@
+from flask import g
+from sqlalchemy import text
+
+import metrics
+from conftest import A, make_product
+
+
+def _scrape(client):
+    r = client.get("/metrics")
+    assert r.status_code == 200 and r.mimetype == "text/plain"
+    r.close()
+    samples = {}
+    for line in r.get_data(as_text=True).splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_requests_are_timed_and_counted_per_endpoint(client, auth):
+    make_product(client, auth, "Cog")
+    before = _scrape(client)
+    # the server closes every response; that is when the request is counted
+    for _ in range(3):
+        r = client.get("/api/products?limit=x")
+        assert r.status_code == 400
+        r.close()
+    client.get("/api/products").close()
+    after = _scrape(client)
+    key = 'endpoint="products",method="GET"'
+
+    def delta(name):
+        return after.get(name, 0) - before.get(name, 0)
+    assert delta(f'http_requests_total{{{key},status="400"}}') == 3
+    assert delta(f'http_requests_total{{{key},status="200"}}') == 1
+    assert delta(f"http_request_duration_seconds_count{{{key}}}") == 4
+    assert after[f'http_request_duration_seconds_bucket{{{key},le="+Inf"}}'] == after[f"http_request_duration_seconds_count{{{key}}}"]
+    assert delta(f"db_queries_per_request_count{{{key}}}") == 4
+    assert delta(f"db_queries_total{{{key}}}") >= 1
+    assert "db_pool_checkouts_total" in after and "db_slow_queries_total" in after
+
+
+def test_streamed_body_is_counted_once_it_is_sent(client):
+    key = 'http_requests_total{endpoint="products",method="GET",status="200"}'
+    before = _scrape(client).get(key, 0)
+    r = client.get("/api/products")
+    assert r.is_streamed
+    r.get_data()
+    r.close()
+    assert _scrape(client)[key] == before + 1
+
+
+def test_slow_queries_are_logged_with_their_endpoint(client, monkeypatch):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 0)
+    total = client.get("/api/metrics/slow-queries").get_json()["total"]
+    client.get("/api/products").get_data()
+    log = client.get("/api/metrics/slow-queries").get_json()
+    assert log["threshold_ms"] == 0 and log["total"] > total
+    assert any(q["endpoint"] == "products" and "product" in q["statement"] for q in log["queries"])
+
+
+def test_repeated_statement_warns_once_per_request(app, monkeypatch, capsys):
+    monkeypatch.setattr(metrics, "N_PLUS_ONE_THRESHOLD", 3)
+    warned = metrics.request_metrics.n_plus_one["products"]
+    with app.test_request_context("/api/products"):
+        g.perf = metrics.RequestStats()
+        for _ in range(5):
+            A.db.session.execute(text("SELECT 1"))
+        A.db.session.remove()
+        assert g.perf.queries == 5
+    assert metrics.request_metrics.n_plus_one["products"] == warned + 1
+    assert capsys.readouterr().out.count("N+1 warning (products)") == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram((1, 5))
+    for v in (0, 1, 3, 9):
+        h.observe(v)
+    assert h.lines("x", 'a="b"') == ['x_bucket{a="b",le="1"} 2', 'x_bucket{a="b",le="5"} 3',
+                                     'x_bucket{a="b",le="+Inf"} 4', 'x_sum{a="b"} 13.000000', 'x_count{a="b"} 4']
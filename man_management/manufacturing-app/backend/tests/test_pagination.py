@@ -0,0 +1,59 @@
+from datetime import datetime
+
+from conftest import A, make_product
+from listing import _encode_cursor
+
+
+def _page(client, path):
+    r = client.get(path)
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return [row["id"] for row in r.get_json()], r.headers.get("X-Next-Cursor")
+
+
+def _walk(client, path):
+    ids, pages, cursor = [], 0, None
+    while True:
+        page, cursor = _page(client, path + (f"&cursor={cursor}" if cursor else ""))
+        ids += page
+        pages += 1
+        if not cursor:
+            return ids, pages
+
+
+def test_exactly_one_page_has_no_next_cursor(client, auth):
+    made = [make_product(client, auth, f"P{i}") for i in range(3)]
+    assert _page(client, "/api/products?limit=3") == (made, None)
+
+
+def test_last_row_lands_on_its_own_page(client, auth):
+    made = [make_product(client, auth, f"P{i}") for i in range(4)]
+    first, cursor = _page(client, "/api/products?limit=3")
+    assert first == made[:3] and cursor
+    assert _page(client, f"/api/products?limit=3&cursor={cursor}") == (made[3:], None)
+
+
+def test_descending_pages_cover_every_row_once(client, auth):
+    made = [make_product(client, auth, f"P{i}") for i in range(5)]
+    assert _walk(client, "/api/products?limit=2&order=-id") == (made[::-1], 3)
+
+
+def test_created_at_ties_are_broken_by_id(client, auth):
+    made = [make_product(client, auth, f"P{i}") for i in range(5)]
+    with A.app.app_context():
+        A.db.session.execute(A.Product.__table__.update().values(created_at=datetime(2025, 1, 1)))
+        A.db.session.commit()
+    # every page boundary falls inside the run of equal timestamps
+    assert _walk(client, "/api/products?limit=2&order=created_at") == (made, 3)
+    assert _walk(client, "/api/products?limit=2&order=-created_at") == (made[::-1], 3)
+
+
+def test_empty_table_and_past_the_end(client, auth):
+    assert _page(client, "/api/products?limit=2") == ([], None)
+    made = make_product(client, auth, "P")
+    cursor = _encode_cursor([made])
+    assert _page(client, f"/api/products?limit=2&cursor={cursor}") == ([], None)
+
+
+def test_bad_paging_args_are_400(client, auth):
+    for qs in ("limit=0", "limit=x", "cursor=not-base64!", "order=name", "cursor=" + _encode_cursor([1, 2])):
+        assert client.get(f"/api/products?{qs}").status_code == 400, qs
@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, exc
+
+import core
+from conftest import A
+
+
+def test_engine_options_come_from_the_environment(monkeypatch):
+    for name, val in (("DB_POOL_SIZE", "3"), ("DB_MAX_OVERFLOW", "1"), ("DB_POOL_TIMEOUT", "2.5"),
+                      ("DB_POOL_RECYCLE", "600"), ("DB_POOL_PRE_PING", "0"), ("DB_STATEMENT_TIMEOUT_MS", "1500")):
+        monkeypatch.setenv(name, val)
+    opts = core.engine_options_from_env()
+    assert opts["poolclass"] is core.TimedQueuePool
+    assert (opts["pool_size"], opts["max_overflow"], opts["pool_timeout"], opts["pool_recycle"], opts["pool_pre_ping"]) == \
+        (3, 1, 2.5, 600, False)
+    assert opts["connect_args"] == {"timeout": 1.5, "check_same_thread": False}
+    monkeypatch.setattr(core, "DB_DIALECT", "mysql")
+    assert core.engine_options_from_env()["connect_args"] == {"init_command": "SET SESSION max_execution_time=1500"}
+
+
+def test_app_engine_counts_checkouts(client):
+    assert isinstance(core.pool_stats.pool, core.TimedQueuePool)
+    before = client.get("/api/metrics/pool").get_json()
+    client.get("/api/products")
+    after = client.get("/api/metrics/pool").get_json()
+    assert after["checkouts"] > before["checkouts"]
+    assert after["checkins"] >= after["checkouts"] - after["checked_out"]
+    assert {"pool_size", "overflow", "wait_seconds_avg", "timeouts"} <= set(after)
+
+
+@pytest.fixture
+def tiny_pool(tmp_path):
+    # one connection, no overflow: the second checkout has to wait for the first
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_path, 'pool.db')}", poolclass=core.TimedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.3)
+    yield engine
+    engine.dispose()
+
+
+def test_waits_and_timeouts_are_recorded(tiny_pool):
+    stats = core.pool_stats
+    held = tiny_pool.connect()
+    timeouts, wait_total = stats.timeouts, stats.wait_total
+    with pytest.raises(exc.TimeoutError):
+        tiny_pool.connect()
+    assert stats.timeouts == timeouts + 1 and stats.wait_total - wait_total >= 0.25
+    # a waiter gets the connection as soon as it is returned
+    threading.Timer(0.1, held.close).start()
+    t0 = time.perf_counter()
+    tiny_pool.connect().close()
+    assert time.perf_counter() - t0 > 0.05
+    assert stats.timeouts == timeouts + 1 and stats.wait_max >= 0.05
+
+
+def test_wsgi_entry_point_serves_the_app(client, monkeypatch):
+    import wsgi
+    monkeypatch.setattr(A.app, "wsgi_app", A.app.wsgi_app)  # undo the ProxyFix wrapping afterwards
+    monkeypatch.setenv("BEHIND_PROXY", "1")
+    served = wsgi.create_app()
+    assert served is A.app and not served.config["DEBUG"]
+    assert type(served.wsgi_app).__name__ == "ProxyFix"
+    assert served.test_client().get("/api/products").status_code == 200
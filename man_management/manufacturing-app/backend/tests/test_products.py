@@ -0,0 +1,55 @@
+from sqlalchemy import event
+
+from conftest import A, make_product, signup
+
+
+def test_delete_product_without_history(client, auth):
+    pid = make_product(client, auth, "Spare")
+    r = client.delete(f"/api/products?id={pid}", headers=auth)
+    assert r.status_code == 200 and r.get_json() == {"deleted": pid}
+    assert client.delete(f"/api/products?id={pid}", headers=auth).status_code == 404
+
+
+def test_delete_product_with_opening_stock_is_409(client, auth):
+    pid = make_product(client, auth, "Bolt", stock_qty=10)
+    r = client.delete(f"/api/products?id={pid}", headers=auth)
+    assert r.status_code == 409
+    assert r.get_json()["references"] == {"stock_ledger": 1}
+    assert any(p["id"] == pid for p in client.get("/api/products").get_json())
+
+
+def test_delete_product_used_by_bom_and_order_is_409(client, auth):
+    top = make_product(client, auth, "Frame", type="finished")
+    comp = make_product(client, auth, "Tube")
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": comp, "qty": 2}]}, headers=auth)
+    client.post("/api/orders", json={"product_id": top, "quantity": 1}, headers=auth)
+    refs = client.delete(f"/api/products?id={top}", headers=auth).get_json()["references"]
+    assert refs["bom"] == 1 and refs["manufacturing_order"] == 1
+
+
+def test_delete_product_of_another_user_is_403(client, auth):
+    pid = make_product(client, auth, "Nut")
+    other = signup(client, "other@example.com")
+    assert client.delete(f"/api/products?id={pid}", headers=other).status_code == 403
+
+
+def test_delete_product_fk_violation_is_409(client, auth, monkeypatch):
+    # MySQL enforces the FKs: a reference that lands between the check and the commit
+    # surfaces as an IntegrityError, which must still be a 409 rather than a 500
+    pid = make_product(client, auth, "Washer", stock_qty=1)
+    checks = []
+    monkeypatch.setattr(A, "product_references", lambda p: {} if checks.append(p) or len(checks) == 1 else {"stock_ledger": 1})
+
+    def enforce_fks(dbapi_conn, record):
+        dbapi_conn.execute("PRAGMA foreign_keys=ON")
+    with A.app.app_context():
+        engine = A.db.engine
+        event.listen(engine, "connect", enforce_fks)
+        engine.dispose()
+    try:
+        r = client.delete(f"/api/products?id={pid}", headers=auth)
+    finally:
+        event.remove(engine, "connect", enforce_fks)
+        engine.dispose()
+    assert r.status_code == 409 and r.get_json()["references"] == {"stock_ledger": 1}
+    assert len(checks) == 2
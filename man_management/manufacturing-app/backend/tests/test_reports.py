@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from conftest import A, make_product
+
+
+def _activity(client, auth):
+    top = make_product(client, auth, "Table", type="finished")
+    leg = make_product(client, auth, "Leg", stock_qty=100)
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": leg, "qty": 4}],
+                                  "operations": [{"name": "glue", "work_center": "WC1", "time": 20},
+                                                 {"name": "sand", "work_center": "WC2", "time": 10}]}, headers=auth)
+    mos = [client.post("/api/orders", json={"product_id": top, "quantity": 1, "status": s}, headers=auth).get_json()["id"]
+           for s in ("planned", "planned", "confirmed", "confirmed")]
+    client.put("/api/orders", json={"id": mos[0], "status": "in_progress"}, headers=auth)
+    client.delete(f"/api/orders?id={mos[1]}", headers=auth)
+    wos = [w["id"] for w in client.get("/api/work-orders").get_json()]
+    client.put(f"/api/work-orders/{wos[0]}/status", json={"status": "started"}, headers=auth)
+    client.put(f"/api/work-orders/{wos[0]}/status", json={"status": "completed"}, headers=auth)
+    client.put(f"/api/work-orders/{wos[1]}/status", json={"status": "completed"}, headers=auth)
+    client.post("/api/stock", json={"product_id": leg, "movement_type": "out", "quantity": 3}, headers=auth)
+    return top, leg
+
+
+def _live():
+    # the aggregates the rollup stands in for, straight from the source tables
+    MO, WO, L = A.ManufacturingOrder, A.WorkOrder, A.StockLedger
+    with A.app.app_context():
+        by_status = dict(A.db.session.execute(select(MO.status, func.count()).group_by(MO.status)).all())
+        completed = A.db.session.execute(select(func.count()).where(WO.end_time.is_not(None))).scalar()
+        planned = A.db.session.execute(select(func.sum(WO.planned_time_mins)).where(WO.end_time.is_not(None))).scalar()
+        moved = dict(A.db.session.execute(select(L.movement_type, func.sum(L.quantity)).group_by(L.movement_type)).all())
+        A.db.session.remove()
+    return by_status, completed, planned, moved
+
+
+def _rollup_rows():
+    t = A.ReportRollup
+    with A.app.app_context():
+        rows = {(d, p, w, m): v for d, p, w, m, v in A.db.session.execute(select(t.day, t.product_id, t.work_center, t.metric, t.value))
+                if v}
+        A.db.session.remove()
+    return rows
+
+
+def test_summary_matches_live_group_by(client, auth):
+    _activity(client, auth)
+    by_status, completed, planned, moved = _live()
+    summary = client.get("/api/reports/summary").get_json()
+    assert summary["mo_by_status"] == by_status
+    assert summary["wo_completed"] == completed == 2
+    assert summary["wo_planned_mins"] == planned
+    assert summary["stock_in"] == moved["in"] and summary["stock_out"] == moved["out"]
+    orders = client.get("/api/reports/orders").get_json()
+    assert orders["by_status"] == by_status and orders["total"] == sum(by_status.values())
+
+
+def test_rebuild_reproduces_the_maintained_rollup(client, auth):
+    _activity(client, auth)
+    maintained = _rollup_rows()
+    assert client.post("/api/reports/rollups/rebuild", headers=auth).status_code == 200
+    assert _rollup_rows() == maintained
+
+
+def test_daily_filters_and_bad_dates(client, auth):
+    top, leg = _activity(client, auth)
+    today = datetime.utcnow().date().isoformat()
+    rows = client.get(f"/api/reports/daily?from={today}&to={today}&product_id={top}&work_center=WC1").get_json()
+    assert len(rows) == 1 and rows[0]["wo_completed"] == 1 and rows[0]["wo_planned_mins"] == 20
+    L = A.StockLedger
+    with A.app.app_context():
+        out = A.db.session.execute(select(func.sum(L.quantity)).where(L.product_id == leg, L.movement_type == "out")).scalar()
+        A.db.session.remove()
+    stock = client.get(f"/api/reports/daily?product_id={leg}").get_json()
+    assert sum(r.get("stock_out", 0) for r in stock) == out > 3
+    assert client.get("/api/reports/daily?from=2026-02-30").status_code == 400
+    assert client.get("/api/reports/summary?product_id=x").status_code == 400
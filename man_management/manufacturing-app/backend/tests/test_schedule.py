@@ -0,0 +1,55 @@
+import scheduling
+from conftest import make_product, run_jobs, signup
+
+
+def _scheduled_mo(client, auth):
+    top = make_product(client, auth, "Cabinet", type="finished")
+    ops = [{"name": "cut", "work_center": "WC1", "time": 30}, {"name": "paint", "work_center": "WC2", "time": 20}]
+    client.post("/api/bom", json={"product_id": top, "components": [], "operations": ops}, headers=auth)
+    mo = client.post("/api/orders", json={"product_id": top, "quantity": 1, "status": "confirmed"}, headers=auth).get_json()
+    assert client.post("/api/schedule", json={}, headers=auth).status_code == 200
+    wos = [w for w in client.get("/api/work-orders").get_json() if w["mo_id"] == mo["id"]]
+    assert all(w["scheduled_start"] for w in wos)
+    return wos
+
+
+def _reschedule_jobs(client, auth):
+    # reschedule jobs are queued by the server, not a user: only admins list them
+    admin = signup(client, "admin@example.com", role="Admin")
+    return client.get("/api/jobs?kind=reschedule", headers=admin).get_json()
+
+
+def test_status_change_queues_one_debounced_reschedule(client, auth, monkeypatch):
+    monkeypatch.setattr(scheduling, "SCHEDULE_DEBOUNCE_SECONDS", 3600)
+    monkeypatch.setattr(scheduling, "_reschedule_slot", None)
+    wos = _scheduled_mo(client, auth)
+    calls = []
+    monkeypatch.setattr(scheduling, "run_scheduler", lambda **kw: calls.append(kw) or {"scheduled": 0})
+    for status in ("started", "completed"):
+        assert client.put(f"/api/work-orders/{wos[0]['id']}/status", json={"status": status}).status_code == 200
+    assert calls == []  # nothing re-planned inside the requests
+    jobs = _reschedule_jobs(client, auth)
+    assert len(jobs) == 1 and jobs[0]["status"] == "queued"
+    assert run_jobs() == 0  # not due before the window closes
+    assert run_jobs(due_now=True) == 1
+    assert len(calls) == 1 and calls[0]["frozen_before"] is not None
+
+
+def test_reschedule_job_replans_open_work_orders(client, auth, monkeypatch):
+    monkeypatch.setattr(scheduling, "_reschedule_slot", None)
+    monkeypatch.setattr(scheduling, "SCHEDULE_FROZEN_MINUTES", 0)
+    wos = _scheduled_mo(client, auth)
+    client.put(f"/api/work-orders/{wos[0]['id']}/status", json={"status": "completed"})
+    assert run_jobs(due_now=True) == 1
+    job = _reschedule_jobs(client, auth)[0]
+    assert job["status"] == "done" and job["result"]["scheduled"] == 1
+
+
+def test_unscheduled_work_orders_do_not_queue_reschedules(client, auth, monkeypatch):
+    monkeypatch.setattr(scheduling, "_reschedule_slot", None)
+    top = make_product(client, auth, "Shelf", type="finished")
+    client.post("/api/bom", json={"product_id": top, "components": [], "operations": [{"name": "cut", "time": 5}]}, headers=auth)
+    client.post("/api/orders", json={"product_id": top, "quantity": 1, "status": "confirmed"}, headers=auth)
+    wo = client.get("/api/work-orders").get_json()[0]
+    client.put(f"/api/work-orders/{wo['id']}/status", json={"status": "started"})
+    assert _reschedule_jobs(client, auth) == []
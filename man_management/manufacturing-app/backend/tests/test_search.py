@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import text, update
+
+from conftest import A, make_product
+
+
+def _names(r, kind="products"):
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return [row.get("name") or row.get("operation") for row in r.get_json()["results"][kind]]
+
+
+@pytest.fixture
+def catalog(client, auth):
+    for name, kind in (("Assembly jig", "tool"), ("Brass fitting", "raw"), ("Glass panel", "raw"),
+                       ("Sub assembly frame", "finished"), ("Jig saw blade", "tool")):
+        make_product(client, auth, name, type=kind)
+
+
+def test_prefix_search_and_ranking(client, catalog):
+    r = client.get("/api/search?q=ass&types=products")
+    assert r.get_json()["mode"] == {"products": "fts5"}
+    # "ass" starts "assembly" but is not a token start in "brass" or "glass"
+    assert _names(r) == ["Assembly jig", "Sub assembly frame"]
+    assert _names(client.get("/api/search?q=jig&types=products")) == ["Assembly jig", "Jig saw blade"]
+    assert _names(client.get("/api/search?q=jig ass&types=products")) == ["Assembly jig"]
+    assert _names(client.get("/api/search?q=jig&type=tool&types=products")) == ["Assembly jig", "Jig saw blade"]
+    assert _names(client.get("/api/search?q=jig&type=raw&types=products")) == []
+
+
+def test_like_fallback_matches_the_index(client, catalog):
+    # single-character terms differ on purpose: FTS5 matches them as whole tokens only
+    queries = ("ass", "jig", "jig ass", "fra", "bl", "panel glass")
+    indexed = [_names(client.get(f"/api/search?q={q}&types=products")) for q in queries]
+    A._search_modes["product"] = "like"
+    r = client.get("/api/search?q=ass&types=products")
+    assert r.get_json()["mode"] == {"products": "like"}
+    assert [_names(client.get(f"/api/search?q={q}&types=products")) for q in queries] == indexed
+
+
+def test_triggers_keep_the_index_current(client, auth, catalog):
+    with A.app.app_context():
+        A.db.session.execute(update(A.Product).where(A.Product.name == "Glass panel").values(name="Acrylic panel"))
+        A.db.session.execute(text("DELETE FROM product WHERE name = 'Assembly jig'"))
+        A.db.session.commit()
+        A.db.session.remove()
+    assert _names(client.get("/api/search?q=glass&types=products")) == []
+    assert _names(client.get("/api/search?q=acr&types=products")) == ["Acrylic panel"]
+    assert _names(client.get("/api/search?q=ass&types=products")) == ["Sub assembly frame"]
+
+
+def test_index_created_on_an_existing_table_covers_its_rows(client, catalog):
+    with A.app.app_context():
+        with A.db.engine.begin() as conn:
+            conn.execute(text("DROP TABLE product_fts"))
+            for suffix in ("ai", "ad", "au"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS product_fts_{suffix}"))
+        A._search_modes.clear()
+        assert A.search_mode("product") == "like"
+        with A.db.engine.begin() as conn:
+            A.create_search_index(conn, "product")
+        A._search_modes.clear()
+        A.db.session.remove()
+    r = client.get("/api/search?q=ass&types=products")
+    assert r.get_json()["mode"] == {"products": "fts5"} and _names(r) == ["Assembly jig", "Sub assembly frame"]
+
+
+def test_orders_need_auth_and_filters_pick_types(client, auth, catalog):
+    top = make_product(client, auth, "Assembly cart", type="finished")
+    client.post("/api/orders", json={"product_id": top, "quantity": 1, "assignee": "Assad"}, headers=auth)
+    assert client.get("/api/search?q=ass&types=orders").status_code == 401
+    assert set(client.get("/api/search?q=ass").get_json()["results"]) == {"products", "work_orders"}
+    r = client.get("/api/search?q=ass", headers=auth).get_json()
+    assert [o["assignee"] for o in r["results"]["orders"]] == ["Assad"]
+    # status is only a filter column of orders and work orders
+    assert set(client.get("/api/search?q=ass&status=draft", headers=auth).get_json()["results"]) == {"orders", "work_orders"}
+    # an id filter goes through LIKE on the few rows it leaves
+    r = client.get(f"/api/search?q=ass&product_id={top}&types=orders", headers=auth).get_json()
+    assert r["mode"] == {"orders": "like"} and len(r["results"]["orders"]) == 1
+
+
+def test_bad_search_args_are_400(client):
+    for qs in ("", "q=%20%21", "q=ass&limit=x", "q=ass&types=users", "q=ass&mo_id=x&types=work_orders"):
+        assert client.get("/api/search?" + qs).status_code == 400, qs
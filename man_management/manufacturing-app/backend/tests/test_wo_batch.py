@@ -0,0 +1,155 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+import wo_batch
+from conftest import A, make_product
+from models import WoStatusEvent
+
+
+def _work_orders(client, auth, n=3, comp_stock=100):
+    top = make_product(client, auth, "Frame", type="finished")
+    comp = make_product(client, auth, "Tube", stock_qty=comp_stock)
+    ops = [{"name": f"op{i}", "work_center": "WC1", "time": 10} for i in range(n)]
+    client.post("/api/bom", json={"product_id": top, "components": [{"product_id": comp, "qty": 1}],
+                                  "operations": ops}, headers=auth)
+    mo = client.post("/api/orders", json={"product_id": top, "quantity": 1, "status": "confirmed"}, headers=auth).get_json()
+    return [w["id"] for w in client.get("/api/work-orders").get_json() if w["mo_id"] == mo["id"]], comp
+
+
+def _event(wo_id, status):
+    return {"wo_id": wo_id, "status": status, "check_stock": None, "received_at": datetime.utcnow(),
+            "done": threading.Event()}
+
+
+def _statuses(ids):
+    with A.app.app_context():
+        out = dict(A.db.session.execute(select(A.WorkOrder.id, A.WorkOrder.status).where(A.WorkOrder.id.in_(ids))).all())
+        A.db.session.remove()
+    return [out[i] for i in ids]
+
+
+def _spilled_rows():
+    with A.app.app_context():
+        n = A.db.session.execute(select(func.count()).select_from(WoStatusEvent)).scalar()
+        A.db.session.remove()
+    return n
+
+
+def test_shutdown_spills_queue_and_next_batch_applies_it(client, auth):
+    ids, _ = _work_orders(client, auth, 2)
+    b = wo_batch.WoStatusBatcher(10, 0, 100)
+    b._queue.extend([_event(ids[0], "started"), _event(ids[1], "started"), _event(ids[0], "completed")])
+    b._spill_queue()  # what atexit runs when the worker stops
+    assert not b._queue and b.spilled == 3 and _spilled_rows() == 3
+    assert _statuses(ids) == ["planned", "planned"]
+    # any worker's next batch picks the rows up first, in arrival order
+    with A.app.app_context():
+        b._flush([])
+        A.db.session.remove()
+    assert _statuses(ids) == ["completed", "started"]
+    assert _spilled_rows() == 0 and b.applied == 3
+
+
+def test_failing_event_is_isolated_and_persisted(client, auth, monkeypatch):
+    ids, comp = _work_orders(client, auth, 3)
+    apply = wo_batch.apply_wo_status_events
+
+    def failing(events):
+        if any(e["wo_id"] == ids[1] for e in events):
+            raise RuntimeError("deadlock")
+        return apply(events)
+
+    monkeypatch.setattr(wo_batch, "apply_wo_status_events", failing)
+    b = wo_batch.WoStatusBatcher(10, 0, 100)
+    batch = [_event(ids[0], "completed"), _event(ids[1], "completed"), _event(ids[2], "started")]
+    with A.app.app_context():
+        b._flush(batch)
+        A.db.session.remove()
+    assert all(ev["done"].is_set() for ev in batch)
+    assert batch[0]["done"].outcome["wo"]["status"] == "completed"
+    assert batch[1]["done"].outcome == {"wo_id": ids[1], "queued": True}
+    assert batch[2]["done"].outcome["wo"]["status"] == "started"
+    assert _statuses(ids) == ["completed", "planned", "started"]
+    assert b.failed == 1 and _spilled_rows() == 1
+    # 100, less one for the MO confirmation and one for the completed WO only
+    assert client.get(f"/api/atp?product_id={comp}").get_json()["products"][str(comp)]["on_hand"] == 98
+
+
+def test_batched_and_direct_completion_agree(client, auth):
+    ids, comp = _work_orders(client, auth, 2)
+    b = wo_batch.WoStatusBatcher(10, 0, 100)
+    batch = [_event(ids[0], "completed")]
+    with A.app.app_context():
+        b._flush(batch)
+        A.db.session.remove()
+    assert client.put(f"/api/work-orders/{ids[1]}/status", json={"status": "completed"}).status_code == 200
+    assert _statuses(ids) == ["completed", "completed"]
+    refs = {r["reference"]: r["quantity"] for r in client.get(f"/api/stock?product_id={comp}").get_json()}
+    assert refs[f"WO:{ids[0]}"] == refs[f"WO:{ids[1]}"] == 1
+
+
+def test_durable_row_is_marked_failed_after_max_attempts(client, auth, monkeypatch):
+    ids, _ = _work_orders(client, auth, 2)
+    apply = wo_batch.apply_wo_status_events
+    seen = []
+
+    def failing(events):
+        seen.extend(e["wo_id"] for e in events)
+        if any(e["wo_id"] == ids[1] for e in events):
+            raise RuntimeError("bad row")
+        return apply(events)
+
+    monkeypatch.setattr(wo_batch, "apply_wo_status_events", failing)
+    monkeypatch.setattr(wo_batch, "WO_BATCH_DURABLE_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(wo_batch, "WO_BATCH_DURABLE_POLL", 0)
+    b = wo_batch.WoStatusBatcher(10, 0, 100)
+    with A.app.app_context():
+        b.spill([_event(ids[1], "completed"), _event(ids[0], "started")])
+        for _ in range(3):
+            b._flush([])
+        row = A.db.session.execute(select(WoStatusEvent)).scalars().one()
+        A.db.session.remove()
+    assert _statuses(ids) == ["started", "planned"]
+    assert (row.wo_id, row.attempts, row.error) == (ids[1], 2, "bad row") and row.failed_at is not None
+    # the third poll left the failed row alone
+    seen.clear()
+    with A.app.app_context():
+        b._flush([])
+        A.db.session.remove()
+    assert seen == [] and b.failed == 2
+
+
+def test_ack_timeout_persists_the_event_before_answering(client, auth, monkeypatch):
+    ids, _ = _work_orders(client, auth, 1)
+    b = wo_batch.wo_batcher
+    # a flusher that never gets to the queue
+    monkeypatch.setattr(b, "enabled", True)
+    monkeypatch.setattr(b, "_pid", wo_batch.os.getpid())
+    monkeypatch.setattr(b, "_queue", wo_batch.deque())
+    monkeypatch.setattr(wo_batch, "WO_BATCH_ACK_TIMEOUT", 0.05)
+    r = client.put(f"/api/work-orders/{ids[0]}/status", json={"status": "started"}, headers=auth)
+    assert r.status_code == 202 and r.get_json() == {"queued": True, "wo_id": ids[0]}
+    assert not b._queue and _spilled_rows() == 1
+    with A.app.app_context():
+        wo_batch.WoStatusBatcher(10, 0, 100)._flush([])
+        A.db.session.remove()
+    assert _statuses(ids) == ["started"] and _spilled_rows() == 0
+
+
+def test_unpersisted_event_is_503_with_retry_after(client, auth, monkeypatch):
+    ids, _ = _work_orders(client, auth, 1)
+    b = wo_batch.wo_batcher
+    monkeypatch.setattr(b, "enabled", True)
+    monkeypatch.setattr(b, "_pid", wo_batch.os.getpid())
+    monkeypatch.setattr(b, "_queue", wo_batch.deque())
+    monkeypatch.setattr(wo_batch, "WO_BATCH_ACK_TIMEOUT", 0.05)
+
+    def broken_spill(events):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(b, "spill", broken_spill)
+    r = client.put(f"/api/work-orders/{ids[0]}/status", json={"status": "started"}, headers=auth)
+    assert r.status_code == 503 and r.headers["Retry-After"] == str(wo_batch.WO_BATCH_RETRY_AFTER)
+    # withdrawn, so a retry cannot apply it twice
+    assert not b._queue and _spilled_rows() == 0 and _statuses(ids) == ["planned"]
@@ -0,0 +1,104 @@
+from datetime import datetime
+import os, threading, time
+from sqlalchemy import select, event
+from sqlalchemy.orm import Session
+
+from core import app, db
+from models import ResourceVersion
+
+
+# ---------------- RESOURCE VERSIONS ----------------
+# One version stamp per table in resource_version, bumped once per committed transaction
+# that wrote the table. ORM writes are picked up by an after_flush hook; Core bulk helpers
+# (apply_stock_deltas, bulk_insert_rows, the scheduler) call touch_resources() themselves.
+# The bump runs after the commit, so a reader that sees the new version also sees the data.
+# Versions are cached per process for RESOURCE_VERSION_TTL seconds; local writes drop the
+# cache at once, writes made by other workers show up within the TTL.
+VERSIONED_TABLES = ('product', 'bom', 'manufacturing_order', 'work_order', 'stock_ledger')
+RESOURCE_VERSION_TTL = float(os.environ.get("RESOURCE_VERSION_TTL", "1.0"))
+
+
+class ResourceVersions:
+    """Per-process cache of resource_version rows: name -> (version, updated_at)."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = {}
+        self._loaded_at = None
+        self.loads = self.bumps = self.failures = 0
+        # called when a bump fails, so caches keyed on the old stamp can drop what they hold
+        self.failure_hooks = []
+
+    def get(self, names):
+        """Return ([version per name], newest updated_at) for names."""
+        now = time.monotonic()
+        with self._lock:
+            fresh = self._loaded_at is not None and now - self._loaded_at < self.ttl
+            data = self._data
+        if not fresh:
+            t = ResourceVersion.__table__
+            data = {n: (v, ts) for n, v, ts in db.session.execute(select(t.c.name, t.c.version, t.c.updated_at))}
+            with self._lock:
+                self._data, self._loaded_at = data, now
+                self.loads += 1
+        vals = [data.get(n, (0, None)) for n in names]
+        stamps = [ts for _, ts in vals if ts is not None]
+        return [v for v, _ in vals], max(stamps) if stamps else None
+
+    def bump(self, names):
+        t = ResourceVersion.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(t.update().where(t.c.name.in_(sorted(names))).values(
+                    version=t.c.version + 1, updated_at=datetime.utcnow()))
+        except Exception:
+            # the write itself is already committed, but the old stamp now describes stale data
+            app.logger.exception("Could not bump resource versions for %s", sorted(names))
+            with self._lock:
+                self.failures += 1
+            for hook in self.failure_hooks:
+                hook()
+        with self._lock:
+            self._loaded_at = None
+            self.bumps += 1
+
+    def stats(self):
+        with self._lock:
+            return {'versions': {n: v for n, (v, _) in self._data.items()}, 'ttl_seconds': self.ttl,
+                    'loads': self.loads, 'bumps': self.bumps, 'failures': self.failures}
+
+
+resource_versions = ResourceVersions(RESOURCE_VERSION_TTL)
+
+
+def touch_resources(session, *tables):
+    """Mark tables as written in session's transaction; their versions are bumped after commit."""
+    session.info.setdefault('touched_resources', set()).update(t for t in tables if t in VERSIONED_TABLES)
+
+
+@event.listens_for(Session, 'after_flush')
+def _touch_flushed_resources(session, flush_context):
+    touch_resources(session, *{type(o).__tablename__ for o in session.new},
+                    *{type(o).__tablename__ for o in session.deleted},
+                    *{type(o).__tablename__ for o in session.dirty if session.is_modified(o)})
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_resource_versions(session):
+    touched = session.info.pop('touched_resources', None)
+    if touched:
+        resource_versions.bump(touched)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_touched_resources(session):
+    session.info.pop('touched_resources', None)
+
+
+def seed_resource_versions():
+    have = set(db.session.execute(select(ResourceVersion.name)).scalars())
+    for name in VERSIONED_TABLES:
+        if name not in have:
+            db.session.add(ResourceVersion(name=name, version=0))
+    db.session.commit()
@@ -0,0 +1,371 @@
+from flask import jsonify
+from datetime import datetime
+import os, threading, time, atexit
+from collections import defaultdict, deque
+from sqlalchemy import select, bindparam, case
+
+from core import app, db
+from models import BOM, ManufacturingOrder, Product, WorkOrder, WoStatusEvent
+from versions import touch_resources
+from rollups import apply_rollup_deltas, ROLLUP_ATTRS, rollup_contrib
+from atp import component_needs, record_consumption
+from serialization import get_serializer
+from changes import record_changes
+from consumption import (apply_stock_deltas, first_bom_values, post_ledger_entries, shortage_message,
+                         STOCK_CHECK_AVAILABILITY)
+from scheduling import request_reschedule, SCHEDULE_ON_STATUS_CHANGE
+
+
+# ---------------- WO STATUS BATCHING ----------------
+# Optional write-behind ingestion for PUT /api/work-orders/<id>/status (WO_STATUS_BATCH=1),
+# for shift changes when hundreds of terminals report at once. Requests queue their event
+# in memory and wait for its acknowledgement; one flusher thread per process applies the
+# queue in transactions of up to WO_BATCH_MAX events, gathered for at most
+# WO_BATCH_WINDOW_MS after the first one. Each transaction updates every WO once and every
+# consumed product once (summed deltas), so throughput grows with the batch size instead of
+# being bound by one commit per request.
+# Durable fallback: when the queue holds WO_BATCH_QUEUE_MAX events, an event cannot be
+# committed, or its request gives up waiting after WO_BATCH_ACK_TIMEOUT, it is written to
+# wo_status_event before the 202 (503 with Retry-After if even that fails); the next batch
+# of any worker applies those rows first, in id order, so per-WO order is kept. A row that
+# fails WO_BATCH_DURABLE_MAX_ATTEMPTS times is marked failed_at and left for inspection.
+WO_STATUS_BATCH = os.environ.get("WO_STATUS_BATCH", "0") == "1"
+WO_BATCH_MAX = int(os.environ.get("WO_BATCH_MAX", "500"))
+WO_BATCH_WINDOW_MS = float(os.environ.get("WO_BATCH_WINDOW_MS", "5"))
+WO_BATCH_QUEUE_MAX = int(os.environ.get("WO_BATCH_QUEUE_MAX", "10000"))
+WO_BATCH_ACK_TIMEOUT = float(os.environ.get("WO_BATCH_ACK_TIMEOUT", "10"))
+WO_BATCH_DURABLE_POLL = float(os.environ.get("WO_BATCH_DURABLE_POLL", "1"))
+WO_BATCH_DURABLE_MAX_ATTEMPTS = int(os.environ.get("WO_BATCH_DURABLE_MAX_ATTEMPTS", "5"))
+WO_BATCH_RETRY_AFTER = int(os.environ.get("WO_BATCH_RETRY_AFTER", "5"))  # Retry-After seconds
+
+
+def apply_wo_status_events(events):
+    """Apply WO status events ({wo_id, status, check_stock, received_at}) in order (no commit).
+
+    The end state matches handling them one request at a time: each event sets the status,
+    'started' / 'completed' stamp start_time / end_time and every 'completed' consumes the
+    MO's BOM. But each WO row and each product's stock is written once per call.
+    Returns (one outcome per event, whether a scheduled WO changed); an outcome has 'error'
+    for unknown WOs, otherwise 'wo' and, when stock could not be consumed, 'consumption_error'.
+    """
+    W, M = WorkOrder.__table__, ManufacturingOrder.__table__
+    roll_attrs = ROLLUP_ATTRS[WorkOrder]
+    cols = ('status', 'start_time', 'end_time')
+    before = {r.id: dict(r._mapping) for r in db.session.execute(
+        select(W.c.id, W.c.mo_id, W.c.scheduled_start, *[W.c[a] for a in dict.fromkeys(cols + roll_attrs)],
+               M.c.id.label('mo'), M.c.quantity, M.c.product_id)
+        .outerjoin(M, M.c.id == W.c.mo_id).where(W.c.id.in_({e['wo_id'] for e in events})))}
+    state = {wo_id: dict(row) for wo_id, row in before.items()}
+    outcomes, completions, steps = [], [], []
+    for e in events:
+        s = state.get(e['wo_id'])
+        if s is None:
+            outcomes.append({'wo_id': e['wo_id'], 'error': 'Not found'})
+            continue
+        s['status'] = e['status']
+        if e['status'] == 'started':
+            s['start_time'] = e['received_at']
+        if e['status'] == 'completed':
+            s['end_time'] = e['received_at']
+            completions.append((len(outcomes), e))
+        steps.append((len(outcomes), e['wo_id'], tuple(s[c] for c in cols)))
+        outcomes.append({'wo_id': e['wo_id']})
+    if not state:
+        return outcomes, False
+
+    # consumption: checked event by event against a running on-hand, applied as one delta per product
+    comps_by_product = first_bom_values([state[e['wo_id']]['product_id'] for _, e in completions], BOM.components)
+    needs = []
+    for i, e in completions:
+        s = state[e['wo_id']]
+        if s['mo'] is None:
+            outcomes[i]['consumption_error'] = f"MO {s['mo_id']} not found"
+        elif isinstance(comps_by_product.get(s['product_id']), list):
+            needs.append((i, e, s['mo'], component_needs(comps_by_product[s['product_id']], s['quantity'] or 1)))
+    checks = [STOCK_CHECK_AVAILABILITY if e['check_stock'] is None else e['check_stock'] for _, e, _, _ in needs]
+    on_hand = {}
+    if needs:
+        stmt = select(Product.id, Product.stock_qty).where(Product.id.in_({p for *_, need in needs for p in need}))
+        if any(checks):
+            # lock the rows (MySQL) so the checks and the update see the same quantities
+            stmt = stmt.with_for_update()
+        on_hand = {pid: qty or 0 for pid, qty in db.session.execute(stmt)}
+    deltas, ledger = defaultdict(int), []
+    consumed = defaultdict(lambda: defaultdict(int))
+    for (i, e, mo_id, need), check in zip(needs, checks):
+        missing = sorted(p for p in need if p not in on_hand)
+        short = {p: q - on_hand[p] for p, q in need.items() if q > on_hand[p]} if check and not missing else {}
+        if missing or short:
+            outcomes[i]['consumption_error'] = f'Product {missing[0]} not found' if missing else shortage_message(short)
+            continue
+        for p, q in need.items():
+            on_hand[p] -= q
+            deltas[p] -= q
+            consumed[mo_id][p] += q
+            ledger.append({'product_id': p, 'movement_type': 'out', 'quantity': q,
+                           'reference': f"WO:{e['wo_id']}", 'timestamp': e['received_at']})
+
+    db.session.execute(W.update().where(W.c.id == bindparam('b_id')).values(
+        status=bindparam('b_status'), start_time=bindparam('b_start'), end_time=bindparam('b_end')),
+        [{'b_id': wo_id, 'b_status': s['status'], 'b_start': s['start_time'], 'b_end': s['end_time']}
+         for wo_id, s in state.items()])
+    touch_resources(db.session, 'work_order')
+    # Core UPDATEs bypass the ORM flush listener, so move the rollups directly
+    rollup = defaultdict(float)
+    for wo_id, s in state.items():
+        for key, d in rollup_contrib(WorkOrder, [before[wo_id][a] for a in roll_attrs]):
+            rollup[key] -= d
+        for key, d in rollup_contrib(WorkOrder, [s[a] for a in roll_attrs]):
+            rollup[key] += d
+    apply_rollup_deltas(db.session.connection(), rollup)
+    apply_stock_deltas(deltas, 'WO:batch')
+    post_ledger_entries(ledger)
+    if consumed:
+        record_consumption({mo_id: dict(need) for mo_id, need in consumed.items()})
+
+    # one change event per status change, carrying the row as it was right after it
+    ser = get_serializer(WorkOrder)
+    names = [c.name for c in W.columns]
+    at = [names.index(c) for c in cols]
+    rows = {r[0]: list(r) for r in db.session.execute(select(*W.columns).where(W.c.id.in_(list(state))))}
+    changes = []
+    for i, wo_id, vals in steps:
+        row = rows[wo_id]
+        for k, v in zip(at, vals):
+            row[k] = v
+        outcomes[i]['wo'] = ser.row(row)
+        changes.append(('work_order', 'status', wo_id, outcomes[i]['wo']))
+    record_changes(changes)
+    return outcomes, any(s['scheduled_start'] is not None for s in before.values())
+
+
+class WoStatusBatcher:
+    """In-memory queue plus flusher thread of this process; restarted lazily after a fork."""
+
+    def __init__(self, max_batch, window_ms, queue_max, enabled=False):
+        self.enabled = enabled  # the status endpoint queues here instead of writing directly
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self.queue_max = queue_max
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._pid = None
+        self._spilled = False
+        self._durable_checked = 0.0
+        self.batches = self.applied = self.spilled = self.failed = self.largest = 0
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            if self._pid is None:
+                atexit.register(self._spill_queue)
+            # events queued by the parent before a fork belong to the parent
+            self._pid = os.getpid()
+            self._queue = deque()
+            threading.Thread(target=self._loop, name='wo-status-batcher', daemon=True).start()
+
+    def submit(self, event):
+        """Queue event; returns a threading.Event that is set with .outcome once it is applied,
+        or None when the queue is full and the event was written to wo_status_event instead."""
+        self.ensure_started()
+        event['done'] = threading.Event()
+        with self._cond:
+            if len(self._queue) < self.queue_max:
+                self._queue.append(event)
+                self._cond.notify()
+                return event['done']
+        self.spill([event])
+        return None
+
+    def withdraw(self, event):
+        """Take a submitted event back out of the queue; False once the flusher has it."""
+        with self._cond:
+            for i, queued in enumerate(self._queue):
+                if queued is event:
+                    del self._queue[i]
+                    return True
+        return False
+
+    def spill(self, events):
+        """Write events to wo_status_event in their own transaction."""
+        with db.engine.begin() as conn:
+            conn.execute(WoStatusEvent.__table__.insert(),
+                         [{k: e[k] for k in ('wo_id', 'status', 'check_stock', 'received_at')} for e in events])
+        self._spilled = True
+        self.spilled += len(events)
+
+    def _spill_queue(self):
+        # on interpreter exit, keep what is still queued
+        with self._cond:
+            events, self._queue = list(self._queue), deque()
+        if events:
+            try:
+                with app.app_context():
+                    self.spill(events)
+            except Exception as e:
+                print(f"Lost {len(events)} queued WO status events:", e)
+
+    def _durable_due(self):
+        return self._spilled or time.monotonic() - self._durable_checked >= WO_BATCH_DURABLE_POLL
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._durable_due():
+                    self._cond.wait(WO_BATCH_DURABLE_POLL)
+                # group commit: give other terminals a few ms to join this transaction
+                deadline = time.monotonic() + self.window
+                while self._queue and len(self._queue) < self.max_batch:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            try:
+                with app.app_context():
+                    self._flush(batch)
+            except Exception as e:
+                print("WO status batch error:", e)
+                # the request may have stopped waiting: keep what was not applied
+                left = [ev for ev in batch if not ev['done'].is_set()]
+                outcome = {'queued': True}
+                try:
+                    with app.app_context():
+                        if left:
+                            self.spill(left)
+                except Exception as se:
+                    print(f"Could not persist {len(left)} WO status events:", se)
+                    outcome = {'error': str(e)}
+                for ev in left:
+                    self._ack(ev, dict(outcome, wo_id=ev['wo_id']))
+
+    def _flush(self, batch):
+        durable = []
+        if self._durable_due():
+            # spilled events are older than anything in memory, so they go first
+            self._durable_checked = time.monotonic()
+            T = WoStatusEvent.__table__
+            durable = [dict(r._mapping) for r in db.session.execute(
+                select(T.c.id, T.c.wo_id, T.c.status, T.c.check_stock, T.c.received_at)
+                .where(T.c.failed_at.is_(None)).order_by(T.c.id).limit(self.max_batch))]
+            db.session.rollback()
+            self._spilled = len(durable) == self.max_batch
+        events = durable + batch
+        if events and not self._commit(events):
+            # find the failing event; the others still go in, in order
+            for ev in events:
+                self._commit([ev])
+
+    def _commit(self, events):
+        """Apply events in one transaction; False when that failed and there is more than one."""
+        try:
+            # durable rows (the ones with an id) are claimed by deleting them in the same transaction
+            ids = [e['id'] for e in events if 'id' in e]
+            if ids:
+                T = WoStatusEvent.__table__
+                if db.session.execute(T.delete().where(T.c.id.in_(ids))).rowcount != len(ids):
+                    # another worker took them first
+                    db.session.rollback()
+                    rest = [e for e in events if 'id' not in e]
+                    return self._commit(rest) if rest else True
+            outcomes, rescheduled = apply_wo_status_events(events)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(events) > 1:
+                return False
+            self._failed(events[0], e)
+            return True
+        self.batches += 1
+        self.applied += len(events)
+        self.largest = max(self.largest, len(events))
+        for ev, outcome in zip(events, outcomes):
+            if 'done' in ev:
+                self._ack(ev, outcome)
+        if rescheduled and SCHEDULE_ON_STATUS_CHANGE:
+            try:
+                request_reschedule()
+            except Exception as e:
+                db.session.rollback()
+                print("Could not queue the reschedule after a WO status batch:", e)
+        return True
+
+    def _failed(self, ev, err):
+        self.failed += 1
+        print(f"WO status event for WO {ev['wo_id']} failed:", err)
+        if 'done' not in ev:
+            # a durable row stays in wo_status_event: retried on the next poll, up to a limit
+            T = WoStatusEvent.__table__
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(T.update().where(T.c.id == ev['id']).values(
+                        attempts=T.c.attempts + 1, error=str(err)[:500],
+                        failed_at=case((T.c.attempts + 1 >= WO_BATCH_DURABLE_MAX_ATTEMPTS, datetime.utcnow()), else_=None)))
+            except Exception as ue:
+                print("Could not record the failed WO status event:", ue)
+            return
+        outcome = {'wo_id': ev['wo_id'], 'error': str(err)}
+        try:
+            self.spill([ev])
+            outcome = {'wo_id': ev['wo_id'], 'queued': True}
+        except Exception as se:
+            print("Could not persist WO status event:", se)
+        self._ack(ev, outcome)
+
+    @staticmethod
+    def _ack(ev, outcome):
+        ev['done'].outcome = outcome
+        ev['done'].set()
+
+    def stats(self):
+        return {'enabled': self.enabled, 'queued': len(self._queue), 'batches': self.batches,
+                'applied': self.applied, 'avg_batch': round(self.applied / self.batches, 1) if self.batches else 0,
+                'largest_batch': self.largest, 'spilled': self.spilled, 'failed': self.failed}
+
+
+wo_batcher = WoStatusBatcher(WO_BATCH_MAX, WO_BATCH_WINDOW_MS, WO_BATCH_QUEUE_MAX, WO_STATUS_BATCH)
+
+
+def queue_wo_status(wo_id, d):
+    """Batched PUT /api/work-orders/<id>/status: the same answers as the direct path, or 202
+    when the event is persisted and applied by a later batch."""
+    if not d.get("status"):
+        return jsonify({"error":"status required"}),400
+    check = d.get('check_stock')
+    event = {'wo_id': wo_id, 'status': str(d["status"]), 'received_at': datetime.utcnow(),
+             'check_stock': None if check is None else bool(check)}
+    try:
+        done = wo_batcher.submit(event)
+        if done is not None and not done.wait(WO_BATCH_ACK_TIMEOUT) and wo_batcher.withdraw(event):
+            # still queued: persist it now rather than answer 202 for an event only held in memory
+            wo_batcher.spill([event])
+            done = None
+    except Exception as e:
+        print("Could not persist WO status event:", e)
+        return jsonify({"error":"status change not accepted, retry later"}),503,{"Retry-After":str(WO_BATCH_RETRY_AFTER)}
+    # not done yet means the flusher holds it; it applies or persists it either way
+    if done is None or not done.is_set() or done.outcome.get('queued'):
+        return jsonify({"queued":True,"wo_id":wo_id}),202
+    outcome = done.outcome
+    if outcome.get('error') == 'Not found':
+        return jsonify({"error":"Not found"}),404
+    if outcome.get('error'):
+        return jsonify({"error":outcome['error']}),503
+    if outcome.get('consumption_error'):
+        return jsonify({'error':'stock consumption failed','details':outcome['consumption_error']}),500
+    return jsonify(outcome['wo'])
+
+
+@app.route("/api/work-orders/status-batch/stats", methods=["GET"])
+def wo_status_batch_stats():
+    # batcher counters of this worker process
+    return jsonify(wo_batcher.stats())
+
+
+@app.before_request
+def _start_wo_batcher():
+    if wo_batcher.enabled:
+        wo_batcher.ensure_started()
@@ -0,0 +1,23 @@
+"""Production entry point.
+
+    flask --app app init-db            # once per deploy: tables and migrations
+    gunicorn -c gunicorn.conf.py wsgi:app
+    waitress-serve --threads=8 --port=5000 wsgi:app
+
+All configuration (database, pool sizing, timeouts) comes from the environment; see README.
+"""
+import os
+
+
+def create_app():
+    """Import and configure the Flask app for serving behind a WSGI server."""
+    from app import app as flask_app
+    flask_app.config["DEBUG"] = False
+    if os.environ.get("BEHIND_PROXY", "0") == "1":
+        # trust X-Forwarded-* from one reverse proxy (nginx, load balancer)
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app, x_for=1, x_proto=1, x_host=1)
+    return flask_app
+
+
+app = create_app()
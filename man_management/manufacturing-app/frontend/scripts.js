@@ -376,6 +376,21 @@ async function init(){ renderAuthControls(); await Promise.all([loadKPIs(), load
 if(window.location.pathname.endsWith('index.html') || window.location.pathname.endsWith('/') ){
   window.addEventListener('load', ()=>{ init(); });
 }
+// Subscribe to the backend change feed (server-sent events); onChange runs at most once per
+// burst of changes. EventSource reconnects by itself and resumes from the last event id; when
+// the server refuses the stream (503, too many open) it gives up, so retry after a while.
+function watchChanges(kinds, onChange){
+  if(typeof EventSource === 'undefined') return null;
+  let timer = null;
+  const fire = ()=>{ clearTimeout(timer); timer = setTimeout(()=>{ try{ onChange(); }catch(e){ console.error(e); } }, 250); };
+  const open = ()=>{
+    const es = new EventSource(API + '/changes/stream?kinds=' + encodeURIComponent(kinds.join(',')));
+    kinds.concat(['reset']).forEach(k => es.addEventListener(k, fire));
+    es.onerror = ()=>{ if(es.readyState === EventSource.CLOSED) setTimeout(()=>{ open(); fire(); }, 10000 + Math.random()*10000); };
+    return es;
+  };
+  return open();
+}
 function downloadReport(){window.location=API+"/reports/export";}
 document.addEventListener("DOMContentLoaded",()=>{
   // ensure auth-based UI visibility is enforced immediately
@@ -454,5 +469,9 @@ document.addEventListener("DOMContentLoaded",()=>{
   try{ updatePageAuthControls(); }catch(e){}
   if(document.getElementById("woTable")) loadWOs();
   if(document.getElementById("stockTable")) loadStock();
+  // live refresh: reload a table only when the change feed reports a change of its kind
+  if(document.getElementById("woTable")) watchChanges(['order','work_order'], loadWOs);
+  if(document.getElementById("stockTable")) watchChanges(['stock'], loadStock);
+  if(document.getElementById("moTable")) watchChanges(['order','work_order'], loadMOs);
   if(document.getElementById('componentsTable')) loadComponents();
 });